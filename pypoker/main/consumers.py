@@ -0,0 +1,17 @@
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from .lobby import LOBBY_GROUP
+
+
+class LobbyConsumer(AsyncWebsocketConsumer):
+    """Рассылает изменения числа мест в комнатах вместо опроса списка."""
+
+    async def connect(self):
+        await self.channel_layer.group_add(LOBBY_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(LOBBY_GROUP, self.channel_name)
+
+    async def room_update(self, event):
+        await self.send(text_data=event['text'])
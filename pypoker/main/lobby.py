@@ -0,0 +1,111 @@
+"""
+Лобби: кэшированный список комнат и рассылка изменений числа мест.
+
+Страницы списка кэшируются под номером версии; создание комнаты
+увеличивает версию, и старые страницы просто перестают читаться.
+Число занятых мест меняется на каждой посадке, поэтому версию оно не
+трогает: страницы доживают свой короткий LOBBY_CACHE_TIMEOUT, а свежие
+цифры подписчики группы LOBBY_GROUP получают без опроса сервера.
+"""
+import json
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Room
+
+LOBBY_GROUP = 'lobby'
+VERSION_KEY = 'lobby:version'
+
+
+def page_key(version, filters, page):
+    # Ключ из разобранных параметров: мусор в строке запроса не плодит копии страниц
+    return f'lobby:{version}:{urlencode(sorted(filters.items()))}:{page}'
+
+
+def get_version():
+    return cache.get_or_set(VERSION_KEY, 1, timeout=None)
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def _int_param(params, key):
+    try:
+        return int(params.get(key) or '')
+    except ValueError:
+        return None
+
+
+def clean_filters(params):
+    """Известные фильтры списка с допустимыми значениями, приведёнными к одному виду."""
+    filters = {}
+    for key in ('big_blind', 'max_players', 'seats_free'):
+        value = _int_param(params, key)
+        if value is not None:
+            filters[key] = str(value)
+    if params.get('is_active') in ('0', '1'):
+        filters['is_active'] = params['is_active']
+    return filters
+
+
+def page_number(value):
+    """Номер страницы не меньше 1; не число — первая страница, как у Paginator.get_page."""
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def filter_rooms(params):
+    filters = clean_filters(params)
+    # Столы турниров рассаживает директор турнира, в лобби их нет
+    rooms = Room.objects.filter(tournament__isnull=True).only(
+        'name', 'unique_id', 'big_blind', 'max_players', 'seats_taken', 'is_active'
+    ).order_by('-id')
+
+    if 'big_blind' in filters:
+        rooms = rooms.filter(big_blind=int(filters['big_blind']))
+    if 'max_players' in filters:
+        rooms = rooms.filter(max_players=int(filters['max_players']))
+    if 'seats_free' in filters:
+        rooms = rooms.filter(max_players__gte=F('seats_taken') + int(filters['seats_free']))
+    if 'is_active' in filters:
+        rooms = rooms.filter(is_active=filters['is_active'] == '1')
+    return rooms
+
+
+def room_update_event(room_id, seats_taken, max_players):
+    # Сообщение кодируется один раз, подписчики пересылают готовый текст
+    return {
+        'type': 'room_update',
+        'text': json.dumps({
+            'action': 'room_update',
+            'room': str(room_id),
+            'seats_taken': seats_taken,
+            'max_players': max_players,
+        }),
+    }
+
+
+async def seats_changed(table, channel_layer=None):
+    """Записывает число занятых мест стола и оповещает лобби, не сбрасывая кэш страниц."""
+    seats_taken = len(table.seats)
+    await Room.objects.filter(pk=table.pk).aupdate(seats_taken=seats_taken)
+    await (channel_layer or get_channel_layer()).group_send(
+        LOBBY_GROUP, room_update_event(table.room_id, seats_taken, table.max_players)
+    )
+
+
+def room_created(room):
+    invalidate()
+    async_to_sync(get_channel_layer().group_send)(
+        LOBBY_GROUP, room_update_event(room.unique_id, room.seats_taken, room.max_players)
+    )
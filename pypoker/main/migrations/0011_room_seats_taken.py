@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:19
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_seats(apps, schema_editor):
+    Room = apps.get_model("main", "Room")
+    for room in Room.objects.annotate(taken=Count("players")).filter(taken__gt=0):
+        Room.objects.filter(pk=room.pk).update(seats_taken=room.taken)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0010_room_flag_is_started_alter_room_pot"),
+        ("rooms", "0007_rename_active_bets_roomplayer_current_bet"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="room",
+            name="seats_taken",
+            field=models.PositiveIntegerField(default=0, verbose_name="Занято мест"),
+        ),
+        migrations.RunPython(count_seats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:05
+
+from django.db import migrations, models
+from django.db.models.functions import Round
+
+
+def round_pot(apps, schema_editor):
+    Room = apps.get_model("main", "Room")
+    Room.objects.update(pot=Round("pot"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0011_room_seats_taken"),
+    ]
+
+    operations = [
+        migrations.RunPython(round_pot, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="room",
+            name="pot",
+            field=models.BigIntegerField(default=0, verbose_name="Текущий банк"),
+        ),
+        migrations.AlterField(
+            model_name="room",
+            name="current_bet",
+            field=models.PositiveBigIntegerField(default=0, verbose_name="Текущая максимальная ставка"),
+        ),
+    ]
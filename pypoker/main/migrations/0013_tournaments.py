@@ -0,0 +1,49 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:20
+
+import django.db.models.deletion
+import main.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0012_integer_chips"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tournament",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(default="Турнир", max_length=255)),
+                ("table_size", models.PositiveIntegerField(default=9, verbose_name="Мест за столом")),
+                ("starting_stack", models.PositiveBigIntegerField(default=10000, verbose_name="Стартовый стек")),
+                ("level_duration", models.PositiveIntegerField(default=600, verbose_name="Длительность уровня, с")),
+                ("blind_schedule", models.JSONField(default=main.models.default_blind_schedule, verbose_name="Большие блайнды по уровням")),
+                ("status", models.CharField(choices=[("registering", "Registering"), ("running", "Running"), ("finished", "Finished")], default="registering", max_length=20)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="tournament",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name="tables", to="main.tournament"),
+        ),
+        migrations.CreateModel(
+            name="TournamentEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("place", models.PositiveIntegerField(blank=True, null=True)),
+                ("eliminated_at", models.DateTimeField(blank=True, null=True)),
+                ("tournament", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="entries", to="main.tournament")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="tournament_entries", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("tournament", "user"), name="unique_entry_in_tournament")],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0013_tournaments"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="room",
+            name="tournament",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tables",
+                to="main.tournament",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="room",
+            index=models.Index(
+                condition=models.Q(("is_active", True), ("tournament__isnull", True)),
+                fields=["-id"],
+                include=("name", "unique_id", "big_blind", "max_players", "seats_taken"),
+                name="room_lobby_active_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="room",
+            index=models.Index(
+                condition=models.Q(("tournament__isnull", True)),
+                fields=["-id"],
+                include=("name", "unique_id", "big_blind", "max_players", "seats_taken", "is_active"),
+                name="room_lobby_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="room",
+            index=models.Index(
+                condition=models.Q(("tournament__isnull", False)),
+                fields=["tournament", "is_active"],
+                name="room_tournament_tables_idx",
+            ),
+        ),
+    ]
@@ -19,12 +19,87 @@ class Room(models.Model):
     big_blind = models.PositiveIntegerField(default=50, verbose_name="Большой блайнд")  # Значение по умолчанию
     unique_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     is_active = models.BooleanField(default=False)
-    pot = models.FloatField(default=0.0, verbose_name="Текущий банк")  # Общий банк
+    pot = models.BigIntegerField(default=0, verbose_name="Текущий банк")  # Общий банк в фишках
     check_count = models.PositiveIntegerField(default=0, verbose_name="Количество чеков")  # Счётчик чеков
-    current_bet = models.PositiveIntegerField(default=0,
-                                        verbose_name="Текущая максимальная ставка")  # Максимальная ставка
+    current_bet = models.PositiveBigIntegerField(default=0,
+                                           verbose_name="Текущая максимальная ставка")  # Максимальная ставка
     current_player = models.PositiveIntegerField(null=True, blank=True, verbose_name="Текущий игрок")
     flag_is_started = models.BooleanField(default=False)
+    # Денормализованный счётчик занятых мест для лобби, обновляется консьюмером
+    seats_taken = models.PositiveIntegerField(default=0, verbose_name="Занято мест")
+    # Стол турнира: места рассаживает директор турнира, в лобби стол не виден
+    tournament = models.ForeignKey('Tournament', on_delete=models.CASCADE, null=True, blank=True,
+                                   related_name="tables", db_index=False)  # индекс частичный, см. Meta
+
+    class Meta:
+        indexes = [
+            # Лобби (main.lobby.filter_rooms) показывает комнаты без турнира,
+            # новые сверху: все или только активные. Частичные индексы не
+            # содержат турнирных столов, на PostgreSQL они покрывающие —
+            # INCLUDE полей строки списка
+            models.Index(
+                fields=["-id"], name="room_lobby_active_idx",
+                condition=models.Q(tournament__isnull=True, is_active=True),
+                include=["name", "unique_id", "big_blind", "max_players", "seats_taken"],
+            ),
+            models.Index(
+                fields=["-id"], name="room_lobby_idx",
+                condition=models.Q(tournament__isnull=True),
+                include=["name", "unique_id", "big_blind", "max_players", "seats_taken", "is_active"],
+            ),
+            # Столы турнира для директора. Индекс только по турнирным столам:
+            # полный индекс по tournament с IS NULL перехватывал бы запросы лобби
+            models.Index(
+                fields=["tournament", "is_active"], name="room_tournament_tables_idx",
+                condition=models.Q(tournament__isnull=False),
+            ),
+        ]
+
+    @property
+    def seats_free(self):
+        return self.max_players - self.seats_taken
     def __str__(self):
         return f"Room {self.name} - ID: {self.unique_id}"
 
+
+def default_blind_schedule():
+    # Большие блайнды по уровням; последний уровень длится до конца турнира
+    return [50, 100, 150, 200, 300, 400, 600, 800, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 10000]
+
+
+class Tournament(models.Model):
+    STATUS_REGISTERING = 'registering'
+    STATUS_RUNNING = 'running'
+    STATUS_FINISHED = 'finished'
+    STATUS_CHOICES = [
+        (STATUS_REGISTERING, 'Registering'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FINISHED, 'Finished'),
+    ]
+
+    name = models.CharField(max_length=255, default="Турнир")
+    table_size = models.PositiveIntegerField(default=9, verbose_name="Мест за столом")
+    starting_stack = models.PositiveBigIntegerField(default=10000, verbose_name="Стартовый стек")
+    level_duration = models.PositiveIntegerField(default=600, verbose_name="Длительность уровня, с")
+    blind_schedule = models.JSONField(default=default_blind_schedule, verbose_name="Большие блайнды по уровням")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_REGISTERING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Tournament {self.name} ({self.status})"
+
+
+class TournamentEntry(models.Model):
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, related_name="entries")
+    user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name="tournament_entries")
+    place = models.PositiveIntegerField(null=True, blank=True)  # заполняется при вылете и для победителя
+    eliminated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tournament', 'user'], name='unique_entry_in_tournament')
+        ]
+
+    def __str__(self):
+        return f"{self.user} in {self.tournament.name}"
@@ -1,3 +1,141 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rooms.engine import Table
+
+from . import lobby
+from .models import Room, Tournament
+
+# Кэш в тестах локальный, без Redis
+_cache_settings = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+def setUpModule():
+    _cache_settings.enable()
+
+
+def tearDownModule():
+    _cache_settings.disable()
+
+
+@override_settings(LOBBY_PAGE_SIZE=2)
+class LobbyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = Room.objects.create(name='small', max_players=2, big_blind=10, seats_taken=2)
+        cls.medium = Room.objects.create(name='medium', max_players=6, big_blind=50, seats_taken=1)
+        cls.large = Room.objects.create(name='large', max_players=10, big_blind=50, is_active=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pagination(self):
+        response = self.client.get(reverse('get_rooms'))
+        self.assertContains(response, 'large')
+        self.assertContains(response, 'medium')
+        self.assertNotContains(response, 'small')
+        self.assertContains(response, '1 / 2')
+
+    def test_filters(self):
+        response = self.client.get(reverse('get_rooms'), {'big_blind': 50, 'seats_free': 6})
+        self.assertContains(response, 'large')
+        self.assertNotContains(response, 'medium')
+        response = self.client.get(reverse('get_rooms'), {'is_active': 0})
+        self.assertNotContains(response, 'large')
+
+    def test_page_is_cached_until_invalidated(self):
+        self.client.get(reverse('get_rooms'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('get_rooms'))
+        Room.objects.filter(pk=self.large.pk).update(seats_taken=3)
+        lobby.invalidate()
+        response = self.client.get(reverse('get_rooms'))
+        self.assertContains(response, '3/10')
+
+    def test_cache_key_ignores_unknown_and_invalid_params(self):
+        self.client.get(reverse('get_rooms'), {'big_blind': '50', 'page': '1'})
+        # Тот же разобранный запрос — та же страница в кэше
+        with self.assertNumQueries(0):
+            for params in ({'big_blind': '050'}, {'big_blind': '50', 'utm': 'x', 'max_players': 'abc'},
+                           {'page': 'first', 'big_blind': '50', 'is_active': '2'}):
+                response = self.client.get(reverse('get_rooms'), params)
+                self.assertContains(response, 'large')
+        # Номер за последней страницей показывает последнюю, но своей копии в кэше не получает
+        response = self.client.get(reverse('get_rooms'), {'page': '99'})
+        self.assertContains(response, 'small')
+        self.assertIsNone(cache.get(lobby.page_key(lobby.get_version(), {}, 99)))
+
+    def test_seat_change_keeps_pages_and_pushes_the_count(self):
+        channel_layer = InMemoryChannelLayer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(lobby.LOBBY_GROUP, channel)
+        self.client.get(reverse('get_rooms'))
+        version = lobby.get_version()
+
+        table = Table(self.large.unique_id, pk=self.large.pk, max_players=10)
+        table.sit(1, 1, 'alice', 1000)
+        async_to_sync(lobby.seats_changed)(table, channel_layer)
+
+        self.assertEqual(lobby.get_version(), version)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('get_rooms'))
+        self.large.refresh_from_db()
+        self.assertEqual(self.large.seats_taken, 1)
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(json.loads(event['text'])['seats_taken'], 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output is checked in the SQLite format')
+class LobbyQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tournament = Tournament.objects.create(name='cup')
+        # Столов большого турнира больше, чем комнат в лобби
+        Room.objects.bulk_create(Room(name=f'room{index}', is_active=index % 10 == 0) for index in range(50))
+        Room.objects.bulk_create(Room(name=f'table{index}', tournament=tournament) for index in range(500))
+        # Без статистики SQLite не различает частичные индексы по размеру
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertPlanUses(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_lobby_pages_read_partial_indexes(self):
+        self.assertPlanUses(lobby.filter_rooms({}), 'room_lobby_idx')
+        self.assertPlanUses(lobby.filter_rooms({'big_blind': '50'}), 'room_lobby_idx')
+        self.assertPlanUses(lobby.filter_rooms({'is_active': '1'}), 'room_lobby_active_idx')
+        # Счётчик пагинатора идёт по тому же индексу
+        self.assertPlanUses(lobby.filter_rooms({'is_active': '1'}).order_by(), 'room_lobby_active_idx')
+
+    def test_tournament_tables_do_not_use_lobby_indexes(self):
+        tournament = Tournament.objects.get()
+        self.assertPlanUses(Room.objects.filter(tournament=tournament, is_active=True),
+                            'room_tournament_tables_idx')
+
+    def test_lobby_page_is_two_queries(self):
+        with self.assertNumQueries(2):  # COUNT(*) и страница
+            self.client.get(reverse('get_rooms'), {'is_active': 1})
+
+
+class AsgiTests(SimpleTestCase):
+    def test_application_imports_in_a_fresh_process(self):
+        # Сервер (daphne, uvicorn) импортирует модуль до настройки Django
+        env = {key: value for key, value in os.environ.items() if key != 'DJANGO_SETTINGS_MODULE'}
+        result = subprocess.run(
+            [sys.executable, '-c', 'import pypoker.asgi'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
@@ -1,8 +1,15 @@
+from urllib.parse import urlencode
+
 from django.shortcuts import render
 from django.contrib import messages
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
 from .models import Room
+from . import lobby
 from django.views.decorators.csrf import csrf_exempt
 
 def menu(request):
@@ -14,10 +21,6 @@ def some_view(request):
     return render(request, 'main/menu.html')
 
 
-def get_rooms(request):
-    return render(request, 'main/room_list.html')
-
-
 def index(request):
     return render(request, 'index.html')
 
@@ -32,6 +35,7 @@ def create_room(request):
         small_blind = big_blind // 2  # Малый блайнд — половина большого
         blinds = f"{small_blind}/{big_blind}"
         room = Room.objects.create(max_players=max_players, big_blind=big_blind)
+        lobby.room_created(room)
         return JsonResponse({'room_id': room.unique_id})
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
@@ -42,7 +46,21 @@ def room_detail(request, room_id):
     return render(request, 'main/testroom.html', {'room': room})
 
 
-# Представление для списка комнат
+# Представление для списка комнат: страница с фильтрами, готовый HTML в кэше
 def get_rooms(request):
-    rooms = Room.objects.all()
-    return render(request, 'main/room_list.html', {'rooms': rooms})
\ No newline at end of file
+    filters = lobby.clean_filters(request.GET)
+    number = lobby.page_number(request.GET.get('page'))
+    key = lobby.page_key(lobby.get_version(), filters, number)
+    html = cache.get(key)
+    if html is None:
+        paginator = Paginator(lobby.filter_rooms(filters), settings.LOBBY_PAGE_SIZE)
+        page = paginator.get_page(number)
+        html = render_to_string('main/room_list.html', {
+            'rooms': page.object_list,
+            'page': page,
+            'filters': urlencode(filters),
+        })
+        # Номер за последней страницей показывает последнюю, но своего ключа не получает
+        if page.number == number:
+            cache.set(key, html, settings.LOBBY_CACHE_TIMEOUT)
+    return HttpResponse(html)
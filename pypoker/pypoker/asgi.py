@@ -1,17 +1,26 @@
 import os
-from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import rooms.routing  # Подключаем маршруты из приложения
 
+from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pypoker.settings')
+# Django настраивается раньше импорта маршрутов: консьюмеры тянут модели
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from django.urls import re_path  # noqa: E402
+
+import main.routing  # noqa: E402
+import rooms.routing  # noqa: E402  Подключаем маршруты из приложения
+from users.middleware import AsyncAuthMiddlewareStack  # noqa: E402
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),  # HTTP запросы обрабатываются как обычно
-    "websocket": AuthMiddlewareStack(  # Добавляем поддержку WebSocket
-        URLRouter(
-            rooms.routing.websocket_urlpatterns
-        )
-    ),
+    "http": django_asgi_app,  # HTTP запросы обрабатываются как обычно
+    "websocket": URLRouter(rooms.routing.spectator_urlpatterns + [
+        # Остальные маршруты — с сессией и пользователем
+        re_path(r'', AsyncAuthMiddlewareStack(  # Добавляем поддержку WebSocket
+            URLRouter(
+                rooms.routing.websocket_urlpatterns + main.routing.websocket_urlpatterns
+            )
+        )),
+    ]),
 })
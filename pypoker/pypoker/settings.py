@@ -82,12 +82,58 @@ AUTH_USER_MODEL = 'users.CustomUser'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# В продакшене — PostgreSQL (задаётся переменной POSTGRES_DB), для
+# разработки — SQLite. Под ASGI запросы идут из потоков sync_to_async, и
+# постоянное соединение (CONN_MAX_AGE) держалось бы на каждый поток, поэтому
+# соединения берутся из пула psycopg (нужен пакет psycopg[pool]). За
+# PgBouncer пул Django отключается: POSTGRES_POOL=0
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
-}
+    if os.environ.get('POSTGRES_POOL', '1') != '0':
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('POSTGRES_POOL_MIN', 2)),
+                'max_size': int(os.environ.get('POSTGRES_POOL_MAX', 20)),
+                'timeout': 10,
+            },
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = 60
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Писатель всегда один, но в WAL читатели его не ждут; занятая
+                # база ждёт до timeout секунд вместо ошибки "database is locked",
+                # а IMMEDIATE берёт блокировку записи в начале транзакции.
+                # WAL включается явно (POKER_SQLITE_WAL=1): режим записывается
+                # в заголовок файла базы, который лежит в репозитории
+                'init_command': (
+                    'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;'
+                    if os.environ.get('POKER_SQLITE_WAL', '0') == '1' else ''
+                ),
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # Тестовая база по умолчанию в памяти; файл нужен bench_db
+            'TEST': {'NAME': os.environ.get('POKER_SQLITE_TEST_NAME')},
+        }
+    }
+    # INCLUDE покрывающих индексов лобби есть только в PostgreSQL, SQLite
+    # строит те же индексы без него
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
 
 
 # Password validation
@@ -137,11 +183,90 @@ STATICFILES_DIRS = [
 
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379')
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [('127.0.0.1', 6379)],  # Адрес и порт Redis
+            "hosts": [REDIS_URL],  # Адрес и порт Redis
         },
     },
 }
+
+# Кэш общий для всех процессов, на том же Redis (отдельная база): в нём
+# аренды столов и кольцо процессов (rooms.sharding), аренды журналов
+# (rooms.store) и версия лобби. С локальным кэшем каждый процесс видел бы
+# только себя и забирал все столы — Worker с таким кэшем не запустится
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{REDIS_URL}/1',
+    },
+}
+
+# Как часто (в секундах) состояние столов из памяти сбрасывается в базу;
+# конец раздачи сбрасывает столы сразу
+POKER_FLUSH_INTERVAL = 1.0
+
+# Расчёт эквити при олл-ине: процессы пула (None — по числу ядер),
+# максимум сэмплов и бюджет времени в секундах
+POKER_EQUITY_WORKERS = None
+POKER_EQUITY_ITERATIONS = 200000
+POKER_EQUITY_TIME_BUDGET = 0.25
+
+# Лобби: размер страницы списка комнат и время жизни страниц в кэше
+# (посадки кэш не сбрасывают, число мест обновляет веб-сокет лобби)
+LOBBY_PAGE_SIZE = 20
+LOBBY_CACHE_TIMEOUT = 60
+
+# История раздач пишется одним bulk_create, когда наберётся столько раздач
+# (и при периодическом сбросе столов)
+POKER_HISTORY_BATCH_SIZE = 50
+
+# Часы хода: секунды на ход и банк времени, который тратится сверх них.
+# По истечении игрок автоматически чекает или сбрасывает карты
+POKER_ACTION_TIMEOUT = 30.0
+POKER_TIME_BANK = 60.0
+
+# Столы распределяются между процессами (rooms.sharding): аренда стола и
+# запись процесса в кольце живут POKER_LEASE_TTL секунд и продлеваются
+# каждые POKER_HEARTBEAT_INTERVAL; пересланная команда ждёт ответа владельца
+# не дольше POKER_FORWARD_TIMEOUT. Нужен общий для процессов кэш
+POKER_LEASE_TTL = 15.0
+POKER_HEARTBEAT_INTERVAL = 5.0
+POKER_FORWARD_TIMEOUT = 10.0
+
+# Журнал изменений столов между сбросами в базу (см. rooms.journal).
+# Каждый процесс пишет в свой файл <путь>.<id процесса> и держит на него
+# аренду в кэше (POKER_LEASE_TTL); журналы процессов, чья аренда истекла,
+# применяются к базе перед загрузкой стола. None отключает журнал
+POKER_JOURNAL_PATH = os.environ.get('POKER_JOURNAL_PATH', BASE_DIR / 'var' / 'tables.journal')
+
+# Сколько последних событий комнаты хранится для переподключившихся
+# клиентов; при большем пропуске клиент получает полный снимок
+POKER_RESUME_BUFFER = 256
+
+# Зрители (ws/room/<id>/watch/) получают состояние стола не чаще стольких
+# раз в секунду; изменения между рассылками сливаются в одну
+POKER_SPECTATOR_RATE = 4
+
+# Лимиты веб-сокет соединения (rooms.backpressure): входящих кадров в
+# секунду и подряд; после POKER_WS_FLOOD кадров сверх лимита подряд
+# соединение закрывается. Исходящих кадров в очереди не больше
+# POKER_WS_OUTBOX, а кадр, который не ушёл за POKER_WS_SEND_TIMEOUT
+# секунд, означает медленного читателя — его соединение тоже закрывается
+POKER_WS_RATE = 10
+POKER_WS_BURST = 20
+POKER_WS_FLOOD = 50
+POKER_WS_OUTBOX = 64
+POKER_WS_SEND_TIMEOUT = 10.0
+
+# Директор турнира (rooms.tournaments): как часто он поднимает блайнды,
+# снимает вылетевших и пересаживает игроков между столами
+POKER_TOURNAMENT_TICK = 5.0
+
+# Боты (rooms.bots): политика по умолчанию, пауза перед ходом в секундах
+# и число сэмплов, по которым политика equity оценивает силу руки
+POKER_BOT_POLICY = 'equity'
+POKER_BOT_DELAY = 0.5
+POKER_BOT_ITERATIONS = 300
@@ -3,9 +3,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from rooms.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('main.urls'), name="home"),
     path('users/', include('users.urls', namespace="users")),
-    path('rooms/', include('rooms.urls'))
+    path('rooms/', include('rooms.urls')),
+    path('metrics', metrics, name='metrics'),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -0,0 +1,503 @@
+"""
+Актор комнаты: единственная задача asyncio, которая меняет стол.
+
+Консьюмеры не трогают Table напрямую — они кладут команды в очередь
+актора и ждут результат. Команды одной комнаты выполняются строго по
+очереди, поэтому проверки мест и ставок не требуют блокировок в базе.
+После каждой команды актор перезаводит часы хода (см. rooms.clock).
+
+Все события комнаты идут через publish: актор нумерует их и держит
+последние settings.POKER_RESUME_BUFFER в кольцевом буфере, чтобы
+переподключившийся клиент получил только пропущенное (do_resume).
+
+Зрители (rooms.consumers.SpectatorConsumer) сидят в отдельной группе и
+получают не события, а публичное состояние стола целиком — не чаще
+settings.POKER_SPECTATOR_RATE раз в секунду: изменения между рассылками
+сливаются в одну (do_spectate).
+"""
+import asyncio
+import logging
+import uuid
+from collections import deque
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError
+
+from main import lobby
+from . import bots, clock, equity, history, metrics, protocol, store, wallet
+from .engine import ActionError
+from .evaluator import card_str
+
+logger = logging.getLogger(__name__)
+
+actors = {}  # unique_id комнаты -> RoomActor
+
+
+class RoomMoved(Exception):
+    """Стол больше не у этого процесса (или актор остановлен): команду надо отдать владельцу."""
+
+
+def spectator_group(room_id):
+    return f"room_{room_id}_watch"
+
+
+async def get_actor(room_id):
+    actor = actors.get(room_id)
+    if actor is None:
+        table = await store.get_table(room_id)
+        # Пока грузился стол, актор мог создать другой консьюмер
+        actor = actors.get(room_id)
+        if actor is None:
+            actor = actors[room_id] = RoomActor(table)
+    return actor
+
+
+class RoomActor:
+    def __init__(self, table, channel_layer=None, action_clock=None):
+        self.room_id = table.room_id
+        self.table = table
+        self.group_name = f"room_{self.room_id}"
+        self.channel_layer = channel_layer or get_channel_layer()
+        self.clock = action_clock or clock.clock
+        self.turn = None  # чей ход отсчитывают часы: (раздача, место, номер события)
+        self.turn_started = None
+        # Номера событий действуют в пределах сессии актора: после переезда
+        # или перезапуска стола клиент получит снимок
+        self.session = uuid.uuid4().hex[:12]
+        self.sequence = 0
+        self.published_version = table.version  # версия последней разосланной update_game
+        self.backlog = deque(maxlen=getattr(settings, 'POKER_RESUME_BUFFER', 256))  # (после версии, событие)
+        self.trimmed = -1  # событие после этой версии уже вытеснено из буфера
+        self.spectators_due = False  # рассылка зрителям уже запланирована
+        self.spectated_at = float('-inf')  # время прошлой рассылки зрителям
+        self.queue = asyncio.Queue()
+        self.current = None  # future выполняемой команды
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, command, *args):
+        """Ставит команду в очередь и ждёт её результата (или исключения)."""
+        future = asyncio.get_running_loop().create_future()
+        # Запросы команды засчитываются и обработчику, который её прислал
+        self.queue.put_nowait((command, args, future, metrics.current_scopes()))
+        with metrics.action_seconds.time(command=command):
+            return await future
+
+    def enqueue(self, command, *args, on_error=None):
+        # Для планировщика: вызывается синхронно, результат никто не ждёт,
+        # поэтому ошибку команды пишем в лог и передаём on_error
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(partial(self._enqueued_done, command, on_error))
+        self.queue.put_nowait((command, args, future, ()))
+
+    def _enqueued_done(self, command, on_error, future):
+        if future.cancelled() or future.exception() is None or isinstance(future.exception(), RoomMoved):
+            return
+        logger.error('Room %s: %s failed', self.room_id, command, exc_info=future.exception())
+        if on_error is not None and not self.task.done():
+            on_error()
+
+    def stop(self):
+        self.task.cancel()
+        self.clock.cancel(self.room_id)
+        self.clock.cancel(f'{self.room_id}:spectators')
+        # Иначе ждущие ответа повисли бы навсегда; получив RoomMoved,
+        # Worker.submit найдёт нового владельца и повторит команду
+        futures = [self.current] if self.current is not None else []
+        while not self.queue.empty():
+            futures.append(self.queue.get_nowait()[2])
+        for future in futures:
+            # После закрытия цикла событий отвечать уже некому
+            if not future.done() and not future.get_loop().is_closed():
+                future.set_exception(RoomMoved(self.room_id))
+
+    async def _run(self):
+        while True:
+            command, args, future, scopes = await self.queue.get()
+            self.current = future
+            result = error = None
+            try:
+                with metrics.query_scope(metrics.command_queries, scopes, command=command):
+                    result = await getattr(self, f'do_{command}')(*args)
+            except Exception as e:
+                # Кадр _run убираем из traceback: тот, кто ждёт результат, может
+                # очистить кадры исключения (так делает assertRaises), и
+                # вместе с ними закрылась бы корутина актора
+                error = e.with_traceback(e.__traceback__.tb_next)
+            # Отвечаем только после того, как изменения фишек легли в журнал
+            try:
+                await store.journal_table(self.table)
+            except Exception:
+                logger.exception('Failed to journal table %s', self.room_id)
+            if not future.done():
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            self.current = None
+            self.update_clock()
+
+    # --- команды ---
+
+    async def do_sit(self, user_id, username, seat_number, stack, bot=None):
+        table = self.table
+        if table.tournament_id is not None:
+            raise ActionError('Tournament seats are assigned by the tournament director!')
+        if stack <= 0:
+            raise ActionError('The buy-in must be positive!')
+
+        # Место занимается в памяти сразу: следующая команда в очереди уже его увидит
+        role = table.free_role()
+        seat = table.sit(seat_number, user_id, username, stack, role=role, bot=bot)
+        try:
+            player = await sync_to_async(wallet.buy_in)(user_id, table.pk, seat_number, stack, role)
+        except IntegrityError:
+            table.leave(user_id)
+            raise ActionError('This seat is already taken!')
+        except ActionError:
+            table.leave(user_id)
+            raise
+        seat.player_id = player.pk
+        await lobby.seats_changed(table, self.channel_layer)
+
+        await self.publish_join(user_id, username, seat_number, stack, role)
+        await self.broadcast_game_update()
+        await self.start_hand_if_ready()
+
+    async def do_add_bot(self, user_id, username, seat_number, stack, policy=None):
+        """Сажает бота: пользователь с is_bot, ходы за него делает политика policy."""
+        if policy is None:
+            policy = getattr(settings, 'POKER_BOT_POLICY', 'equity')
+        try:
+            bots.get_policy(policy)
+        except ImportError:
+            raise ActionError('Unknown bot policy!')
+        await self.do_sit(user_id, username, seat_number, stack, bot=policy)
+
+    async def do_leave(self, user_id):
+        if self.table.tournament_id is not None:
+            raise ActionError('Tournament seats are assigned by the tournament director!')
+        seat = self.table.leave(user_id)
+        # Фишки уходят на баланс по стеку в памяти: в базе он может отставать
+        await sync_to_async(wallet.cash_out)(seat.player_id, user_id, seat.stack)
+        await lobby.seats_changed(self.table, self.channel_layer)
+        await self.publish_leave(user_id, seat)
+        await self.broadcast_game_update()
+
+    async def do_action(self, user_id, action, amount):
+        table = self.table
+        payouts = table.apply(user_id, action, amount)
+
+        odds = None
+        if payouts is not None and table.runout_from is not None:
+            odds = await self.all_in_equity()
+        await self.broadcast_game_update(odds)
+        if payouts is not None:
+            await self.finish_hand(payouts)
+            await self.start_hand_if_ready()
+
+    async def do_snapshot(self, user_id=None):
+        # Через очередь, чтобы снимок не разошёлся с версиями в рассылке
+        seat = self.table.seat_for(user_id)
+        return dict(self.table.snapshot(), seat=seat.number if seat else None,
+                    session=self.session, seq=self.sequence, tournament=self.table.tournament_id)
+
+    async def do_resume(self, user_id, session, version):
+        """Пропущенные события после версии version; если их уже нет — снимок."""
+        events = self.events_after(version) if session == self.session else None
+        if events is None:
+            return await self.do_snapshot(user_id)
+        seat = self.table.seat_for(user_id)
+        return {
+            'events': events,
+            'seat': seat.number if seat else None,
+            'session': self.session,
+            'seq': self.sequence,
+            'tournament': self.table.tournament_id,
+        }
+
+    async def do_timeout(self, turn):
+        # Пока команда стояла в очереди, игрок мог успеть походить
+        if turn != self.current_turn():
+            return
+        table = self.table
+        seat = table.seats[table.current_player]
+        seat.time_bank = 0.0  # банк истрачен целиком
+        action = 'check' if seat.current_bet >= table.current_bet else 'fold'
+        await self.do_action(seat.user_id, action, 0)
+
+    async def do_bot(self, turn):
+        if turn != self.current_turn():
+            return
+        table = self.table
+        seat = table.seats[table.current_player]
+        # Решение считается прямо в цикле событий: политика не ходит в базу
+        action, amount = bots.decide(table, seat)
+        await self.do_action(seat.user_id, action, amount)
+
+    # --- команды директора турнира (rooms.tournaments) ---
+
+    async def do_seats(self):
+        """Места стола: [user_id, место, стек, играет ли в текущей раздаче]."""
+        table = self.table
+        return {
+            'in_hand': table.hand_in_progress,
+            'players': [
+                [seat.user_id, seat.number, seat.stack, seat.active_in_round and table.hand_in_progress]
+                for seat in table.seats.values()
+            ],
+        }
+
+    async def do_set_blinds(self, big_blind):
+        # Новый блайнд действует со следующей раздачи
+        self.table.big_blind = big_blind
+
+    async def do_hold(self, on_hold):
+        self.table.on_hold = on_hold
+        if not on_hold:
+            await self.start_hand_if_ready()
+
+    async def do_unseat(self, moves):
+        """
+        Снимает игроков со стола без расчёта с балансом: moves — пары
+        [user_id, unique_id стола назначения или None для вылетевших].
+        Игроки текущей раздачи остаются. Возвращает [user_id, player_id, стек,
+        место, имя] — этого хватит, чтобы вернуть игрока на место.
+        """
+        removed = []
+        for user_id, moved_to in moves:
+            try:
+                seat = self.table.leave(user_id)
+            except ActionError:
+                continue
+            removed.append([user_id, seat.player_id, seat.stack, seat.number, seat.username])
+            await self.publish_leave(user_id, seat, moved_to)
+        await self.broadcast_game_update()
+        return removed
+
+    async def do_seat_players(self, players):
+        """Сажает пересаженных игроков: [player_id, user_id, имя, место, стек]."""
+        table = self.table
+        for player_id, user_id, username, seat_number, stack in players:
+            role = table.free_role()
+            table.sit(seat_number, user_id, username, stack, player_id=player_id, role=role)
+            await self.publish_join(user_id, username, seat_number, stack, role)
+        await self.broadcast_game_update()
+        await self.start_hand_if_ready()
+
+    # --- часы хода ---
+
+    def current_turn(self):
+        table = self.table
+        if table.current_player is None:
+            return None
+        # Номер события отличает ходы одного и того же места
+        return table.hand_number, table.current_player, len(table.events)
+
+    def update_clock(self):
+        """Перезаводит часы, если сменился ход; просроченное время списывает из банка."""
+        turn = self.current_turn()
+        if turn == self.turn:
+            return
+        timeout = getattr(settings, 'POKER_ACTION_TIMEOUT', 30.0)
+        now = asyncio.get_running_loop().time()
+        if self.turn is not None:
+            seat = self.table.seats.get(self.turn[1])
+            overtime = now - self.turn_started - timeout
+            if seat is not None and overtime > 0:
+                seat.time_bank = max(0.0, seat.time_bank - overtime)
+
+        self.turn = turn
+        self.turn_started = now
+        if turn is None:
+            self.clock.cancel(self.room_id)
+            return
+        seat = self.table.seats[turn[1]]
+        if seat.bot is not None:
+            # Бот ходит сам, после короткой паузы вместо часов хода
+            self.clock.schedule(self.room_id, getattr(settings, 'POKER_BOT_DELAY', 0.5),
+                                partial(self.expire, turn, 'bot'))
+        else:
+            self.clock.schedule(self.room_id, timeout + seat.time_bank, partial(self.expire, turn))
+
+    def expire(self, turn, command='timeout'):
+        # Вызывается планировщиком синхронно: только ставим команду в очередь
+        self.enqueue(command, turn, on_error=partial(self.expire_failed, turn, command))
+
+    def expire_failed(self, turn, command):
+        """Ход по часам не удался: без этого ход не сменится и часы больше не заведутся."""
+        if turn != self.current_turn():
+            return
+        if command == 'bot':
+            # Бот не смог сходить — за него чек или фолд, как по таймауту
+            self.expire(turn)
+        else:
+            # Следующая попытка — через полный таймаут
+            self.turn = None
+            self.update_clock()
+
+    # --- ход раздачи ---
+
+    async def start_hand_if_ready(self):
+        table = self.table
+        if not table.can_start():
+            return
+        payouts = table.start_hand()
+        message = {
+            'action': 'game_start',
+            'message': {
+                'hand': table.hand_number,
+                'current_player': table.current_player,
+            },
+        }
+        await self.publish({
+            'type': 'game_start',
+            'message': message,
+            # Консьюмер может жить в другом процессе, поэтому карты едут
+            # в событии готовыми кадрами мест; клиенту уходит кадр его места.
+            # У ботов соединений нет — их карты не рассылаем
+            'private': {
+                str(seat.number): dict(message, cards=[card_str(value) for value in seat.cards])
+                for seat in table.seats.values() if seat.active_in_round and seat.bot is None
+            },
+        })
+        await self.broadcast_game_update()
+        if payouts is not None:
+            await self.finish_hand(payouts)
+
+    async def finish_hand(self, payouts):
+        table = self.table
+        await self.publish({
+            'type': 'hand_end',
+            'message': {
+                'action': 'hand_end',
+                # Ключи JSON — строки, номера мест передаём так же
+                'payouts': {str(number): chips for number, chips in payouts.items()},
+                'shown': {str(number): shown for number, shown in table.shown.items()},
+                'board': [card_str(value) for value in table.board],
+            },
+        })
+        # Граница раздачи — стеки и банк уходят в базу со следующим сбросом,
+        # история пишется пачками
+        store.flush_soon()
+        if history.record(table):
+            try:
+                await history.flush()
+            except Exception:
+                # Раздачи остались в буфере и уйдут со следующим сбросом; стол не встаёт
+                logger.exception('Failed to write hand history of room %s', self.room_id)
+
+    async def all_in_equity(self):
+        table = self.table
+        # Шансы считаются по борду, открытому на момент олл-ина
+        numbers = sorted(table.shown)
+        board = table.board_cards[:table.runout_from]
+        result = await equity.equity_async([table.seats[number].cards for number in numbers], board)
+        return {
+            'board': [card_str(value) for value in board],
+            'players': {str(number): odds for number, odds in zip(numbers, result)},
+        }
+
+    # --- рассылка ---
+
+    async def publish(self, event):
+        """
+        Рассылает событие группе комнаты и запоминает его для переподключений.
+
+        Сообщение клиенту event['message'] и личные сообщения мест
+        event['private'] кодируются здесь один раз на рассылку: в событии
+        едут готовые кадры (protocol.encode_frames), консьюмеры их только пересылают.
+        """
+        message = event.pop('message')
+        version = message.get('version') if event['type'] == 'game_update' else None
+        with metrics.broadcast_seconds.time(event=event['type']):
+            event['frames'] = protocol.encode_frames(message)
+            if 'private' in event:
+                event['private'] = {
+                    seat: protocol.encode_frames(private) for seat, private in event['private'].items()
+                }
+            self.sequence += 1
+            event['session'] = self.session
+            event['seq'] = self.sequence
+            if len(self.backlog) == self.backlog.maxlen:
+                self.trimmed = self.backlog[0][0]
+            self.backlog.append((self.published_version, event))
+            if version is not None:
+                self.published_version = version
+            await self.channel_layer.group_send(self.group_name, event)
+
+    async def publish_join(self, user_id, username, seat_number, stack, role):
+        # Номер места и пользователь — для консьюмера, который запоминает своё место
+        await self.publish({
+            'type': 'player_join',
+            'user_id': user_id,
+            'seat': seat_number,
+            'message': {
+                'action': 'player_join',
+                'username': username,
+                'seat': seat_number,
+                'stack': stack,
+                'role': role,
+            },
+        })
+
+    async def publish_leave(self, user_id, seat, moved_to=None):
+        message = {
+            'action': 'player_leave',
+            'username': seat.username,
+            'seat': seat.number,
+        }
+        if moved_to:
+            # Турнир пересадил игрока: клиент переходит к новому столу
+            message['moved_to'] = moved_to
+        await self.publish({'type': 'player_leave', 'user_id': user_id, 'message': message})
+
+    def events_after(self, version):
+        """События, разосланные после update_game с этой версией, или None, если их уже нет."""
+        if not self.trimmed < version <= self.published_version:
+            return None
+        return [event for after, event in self.backlog if after >= version]
+
+    async def broadcast_game_update(self, odds=None):
+        # Рассылаются только изменения; клиент с пропуском версии просит resync
+        changes = self.table.diff()
+        if changes is None and odds is None:
+            return
+        game_state = {"action": "update_game"}
+        if changes is not None:
+            game_state.update(changes)
+        if odds is not None:
+            game_state["equity"] = odds
+
+        await self.publish({
+            'type': 'game_update',
+            'message': game_state
+        })
+        self.spectators_changed()
+
+    # --- зрители ---
+
+    def spectators_changed(self):
+        """Планирует рассылку зрителям не раньше, чем через 1/POKER_SPECTATOR_RATE после прошлой."""
+        if self.spectators_due:
+            return
+        self.spectators_due = True
+        interval = 1 / getattr(settings, 'POKER_SPECTATOR_RATE', 4)
+        delay = max(0.0, self.spectated_at + interval - asyncio.get_running_loop().time())
+        self.clock.schedule(f'{self.room_id}:spectators', delay, partial(self.enqueue, 'spectate'))
+
+    async def do_spectate(self):
+        # Публичное состояние целиком: зрителю не нужны ни версии, ни resync
+        self.spectators_due = False
+        self.spectated_at = asyncio.get_running_loop().time()
+        table = self.table
+        event = {'type': 'spectator_update'}
+        with metrics.broadcast_seconds.time(event=event['type']):
+            event['frames'] = protocol.encode_frames({
+                'action': 'update_state',
+                'version': table.version,
+                'state': table.state(),
+            })
+            await self.channel_layer.group_send(spectator_group(self.room_id), event)
@@ -8,3 +8,6 @@ class RoomsConfig(AppConfig):
 
     def ready(self):
         from django.contrib.auth import get_user_model
+
+        from . import metrics
+        metrics.install()
@@ -0,0 +1,127 @@
+"""
+Ограничения на веб-сокет соединение в обе стороны.
+
+Входящие кадры проходят через ведро токенов (TokenBucket): клиент может
+прислать burst кадров подряд и дальше не больше rate в секунду. Лишние
+кадры отбрасываются, а соединение, которое продолжает слать их подряд,
+консьюмер закрывает.
+
+Исходящие кадры рассылки кладутся в Outbox — ограниченную очередь с
+отдельной задачей-писателем, поэтому медленный читатель не задерживает
+обработку событий канала. При переполнении устаревшие изменения стола
+выбрасываются: у игрока их заменяет один полный снимок, у зрителя —
+самое свежее состояние. Если очередь забита тем, что выбросить нельзя,
+или очередной кадр застал отправку предыдущего, начатую дольше timeout
+назад, клиент признаётся медленным.
+"""
+import asyncio
+import time
+from collections import deque
+
+from . import metrics
+
+RESYNC = object()  # место в очереди, где вместо изменений уйдёт снимок
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.updated = clock()
+
+    def take(self):
+        """Забирает токен; False — кадр сверх лимита."""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Outbox:
+    """
+    Очередь не длиннее size: кадры (аргументы send) и признак, что это
+    изменение стола, которое можно выбросить. resync() отправляет снимок
+    вместо выброшенных изменений; без него изменения — полное состояние
+    (зрители), и новое просто вытесняет старые. on_slow() вызывается один раз.
+    """
+
+    def __init__(self, send, on_slow, size, timeout, resync=None):
+        self.send = send
+        self.on_slow = on_slow
+        self.size = size
+        self.timeout = timeout
+        self.resync = resync
+        self.resync_pending = False  # в очереди стоит снимок
+        self.frames = deque()
+        self.ready = asyncio.Event()
+        self.slow = False
+        self.closing = None
+        self.sending_since = None  # когда писатель начал отправку текущего кадра
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def put(self, frame, update=False):
+        if self.slow:
+            return
+        # Таймер на каждый кадр не заводим: зависшую отправку замечает следующий кадр
+        if self.sending_since is not None and \
+                asyncio.get_running_loop().time() - self.sending_since > self.timeout:
+            metrics.dropped_frames.inc(reason='slow')
+            self.give_up()
+            return
+        if update and self.resync_pending:
+            # Снимок берётся, когда до него дойдёт писатель, — он будет
+            # новее этого изменения
+            metrics.dropped_frames.inc(reason='coalesced')
+            return
+        if len(self.frames) >= self.size:
+            if not self.coalesce() or len(self.frames) >= self.size:
+                metrics.dropped_frames.inc(reason='slow')
+                self.give_up()
+                return
+            if update and self.resync_pending:
+                metrics.dropped_frames.inc(reason='coalesced')
+                return
+        self.frames.append((frame, update))
+        self.ready.set()
+
+    def coalesce(self):
+        """Выбрасывает из очереди изменения стола; False — выбрасывать нечего."""
+        kept = deque(entry for entry in self.frames if not entry[1])
+        dropped = len(self.frames) - len(kept)
+        if not dropped:
+            return False
+        metrics.dropped_frames.inc(dropped, reason='coalesced')
+        self.frames = kept
+        if self.resync is not None:
+            self.frames.append((RESYNC, False))
+            self.resync_pending = True
+        return True
+
+    def give_up(self):
+        self.slow = True
+        self.frames.clear()
+        self.task.cancel()
+        self.closing = asyncio.get_running_loop().create_task(self.on_slow())
+
+    def stop(self):
+        self.task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self.frames:
+                self.ready.clear()
+                await self.ready.wait()
+            frame, _ = self.frames.popleft()
+            self.sending_since = loop.time()
+            if frame is RESYNC:
+                self.resync_pending = False
+                await self.resync()
+            else:
+                await self.send(**frame)
+            self.sending_since = None
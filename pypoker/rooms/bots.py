@@ -0,0 +1,188 @@
+"""
+Боты за столами: места, которые играют сами, без веб-сокетов.
+
+Бот — обычный пользователь с флагом is_bot и строкой RoomPlayer, за столом
+его место помечено Seat.bot (имя политики). Когда ход переходит к боту,
+актор комнаты вместо часов хода ставит в очередь команду bot и применяет
+решение политики (см. RoomActor.do_bot).
+
+Политика видит только View — срез стола с места бота. Ни политики, ни ядро
+симуляции (play_hand, simulate) не обращаются к базе, поэтому сотни столов
+с ботами помещаются на одно ядро. Политика выбирается по имени из POLICIES
+или по пути импорта класса.
+"""
+import random
+import uuid
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.utils.module_loading import import_string
+
+from .equity import hand_strength, random_source
+
+
+class View:
+    """Что видно с места бота в момент его хода."""
+    __slots__ = (
+        'cards', 'board', 'street', 'pot', 'stack', 'to_call', 'current_bet',
+        'min_raise', 'max_raise', 'big_blind', 'opponents',
+    )
+
+    def __init__(self, table, seat):
+        self.cards = seat.cards
+        self.board = tuple(table.board)
+        self.street = table.betting_round
+        self.pot = table.pot
+        self.stack = seat.stack
+        self.to_call = min(table.current_bet - seat.current_bet, seat.stack)
+        self.current_bet = table.current_bet
+        # Границы «рейза до»: минимальный рейз и олл-ин
+        self.min_raise = table.current_bet + table.min_raise
+        self.max_raise = seat.current_bet + seat.stack
+        self.big_blind = table.big_blind
+        self.opponents = table.in_hand - 1
+
+
+class Policy:
+    """Политика бота: decide(view) возвращает (действие, сумма «рейз до»)."""
+
+    def decide(self, view):
+        raise NotImplementedError
+
+
+class PassivePolicy(Policy):
+    """Чек или колл — для нагрузочных прогонов, где важен только поток ходов."""
+
+    def decide(self, view):
+        return ('call', 0) if view.to_call else ('check', 0)
+
+
+class RandomPolicy(Policy):
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+
+    def decide(self, view):
+        roll = self.rng.random()
+        if roll < 0.15 and view.to_call:
+            return 'fold', 0
+        if roll > 0.8:
+            return 'raise', view.min_raise + self.rng.randrange(4) * view.big_blind
+        return ('call', 0) if view.to_call else ('check', 0)
+
+
+# Префлоп сила руки зависит только от рангов, одномастности и числа
+# соперников — 169 рук, считаются один раз и точнее, чем на ходу
+PREFLOP_ITERATIONS = 3000
+
+
+@lru_cache(maxsize=None)
+def preflop_strength(high, low, suited, opponents):
+    cards = (high * 4, low * 4 + (0 if suited else 1))
+    return hand_strength(cards, (), opponents, PREFLOP_ITERATIONS)
+
+
+def strength(cards, board, opponents, iterations, rng=None):
+    if not board:
+        high, low = sorted((card >> 2 for card in cards), reverse=True)
+        return preflop_strength(high, low, cards[0] & 3 == cards[1] & 3, opponents)
+    return hand_strength(cards, board, opponents, iterations, rng)
+
+
+class EquityPolicy(Policy):
+    """
+    Сила руки против случайных рук соперников (rooms.equity.hand_strength)
+    против шансов банка: сильная рука ставит банк, достаточная — коллирует.
+    """
+
+    def __init__(self, iterations=None, raise_above=0.7):
+        if iterations is None:
+            iterations = getattr(settings, 'POKER_BOT_ITERATIONS', 300)
+        self.iterations = iterations
+        self.raise_above = raise_above
+        self.rng = random_source(None)
+
+    def decide(self, view):
+        share = strength(view.cards, view.board, max(view.opponents, 1), self.iterations, self.rng)
+        if share >= self.raise_above and view.max_raise > view.current_bet:
+            return 'raise', view.current_bet + view.pot
+        if not view.to_call:
+            return 'check', 0
+        if share >= view.to_call / (view.pot + view.to_call):
+            return 'call', 0
+        return 'fold', 0
+
+
+POLICIES = {
+    'passive': PassivePolicy,
+    'random': RandomPolicy,
+    'equity': EquityPolicy,
+}
+
+_policies = {}  # имя -> экземпляр политики, один на процесс
+
+
+def get_policy(name):
+    """Политика по имени из POLICIES или по пути импорта; ImportError — такой нет."""
+    policy = _policies.get(name)
+    if policy is None:
+        policy = _policies[name] = (POLICIES.get(name) or import_string(name))()
+    return policy
+
+
+def decide(table, seat, policy=None):
+    """Ход бота на месте seat, приведённый к допустимому в текущем состоянии."""
+    view = View(table, seat)
+    action, amount = (policy or get_policy(seat.bot)).decide(view)
+    if action == 'raise':
+        if view.max_raise <= view.current_bet:
+            action = 'call'
+        else:
+            amount = min(max(amount, view.min_raise), view.max_raise)
+    if action == 'call' and not view.to_call:
+        action = 'check'
+    elif action == 'check' and view.to_call:
+        action = 'fold'
+    elif action not in ('fold', 'check', 'call', 'raise'):
+        action = 'fold' if view.to_call else 'check'
+    return action, amount
+
+
+# --- симуляция без базы ---
+
+def play_hand(table):
+    """Доигрывает раздачу на столе, где все места — боты. Возвращает выплаты."""
+    payouts = table.start_hand()
+    while payouts is None:
+        seat = table.seats[table.current_player]
+        action, amount = decide(table, seat)
+        payouts = table.apply(seat.user_id, action, amount)
+    return payouts
+
+
+def simulate(tables, hands):
+    """Играет до hands раздач на каждом столе по очереди. Возвращает (раздачи, решения)."""
+    played = decisions = 0
+    for _ in range(hands):
+        for table in tables:
+            if not table.can_start():
+                continue
+            play_hand(table)
+            played += 1
+            # В событиях раздачи кроме ходов только начало и конец
+            decisions += len(table.events) - 2
+    return played, decisions
+
+
+# --- пользователи ---
+
+def create_bot_users(count, balance):
+    """Создаёт count пользователей-ботов с балансом balance на бай-ин."""
+    User = apps.get_model('users', 'CustomUser')
+    names = [f'bot-{uuid.uuid4().hex[:10]}' for _ in range(count)]
+    return User.objects.bulk_create(
+        User(username=name, email=f'{name}@bots.invalid', password=make_password(None),
+             balance=balance, is_bot=True)
+        for name in names
+    )
@@ -0,0 +1,88 @@
+"""
+Часы хода: один планировщик на процесс для всех столов.
+
+Дедлайны лежат в одной куче, а цикл событий держит ровно один таймер
+(loop.call_at) на ближайший из них. Перезапуск часов стола не ищет старую
+запись в куче: у стола растёт номер поколения, и устаревшие записи
+пропускаются при извлечении. Чтобы такие записи не копились, куча
+перестраивается, когда их становится больше живых.
+"""
+import asyncio
+import heapq
+
+
+class ActionClock:
+    def __init__(self):
+        self.loop = None
+        self.heap = []  # (дедлайн, ключ, поколение)
+        self.timers = {}  # ключ -> (поколение, callback)
+        self.generation = 0
+        self._handle = None
+
+    def __len__(self):
+        return len(self.timers)
+
+    def schedule(self, key, delay, callback):
+        """Заводит (или перезаводит) часы key; callback() вызывается без аргументов."""
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            # Часы привязаны к циклу событий; новый цикл — новое состояние
+            self._reset(loop)
+
+        self.generation += 1
+        deadline = loop.time() + delay
+        self.timers[key] = (self.generation, callback)
+        heapq.heappush(self.heap, (deadline, key, self.generation))
+        if len(self.heap) > 2 * len(self.timers) + 64:
+            self._compact()
+        self._arm()
+        return self.generation
+
+    def cancel(self, key):
+        self.timers.pop(key, None)
+
+    def _reset(self, loop):
+        if self._handle is not None:
+            self._handle.cancel()
+        self.loop = loop
+        self.heap = []
+        self.timers = {}
+        self._handle = None
+
+    def _compact(self):
+        self.heap = [entry for entry in self.heap if self._is_live(entry)]
+        heapq.heapify(self.heap)
+
+    def _is_live(self, entry):
+        timer = self.timers.get(entry[1])
+        return timer is not None and timer[0] == entry[2]
+
+    def _arm(self):
+        # Пропускаем отменённые записи на вершине, чтобы не просыпаться зря
+        while self.heap and not self._is_live(self.heap[0]):
+            heapq.heappop(self.heap)
+        if not self.heap:
+            if self._handle is not None:
+                self._handle.cancel()
+                self._handle = None
+            return
+        deadline = self.heap[0][0]
+        if self._handle is not None:
+            if self._handle.when() <= deadline:
+                return
+            self._handle.cancel()
+        self._handle = self.loop.call_at(deadline, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        now = self.loop.time()
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            if not self._is_live(entry):
+                continue
+            _, callback = self.timers.pop(entry[1])
+            callback()
+        self._arm()
+
+
+clock = ActionClock()
@@ -1,219 +1,297 @@
-import json
-from channels.generic.websocket import AsyncWebsocketConsumer
-from django.apps import apps
-from asgiref.sync import sync_to_async
-from django.db import transaction
-
-
-def get_room_model():
-    return apps.get_model('main', 'Room')
+from urllib.parse import parse_qs
 
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.consumer import get_handler_name
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+
+from . import metrics, protocol, sharding, tournaments
+from .actor import spectator_group
+from .backpressure import Outbox, TokenBucket
+from .engine import ActionError
+
+CLOSE_FLOOD = 1008  # policy violation: клиент шлёт кадры сверх лимита
+CLOSE_SLOW = 1013  # try again later: клиент не успевает читать
+CLOSE_UNAVAILABLE = 4001  # стол переезжает или его процесс не отвечает: переподключиться позже
+
+
+class LimitsMixin:
+    """Лимиты соединения (rooms.backpressure): ведро токенов на входящие кадры и очередь исходящих."""
+    outbox = None
+    flood = 0  # кадров сверх лимита подряд
+
+    def start_limits(self, resync=None):
+        self.bucket = TokenBucket(getattr(settings, 'POKER_WS_RATE', 10), getattr(settings, 'POKER_WS_BURST', 20))
+        self.outbox = Outbox(self.send, self.close_slow, getattr(settings, 'POKER_WS_OUTBOX', 64),
+                             getattr(settings, 'POKER_WS_SEND_TIMEOUT', 10.0), resync)
+
+    def stop_limits(self):
+        if self.outbox is not None:
+            self.outbox.stop()
+
+    async def allow(self):
+        """False — кадр сверх лимита, его не обрабатываем."""
+        if self.bucket.take():
+            self.flood = 0
+            return True
+        metrics.rate_limited.inc()
+        self.flood += 1
+        if self.flood == 1:
+            # Одно предупреждение на серию, чтобы не отвечать на каждый лишний кадр
+            await self.send(**self.codec.frame({'action': 'error', 'message': 'Too many messages!'}))
+        elif self.flood == getattr(settings, 'POKER_WS_FLOOD', 50):
+            metrics.closed_sockets.inc(reason='flood')
+            self.outbox.stop()
+            await self.close(code=CLOSE_FLOOD)
+        return False
+
+    async def close_slow(self):
+        metrics.closed_sockets.inc(reason='slow')
+        await self.close(code=CLOSE_SLOW)
+
+    async def close_unavailable(self):
+        # Код закрытия доходит до клиента только после accept — без него был бы просто 403
+        await self.accept()
+        await self.close(code=CLOSE_UNAVAILABLE)
 
-def get_room_player_model():
-    return apps.get_model('rooms', 'RoomPlayer')
 
+class RoomConsumer(LimitsMixin, AsyncWebsocketConsumer):
+    session = None  # сессия актора стола и номер последнего доставленного события
+    seq = 0
+    counted = False  # соединение учтено в poker_connected_sockets
 
-class RoomConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['unique_id']
         self.room_group_name = f"room_{self.room_id}"
 
+        self.user = self.scope["user"]
+        # Стол может жить в другом процессе; команды идут через Worker
+        self.worker = await sharding.get_worker()
+
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
-
-        # Получаем текущих игроков для комнаты
-        RoomPlayer = get_room_player_model()
-        players = await sync_to_async(list)(
-            RoomPlayer.objects.filter(room__unique_id=self.room_id).values(
-                'user__username', 'seat_number', 'stack', 'role'
-            )
-        )
-        for player in players:
-            player['stack'] = float(player['stack'])
-
-        # Отправляем информацию о текущих игроках клиенту
-        await self.send(text_data=json.dumps({
-            'action': 'load_players',
-            'players': players
-        }))
+        # Комната и место игрока определяются один раз на соединение,
+        # дальше место обновляется по событиям player_join/player_leave.
+        # В группу вступаем раньше снимка, чтобы не пропустить ни одной версии
+        # Переподключившийся клиент передаёт ?session=...&version=... из
+        # прошлого соединения и получает только пропущенные события
+        resume = self.resume_point()
+        try:
+            if resume is not None:
+                snapshot = await self.worker.submit(self.room_id, 'resume', self.user.pk, *resume)
+            else:
+                snapshot = await self.worker.submit(self.room_id, 'snapshot', self.user.pk)
+        except (ObjectDoesNotExist, ValidationError):
+            await self.close()
+            return
+        except ActionError:
+            await self.close_unavailable()
+            return
+        self.seat_number = snapshot['seat']
+        if snapshot.get('tournament') is not None:
+            # Турнир ведёт директор; первый подключившийся к столу его запускает
+            await tournaments.ensure_director(snapshot['tournament'])
+
+        # Формат кадров по подпротоколу клиента; без него — JSON, как раньше
+        subprotocol, self.codec = protocol.negotiate(self.scope.get('subprotocols', []))
+        await self.accept(subprotocol=subprotocol)
+        metrics.connected_sockets.inc()
+        self.counted = True
+        metrics.watch_loop()
+        # Выброшенные из очереди изменения стола клиент получит снимком
+        self.start_limits(resync=self.send_snapshot)
+
+        if 'events' in snapshot:
+            self.session, self.seq = snapshot['session'], snapshot['seq']
+            await self.send_message({'action': 'resumed', 'missed': len(snapshot['events'])})
+            for event in snapshot['events']:
+                await super().dispatch(event)
+        else:
+            # Полный снимок стола; дальше клиент получает только изменения
+            await self.send_snapshot(snapshot)
+
+    def resume_point(self):
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        session, version = params.get('session', [''])[0], params.get('version', [''])[0]
+        if not session or not version.isdigit():
+            return None
+        return session, int(version)
+
+    async def dispatch(self, message):
+        seq = message.get('seq')
+        if seq is not None:
+            if message['session'] != self.session:
+                # Стол переехал или перезапустился: нумерация версий началась заново
+                await self.send_snapshot()
+                return
+            if seq <= self.seq:
+                # Уже доставлено снимком или повтором при переподключении
+                return
+            self.seq = seq
+        with metrics.query_scope(metrics.handler_queries, handler=get_handler_name(message)):
+            await super().dispatch(message)
 
     async def disconnect(self, close_code):
+        self.stop_limits()
+        if self.counted:
+            metrics.connected_sockets.dec()
+            self.counted = False
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        if not await self.allow():
+            return
+        data = protocol.decode(text_data, bytes_data)
         action = data.get('action')
+        user = self.user
+
+        if action == 'resync':
+            # Клиент заметил пропуск версии
+            try:
+                await self.send_snapshot()
+            except ActionError as e:
+                await self.send_error(str(e))
+            return
+
+        if not user.is_authenticated:
+            return
 
         if action == 'sit':
-            seat_number = data.get('seat')
-            stack = data.get('stack')
-            user = self.scope["user"]
-
-            if user.is_authenticated:
-                Room = get_room_model()
-                room = await Room.objects.aget(unique_id=self.room_id)
-
-                # Проверка, что игрок уже сидит за каким-либо местом в этой комнате
-                if await self.player_already_in_room(room, user):
-                    await self.send(text_data=json.dumps({
-                        'action': 'error',
-                        'message': 'You are already seated at this table!'
-                    }))
-                    return
-
-                if not await self.seat_taken(room, seat_number):
-                    # Присваиваем роль игроку
-                    role = await self.assign_role(room)
-
-                    # Создаем игрока
-                    await self.create_player(user, room, seat_number, stack, role)
-
-                    # Отправляем событие другим игрокам
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'player_join',
-                            'username': user.username,
-                            'seat': seat_number,
-                            'stack': stack,
-                            'role': role
-                        }
-                    )
+            await self.process_sit(user, data.get('seat'), data.get('stack'))
+        elif action == 'leave':
+            await self.process_leave(user)
+        elif action in ['fold', 'call', 'check', 'raise']:
+            await self.process_betting_action(action, user, data.get('amount', 0))
+
+    async def send_message(self, message):
+        await self.send(**self.codec.frame(message))
+
+    async def send_snapshot(self, snapshot=None):
+        if snapshot is None:
+            snapshot = await self.worker.submit(self.room_id, 'snapshot', self.user.pk)
+        self.session, self.seq = snapshot['session'], snapshot['seq']
+        self.seat_number = snapshot['seat']
+        await self.send_message({
+            'action': 'snapshot',
+            'session': snapshot['session'],
+            'version': snapshot['version'],
+            'state': snapshot['state'],
+        })
+
+    async def process_sit(self, user, seat_number, stack):
+        # Все изменения комнаты идут через её актор — по одному, без блокировок в базе
+        try:
+            # Фишки — целые копейки; дробные и нечисловые суммы не принимаем
+            seat_number, stack = int(seat_number), int(stack)
+        except (TypeError, ValueError):
+            await self.send_error('Seat and stack must be whole numbers!')
+            return
+        try:
+            await self.worker.submit(self.room_id, 'sit', user.pk, user.username, seat_number, stack)
+        except ActionError as e:
+            await self.send_error(str(e))
+
+    async def process_leave(self, user):
+        try:
+            await self.worker.submit(self.room_id, 'leave', user.pk)
+        except ActionError as e:
+            await self.send_error(str(e))
+
+    async def send_frames(self, event):
+        # Кадры закодированы актором один раз на рассылку; личный кадр места
+        # (карманные карты) получает только тот, кто на нём сидит
+        # Кадр уходит через очередь соединения; устаревшие update_game из
+        # неё можно выбросить
+        frames = event.get('private', {}).get(str(self.seat_number), event['frames'])
+        self.outbox.put(self.codec.forward(frames), update=event['type'] == 'game_update')
 
     async def player_join(self, event):
-        await self.send(text_data=json.dumps({
-            'action': 'player_join',
-            'username': event['username'],
-            'seat': event['seat'],
-            'stack': event['stack'],
-            'role': event['role'],
-        }))
+        if event['user_id'] == self.user.pk:
+            self.seat_number = event['seat']
+        await self.send_frames(event)
+
+    async def player_leave(self, event):
+        if event['user_id'] == self.user.pk:
+            self.seat_number = None
+        await self.send_frames(event)
 
     async def game_start(self, event):
-        message = event['message']
-        await self.send(text_data=json.dumps({
-            'action': 'game_start',
-            'message': message,
-        }))
+        await self.send_frames(event)
 
-    @staticmethod
-    async def seat_taken(room, seat_number):
-        RoomPlayer = get_room_player_model()
-        return await RoomPlayer.objects.filter(room=room, seat_number=seat_number).aexists()
-
-    @staticmethod
-    async def player_already_in_room(room, user):
-        RoomPlayer = get_room_player_model()
-        return await RoomPlayer.objects.filter(room=room, user=user).aexists()
-
-    async def create_player(self, user, room, seat_number, stack, role):
-        RoomPlayer = get_room_player_model()
-
-        def create_player_sync():
-            with transaction.atomic():
-                # Проверка наличия игрока в комнате перед созданием
-                if RoomPlayer.objects.filter(room=room, user=user).exists():
-                    return {'error': 'You are already seated at this table!'}
-
-                # Проверка занятости места
-                if RoomPlayer.objects.filter(room=room, seat_number=seat_number).exists():
-                    return {'error': 'This seat is already taken!'}
-
-                # Создание игрока
-                RoomPlayer.objects.create(
-                    user=user,
-                    room=room,
-                    seat_number=seat_number,
-                    stack=stack,
-                    role=role
-                )
-
-        result = await sync_to_async(create_player_sync)()
-
-        if result and 'error' in result:
-            await self.send(text_data=json.dumps({
-                'action': 'error',
-                'message': result['error']
-            }))
-
-    async def assign_role(self, room):
-        """
-        Логика для назначения роли игроку, например BB, SB и т.д.
-        """
-        RoomPlayer = get_room_player_model()
-        existing_roles = await sync_to_async(list)(
-            RoomPlayer.objects.filter(room=room).values_list('role', flat=True)
-        )
-        roles = ['BB', 'SB', 'Dealer']
-        for role in roles:
-            if role not in existing_roles:
-                return role
-        return None  # Если все роли заняты
-
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        action = data.get('action')
-        amount = data.get('amount', 0)
-        user = self.scope["user"]
+    async def hand_end(self, event):
+        await self.send_frames(event)
 
-        if action in ['fold', 'call', 'check', 'raise'] and user.is_authenticated:
-            await self.process_betting_action(action, user, amount)
+    async def send_error(self, message):
+        await self.send_message({
+            'action': 'error',
+            'message': message
+        })
 
     async def process_betting_action(self, action, user, amount):
-        # Ищем текущую комнату и игрока
-        Room = get_room_model()
-        RoomPlayer = get_room_player_model()
-        room = await Room.objects.aget(unique_id=self.room_id)
-        player = await RoomPlayer.objects.aget(room=room, user=user)
-
-        # Логика действий игрока
-        if action == 'fold':
-            player.fold()
-        elif action == 'call':
-            call_amount = room.current_bet - player.current_bet
-            room.pot += player.call(call_amount)
-        elif action == 'check':
-            player.check()
-        elif action == 'raise':
-            if amount >= room.current_bet * 2 and amount <= player._cash:
-                room.pot += player.raise_bet(amount)
-
-        # Сохраняем изменения и уведомляем игроков
-        await sync_to_async(player.save)()
-        await sync_to_async(room.save)()
-        await self.broadcast_game_update(room)
-
-    async def broadcast_game_update(self, room):
-        RoomPlayer = get_room_player_model()
-        players = await sync_to_async(list)(RoomPlayer.objects.filter(room=room))
-
-        game_state = {
-            "action": "update_game",
-            "pot": room.pot,
-            "current_bet": room.current_bet,
-            "players": [
-                {
-                    "username": player.user.username,
-                    "cash": player._cash,
-                    "current_bet": player.current_bet,
-                    "active_in_round": player.active_in_round
-                } for player in players
-            ]
-        }
-
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'game_update',
-                'message': game_state
-            }
-        )
+        try:
+            amount = int(amount or 0)
+        except (TypeError, ValueError):
+            await self.send_error('The amount must be a whole number of chips!')
+            return
+        try:
+            await self.worker.submit(self.room_id, 'action', user.pk, action, amount)
+        except ActionError as e:
+            await self.send_error(str(e))
 
     async def game_update(self, event):
-        await self.send(text_data=json.dumps(event['message']))
\ No newline at end of file
+        await self.send_frames(event)
+
+
+class SpectatorConsumer(LimitsMixin, AsyncWebsocketConsumer):
+    """
+    Зритель стола: только чтение. Получает снимок при подключении, дальше —
+    состояние стола из группы зрителей не чаще POKER_SPECTATOR_RATE раз в
+    секунду. Без сессии и пользователя (маршрут вне AuthMiddlewareStack),
+    поэтому после снимка соединение не обращается ни к базе, ни к актору.
+    """
+    counted = False
+
+    async def connect(self):
+        self.room_id = self.scope['url_route']['kwargs']['unique_id']
+        self.group_name = spectator_group(self.room_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        try:
+            worker = await sharding.get_worker()
+            snapshot = await worker.submit(self.room_id, 'snapshot')
+        except (ObjectDoesNotExist, ValidationError):
+            await self.close()
+            return
+        except ActionError:
+            await self.close_unavailable()
+            return
+
+        subprotocol, self.codec = protocol.negotiate(self.scope.get('subprotocols', []))
+        await self.accept(subprotocol=subprotocol)
+        metrics.spectator_sockets.inc()
+        self.counted = True
+        self.start_limits()
+        await self.send(**self.codec.frame({
+            'action': 'snapshot',
+            'version': snapshot['version'],
+            'state': snapshot['state'],
+        }))
+
+    async def disconnect(self, close_code):
+        self.stop_limits()
+        if self.counted:
+            metrics.spectator_sockets.dec()
+            self.counted = False
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Зритель ничего не присылает; входящие кадры только считаем в лимит
+        await self.allow()
+
+    async def spectator_update(self, event):
+        # Состояние полное: при переполнении очереди новое вытесняет старые
+        self.outbox.put(self.codec.forward(event['frames']), update=True)
@@ -0,0 +1,57 @@
+"""
+Колода и тасование.
+
+Карта — целое 0..51, как в rooms.evaluator. Колода — заранее выделенный
+bytearray, который тасуется на месте алгоритмом Фишера–Йетса; тасуются
+только первые count позиций — ровно столько карт, сколько уходит в
+раздачу (частичное тасование даёт равномерную выборку).
+
+Случайность берётся из os.urandom крупными блоками, а не по вызову на
+карту. Индекс в диапазоне 0..n-1 получается из одного байта отбрасыванием
+значений выше наибольшего кратного n (иначе взятие остатка давало бы
+перекос к младшим индексам).
+"""
+import os
+
+# Байты не меньше границы отбрасываются: 256 - 256 % n
+_LIMITS = (0,) + tuple(256 - 256 % n for n in range(1, 257))
+
+
+class Deck:
+    def __init__(self, size=52, entropy=os.urandom, buffer_size=4096):
+        if not 1 <= size <= 256:
+            raise ValueError('Deck size must be between 1 and 256')
+        self.cards = bytearray(range(size))
+        self.entropy = entropy  # entropy(n) -> n случайных байт
+        self.buffer_size = buffer_size
+        self.buffer = b''
+        self.position = 0
+
+    def shuffle(self, count=None):
+        """Перемешивает первые count карт (по умолчанию всю колоду) на месте."""
+        cards = self.cards
+        size = len(cards)
+        count = size - 1 if count is None else min(count, size - 1)
+        buffer, position = self.buffer, self.position
+        for index in range(count):
+            remaining = size - index
+            limit = _LIMITS[remaining]
+            while True:
+                if position >= len(buffer):
+                    buffer, position = self.entropy(self.buffer_size), 0
+                value = buffer[position]
+                position += 1
+                if value < limit:
+                    break
+            other = index + value % remaining
+            cards[index], cards[other] = cards[other], cards[index]
+        self.buffer, self.position = buffer, position
+        return cards
+
+    def deal(self, count):
+        """Первые count карт после тасования — одной копией, без объектов на карту."""
+        self.shuffle(count)
+        return self.cards[:count]
+
+
+deck = Deck()
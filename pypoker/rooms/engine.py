@@ -0,0 +1,493 @@
+"""
+Состояние стола в памяти: места, стеки, банк, текущая ставка, очередь хода
+и раунд торговли. Модуль не обращается к базе — строки Room и RoomPlayer
+пишутся снаружи (см. rooms.store) по границам раздачи или периодически.
+"""
+from .deck import deck
+from .evaluator import card_str, evaluate, hand_class
+from .pots import award_pots, build_pots
+
+ROLE_DEALER = 'Dealer'
+ROLE_SMALL_BLIND = 'Small Blind'
+ROLE_BIG_BLIND = 'Big Blind'
+ROLE_PLAYER = 'Player'
+
+STREETS = ('preflop', 'flop', 'turn', 'river')
+# Сколько карт борда открыто на каждой улице
+BOARD_SIZES = {'preflop': 0, 'flop': 3, 'turn': 4, 'river': 5}
+
+
+class ActionError(Exception):
+    """Действие игрока недопустимо в текущем состоянии стола."""
+
+
+class Seat:
+    __slots__ = (
+        'number', 'player_id', 'user_id', 'username', 'stack', 'current_bet',
+        'total_bet', 'role', 'active_in_round', 'all_in', 'last_action', 'cards', 'time_bank', 'bot',
+    )
+
+    def __init__(self, number, user_id, username, stack, player_id=None, role=ROLE_PLAYER, time_bank=0.0,
+                 bot=None):
+        self.number = number
+        self.player_id = player_id  # pk строки RoomPlayer
+        self.user_id = user_id
+        self.username = username
+        self.stack = stack
+        self.current_bet = 0  # ставка на текущей улице
+        self.total_bet = 0  # вклад в банк за всю раздачу
+        self.role = role
+        self.active_in_round = False
+        self.all_in = False
+        self.last_action = None
+        self.cards = ()  # карманные карты, клиентам раздаются отдельно
+        self.time_bank = time_bank  # запас секунд сверх обычного времени на ход
+        self.bot = bot  # имя политики бота (rooms.bots), None — человек
+
+    @property
+    def can_act(self):
+        return self.active_in_round and not self.all_in
+
+    def to_dict(self):
+        return {
+            'username': self.username,
+            'seat': self.number,
+            'cash': self.stack,
+            'current_bet': self.current_bet,
+            'active_in_round': self.active_in_round,
+            'role': self.role,
+        }
+
+
+class Table:
+    def __init__(self, room_id, pk=None, big_blind=50, max_players=10, time_bank=0.0, tournament_id=None):
+        self.room_id = room_id
+        self.pk = pk  # pk строки Room
+        self.tournament_id = tournament_id  # места турнирного стола рассаживает директор
+        self.on_hold = False  # директор турнира попросил не начинать новую раздачу
+        self.big_blind = big_blind
+        self.max_players = max_players
+        self.time_bank = time_bank  # банк времени, с которым садится игрок
+
+        self.seats = {}  # номер места -> Seat
+        self.by_user = {}  # user_id -> Seat
+
+        self.pot = 0
+        self.current_bet = 0
+        self.min_raise = big_blind
+        self.current_player = None  # номер места, чей сейчас ход
+        self.betting_round = None  # None — раздача не идёт
+        self.check_count = 0
+        self.button = None
+        self.hand_number = 0
+        self.board_cards = []  # борд сдаётся целиком, открывается по улицам
+        self.revealed = 0
+        self.shown = {}  # номер места -> открытые на вскрытии карты и комбинация
+        self.runout_from = None  # сколько карт борда было открыто, когда все ушли в олл-ин
+        # События текущей раздачи для истории (см. rooms.history)
+        self.events = []
+
+        # Счётчики вместо пересчёта мест на каждом действии
+        self.in_hand = 0  # не сбросили карты
+        self.can_act = 0  # не сбросили и не в олл-ине
+        self.to_act = 0  # сколько игроков ещё должны походить на этой улице
+
+        self.dirty = False
+        self.dirty_seats = set()  # места, которые нужно записать в базу
+
+        # Протокол рассылки: полный снимок при подключении, дальше только
+        # изменения с номером версии
+        self.version = 0
+        self.updated_seats = set()  # места, изменившиеся с прошлой рассылки
+        self._sent = {}  # поля стола, отправленные в прошлый раз
+
+    @property
+    def hand_in_progress(self):
+        return self.betting_round is not None
+
+    def seat_for(self, user_id):
+        return self.by_user.get(user_id)
+
+    def free_role(self):
+        existing_roles = {seat.role for seat in self.seats.values()}
+        for role in (ROLE_BIG_BLIND, ROLE_SMALL_BLIND, ROLE_DEALER):
+            if role not in existing_roles:
+                return role
+        return ROLE_PLAYER
+
+    def sit(self, number, user_id, username, stack, player_id=None, role=ROLE_PLAYER, bot=None):
+        if not 1 <= number <= self.max_players:
+            raise ActionError('There is no such seat at this table!')
+        if user_id in self.by_user:
+            raise ActionError('You are already seated at this table!')
+        if number in self.seats:
+            raise ActionError('This seat is already taken!')
+
+        seat = Seat(number, user_id, username, stack, player_id=player_id, role=role,
+                    time_bank=self.time_bank, bot=bot)
+        self.seats[number] = seat
+        self.by_user[user_id] = seat
+        self.updated_seats.add(number)
+        return seat
+
+    def leave(self, user_id):
+        seat = self.by_user.get(user_id)
+        if seat is None:
+            raise ActionError('You are not seated at this table!')
+        if seat.active_in_round and self.hand_in_progress:
+            raise ActionError('You cannot leave during a hand!')
+        del self.seats[seat.number]
+        del self.by_user[user_id]
+        self.dirty_seats.discard(seat.number)
+        self.updated_seats.add(seat.number)
+        return seat
+
+    # --- раздача ---
+
+    def can_start(self):
+        if self.hand_in_progress or self.on_hold:
+            return False
+        return sum(1 for seat in self.seats.values() if seat.stack > 0) >= 2
+
+    def start_hand(self, button=None, deal=None):
+        """
+        Начинает раздачу. button и deal ({номер места: карты}, борд) задаются
+        только при воспроизведении истории, в игре они выбираются сами.
+        """
+        if not self.can_start():
+            raise ActionError('Not enough players to start a hand!')
+
+        players = [number for number in sorted(self.seats) if self.seats[number].stack > 0]
+        for seat in self.seats.values():
+            seat.current_bet = 0
+            seat.total_bet = 0
+            seat.all_in = False
+            seat.last_action = None
+            seat.active_in_round = seat.number in players
+            seat.role = ROLE_PLAYER
+            self._touch(seat.number)
+
+        self.button = button if button is not None else self._next_of(players, self.button)
+        self.hand_number += 1
+        self._deal(players, deal)
+        self.events = [{
+            'type': 'start',
+            'hand': self.hand_number,
+            'button': self.button,
+            'big_blind': self.big_blind,
+            'seats': [[number, self.seats[number].user_id, self.seats[number].username,
+                       self.seats[number].stack] for number in players],
+            'cards': {str(number): list(self.seats[number].cards) for number in players},
+            'board': list(self.board_cards),
+        }]
+        self.betting_round = STREETS[0]
+        self.pot = 0
+        self.current_bet = 0
+        self.check_count = 0
+        self.in_hand = self.can_act = len(players)
+
+        # Хедз-ап: дилер ставит малый блайнд и ходит первым префлоп
+        if len(players) == 2:
+            small = self.button
+        else:
+            small = self._next_of(players, self.button)
+        big = self._next_of(players, small)
+        self.seats[self.button].role = ROLE_DEALER
+        self.seats[small].role = ROLE_SMALL_BLIND
+        self.seats[big].role = ROLE_BIG_BLIND
+
+        self._post(self.seats[small], self.big_blind // 2)
+        self._post(self.seats[big], self.big_blind)
+        self.current_bet = self.big_blind
+        self.min_raise = self.big_blind
+
+        self.to_act = self.can_act
+        self.current_player = self._next_to_act(big)
+        self.dirty = True
+        if self.current_player is None:
+            # Оба блайнда ушли в олл-ин — торговаться некому
+            return self._next_street()
+        return None
+
+    def apply(self, user_id, action, amount=0):
+        """
+        Применяет действие игрока. Возвращает выплаты {номер места: сумма},
+        если раздача на этом закончилась, иначе None.
+        """
+        seat = self.by_user.get(user_id)
+        if seat is None:
+            raise ActionError('You are not seated at this table!')
+        if not self.hand_in_progress or seat.number != self.current_player:
+            raise ActionError('It is not your turn!')
+
+        if action == 'fold':
+            self._fold(seat)
+        elif action == 'check':
+            self._check(seat)
+        elif action == 'call':
+            self._call(seat)
+        elif action == 'raise':
+            self._raise(seat, amount)
+        else:
+            raise ActionError('Unknown action!')
+
+        seat.last_action = action
+        self.dirty = True
+        self._touch(seat.number)
+        self.events.append({'type': 'action', 'seat': seat.number, 'action': action, 'amount': amount})
+        return self._after_action(seat)
+
+    def _fold(self, seat):
+        seat.active_in_round = False
+        self.in_hand -= 1
+        self.can_act -= 1
+
+    def _check(self, seat):
+        if seat.current_bet != self.current_bet:
+            raise ActionError('You cannot check, there is a bet to call!')
+        self.check_count += 1
+
+    def _call(self, seat):
+        to_call = self.current_bet - seat.current_bet
+        if to_call <= 0:
+            raise ActionError('There is nothing to call!')
+        self._post(seat, min(to_call, seat.stack))
+
+    def _raise(self, seat, amount):
+        # amount — итоговая ставка игрока на улице («рейз до»)
+        all_in_amount = seat.current_bet + seat.stack
+        if amount > all_in_amount:
+            raise ActionError('Not enough chips to raise!')
+        if amount <= self.current_bet:
+            raise ActionError('Raise must be above the current bet!')
+        if amount < self.current_bet + self.min_raise and amount != all_in_amount:
+            raise ActionError('Raise is too small!')
+
+        self.min_raise = max(self.min_raise, amount - self.current_bet)
+        self.current_bet = amount
+        self._post(seat, amount - seat.current_bet)
+        # После рейза все остальные снова должны ответить
+        self.to_act = self.can_act if seat.all_in else self.can_act - 1
+        self.to_act += 1  # компенсируем уменьшение в _after_action
+
+    def _post(self, seat, chips):
+        chips = min(chips, seat.stack)
+        seat.stack -= chips
+        seat.current_bet += chips
+        seat.total_bet += chips
+        self.pot += chips
+        if seat.stack == 0 and not seat.all_in:
+            seat.all_in = True
+            self.can_act -= 1
+        self._touch(seat.number)
+
+    def _after_action(self, seat):
+        if self.in_hand == 1:
+            return self._finish_hand()
+
+        self.to_act -= 1
+        if self.to_act <= 0:
+            return self._next_street()
+        self.current_player = self._next_to_act(seat.number)
+        return None
+
+    def _next_street(self):
+        for seat in self.seats.values():
+            if seat.current_bet:
+                seat.current_bet = 0
+                self._touch(seat.number)
+        self.current_bet = 0
+        self.check_count = 0
+        self.min_raise = self.big_blind
+
+        street = STREETS.index(self.betting_round) + 1
+        # Если торговаться больше некому, раздача доигрывается до вскрытия
+        if street == len(STREETS) or self.can_act <= 1:
+            if street < len(STREETS) and self.in_hand > 1:
+                self.runout_from = self.revealed
+            return self._finish_hand()
+
+        self.betting_round = STREETS[street]
+        self.revealed = BOARD_SIZES[self.betting_round]
+        self.to_act = self.can_act
+        self.current_player = self._next_to_act(self.button)
+        return None
+
+    def _finish_hand(self):
+        contenders = [seat for seat in self.seats.values() if seat.active_in_round]
+        payouts = self.showdown(contenders)
+        self.events.append({
+            'type': 'end',
+            'board': list(self.board),
+            'payouts': {str(number): chips for number, chips in payouts.items()},
+        })
+        for number, chips in payouts.items():
+            self.seats[number].stack += chips
+            self._touch(number)
+
+        for seat in self.seats.values():
+            seat.current_bet = 0
+            seat.total_bet = 0
+            seat.active_in_round = False
+            self._touch(seat.number)
+        self.pot = 0
+        self.current_bet = 0
+        self.check_count = 0
+        self.current_player = None
+        self.betting_round = None
+        self.to_act = self.in_hand = self.can_act = 0
+        self.dirty = True
+        return payouts
+
+    def _deal(self, players, deal=None):
+        if deal is not None:
+            hole_cards, board = deal
+            for number in players:
+                self.seats[number].cards = tuple(hole_cards[str(number)])
+            self.board_cards = list(board)
+        else:
+            cards = deck.deal(2 * len(players) + 5)
+            for index, number in enumerate(players):
+                self.seats[number].cards = tuple(cards[2 * index:2 * index + 2])
+            self.board_cards = list(cards[-5:])
+        self.revealed = 0
+        self.shown = {}
+        self.runout_from = None
+
+    @property
+    def board(self):
+        return self.board_cards[:self.revealed]
+
+    def showdown(self, contenders):
+        if len(contenders) == 1:
+            return {contenders[0].number: self.pot}
+
+        # Вскрытие: открываем весь борд и сравниваем лучшие пятёрки
+        self.revealed = len(self.board_cards)
+        values = {seat.number: evaluate(seat.cards + tuple(self.board_cards)) for seat in contenders}
+        self.shown = {
+            number: {
+                'cards': [card_str(value) for value in self.seats[number].cards],
+                'hand': hand_class(values[number]),
+            } for number in values
+        }
+
+        # Основной и побочные банки по вкладам за раздачу; олл-ин претендует
+        # только на те банки, в которые успел вложиться
+        contributions = {seat.number: seat.total_bet for seat in self.seats.values() if seat.total_bet}
+        folded = {number for number, seat in self.seats.items() if not seat.active_in_round}
+        pots = build_pots(contributions, folded)
+        # Фишки ушедших из-за стола в счёт вкладов не попали — отдаём их в основной банк
+        dead = self.pot - sum(contributions.values())
+        if dead and pots:
+            pots[0] = (pots[0][0] + dead, pots[0][1])
+
+        # Банк делится поровну, остаток отдаётся первому победителю после баттона
+        numbers = sorted(self.seats)
+        button = self.button if self.button is not None else 0
+        order = [number for number in numbers if number > button] + [number for number in numbers if number <= button]
+        return award_pots(pots, values, order)
+
+    # --- обход мест ---
+
+    @staticmethod
+    def _next_of(numbers, after):
+        """Следующий номер из отсортированного списка по кругу."""
+        if after is None:
+            return numbers[0]
+        for number in numbers:
+            if number > after:
+                return number
+        return numbers[0]
+
+    def _next_to_act(self, after):
+        # Мест не больше max_players, так что обход ограничен константой
+        for offset in range(1, self.max_players + 1):
+            number = (after + offset - 1) % self.max_players + 1
+            seat = self.seats.get(number)
+            if seat is not None and seat.can_act:
+                return number
+        return None
+
+    def _touch(self, number):
+        self.dirty_seats.add(number)
+        self.updated_seats.add(number)
+
+    # --- синхронизация с базой ---
+
+    def take_dirty(self):
+        """
+        Забирает накопленные изменения: поля Room (или None) и список
+        (pk RoomPlayer, поля) для изменённых мест.
+        """
+        room_fields, players = self.peek_dirty()
+        self.dirty = False
+        self.dirty_seats.clear()
+        return room_fields, players
+
+    def peek_dirty(self):
+        """То же, что take_dirty, но изменения остаются несброшенными."""
+        room_fields = None
+        if self.dirty:
+            room_fields = {
+                'pot': self.pot,
+                'current_bet': self.current_bet,
+                'check_count': self.check_count,
+                'current_player': self.current_player,
+                'flag_is_started': self.hand_in_progress,
+            }
+        players = []
+        for number in self.dirty_seats:
+            seat = self.seats.get(number)
+            if seat is None or seat.player_id is None:
+                continue
+            players.append((seat.player_id, {
+                'stack': seat.stack,
+                'current_bet': seat.current_bet,
+                'total_bet': seat.total_bet,
+                'is_active': seat.active_in_round,
+                'role': seat.role,
+                'last_action': seat.last_action,
+            }))
+        return room_fields, players
+
+    # --- состояние для клиентов ---
+
+    def _public_fields(self):
+        return {
+            'pot': self.pot,
+            'current_bet': self.current_bet,
+            'current_player': self.current_player,
+            'betting_round': self.betting_round,
+            'board': [card_str(value) for value in self.board],
+        }
+
+    def state(self):
+        state = self._public_fields()
+        state['players'] = [self.seats[number].to_dict() for number in sorted(self.seats)]
+        return state
+
+    def snapshot(self):
+        return {'version': self.version, 'state': self.state()}
+
+    def diff(self):
+        """
+        Изменения с прошлой рассылки под следующим номером версии: поля стола,
+        которые поменялись, и изменившиеся места (None — место освободилось).
+        Возвращает None, если менять нечего.
+        """
+        fields = self._public_fields()
+        changes = {key: value for key, value in fields.items() if self._sent.get(key) != value}
+        if not changes and not self.updated_seats:
+            return None
+
+        seats = {}
+        for number in sorted(self.updated_seats):
+            seat = self.seats.get(number)
+            seats[str(number)] = seat.to_dict() if seat is not None else None
+        self._sent = fields
+        self.updated_seats.clear()
+        self.version += 1
+        changes['version'] = self.version
+        changes['seats'] = seats
+        return changes
@@ -0,0 +1,226 @@
+"""
+Шансы игроков на победу (эквити) при олл-ине.
+
+Если до конца борда остаётся мало вариантов, они перебираются полностью,
+иначе борды сэмплируются NumPy-пачками. Из асинхронного кода считать нужно
+через equity_async: работа раскладывается по ProcessPoolExecutor, и цикл
+событий с веб-сокетами не блокируется.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from math import comb
+
+from django.conf import settings
+
+from .evaluator import evaluate, evaluate_batch, np
+
+# Перебор вместо сэмплирования, если вариантов борда не больше этого числа
+EXACT_LIMIT = 20000
+BATCH_SIZE = 10000
+
+_executor = None
+_workers = 0
+
+
+def remaining_deck(hands, board=(), dead=()):
+    used = set(board) | set(dead)
+    for hand in hands:
+        used.update(hand)
+    return [card for card in range(52) if card not in used]
+
+
+def _count(hands, board, boards):
+    """Считает победы и ничьи по массиву дополнений борда (N, k)."""
+    players = len(hands)
+    wins = [0] * players
+    ties = [0] * players
+
+    if np is None:
+        for extra in boards:
+            full = list(board) + list(extra)
+            values = [evaluate(list(hand) + full) for hand in hands]
+            best = min(values)
+            winners = [index for index, value in enumerate(values) if value == best]
+            for index in winners:
+                if len(winners) == 1:
+                    wins[index] += 1
+                else:
+                    ties[index] += 1
+        return wins, ties
+
+    boards = np.asarray(boards, dtype=np.int64).reshape(len(boards), -1)
+    fixed = np.array(list(board), dtype=np.int64)
+    values = np.empty((players, len(boards)), dtype=np.int16)
+    for index, hand in enumerate(hands):
+        known = np.broadcast_to(np.concatenate([np.array(hand, dtype=np.int64), fixed]),
+                                (len(boards), len(hand) + len(fixed)))
+        values[index] = evaluate_batch(np.hstack([known, boards]))
+
+    best = values.min(axis=0)
+    is_best = values == best
+    single = is_best.sum(axis=0) == 1
+    for index in range(players):
+        wins[index] = int((is_best[index] & single).sum())
+        ties[index] = int((is_best[index] & ~single).sum())
+    return wins, ties
+
+
+def _sample(deck, missing, size, rng):
+    if np is None:
+        return [rng.sample(deck, missing) for _ in range(size)]
+    # Случайная перестановка каждой строки, берём первые missing карт
+    order = rng.random((size, len(deck))).argpartition(missing - 1, axis=1)[:, :missing]
+    return np.asarray(deck)[order]
+
+
+def random_source(seed):
+    if np is None:
+        import random
+        return random.Random(seed)
+    return np.random.default_rng(seed)
+
+
+def enumerate_equity(hands, board=(), dead=()):
+    """Точный перебор всех дополнений борда. Возвращает (wins, ties, boards)."""
+    deck = remaining_deck(hands, board, dead)
+    missing = 5 - len(board)
+    if missing == 0:
+        wins, ties = _count(hands, board, [[]])
+        return wins, ties, 1
+    boards = list(combinations(deck, missing))
+    wins, ties = _count(hands, board, boards)
+    return wins, ties, len(boards)
+
+
+def simulate_equity(hands, board=(), dead=(), iterations=100000, time_budget=None, seed=None):
+    """Сэмплирование бордов пачками до исчерпания итераций или времени."""
+    deck = remaining_deck(hands, board, dead)
+    missing = 5 - len(board)
+    rng = random_source(seed)
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    wins = [0] * len(hands)
+    ties = [0] * len(hands)
+    done = 0
+    while done < iterations:
+        size = min(BATCH_SIZE, iterations - done)
+        batch_wins, batch_ties = _count(hands, board, _sample(deck, missing, size, rng))
+        for index in range(len(hands)):
+            wins[index] += batch_wins[index]
+            ties[index] += batch_ties[index]
+        done += size
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+    return wins, ties, done
+
+
+def hand_strength(hand, board=(), opponents=1, iterations=500, rng=None):
+    """
+    Доля банка, которую рука hand выигрывает против opponents случайных рук
+    (ничья считается за половину). Для решений ботов: дёшево и без пула.
+    """
+    deck = remaining_deck([hand], board)
+    missing = 5 - len(board)
+    if rng is None:
+        rng = random_source(None)
+    # Каждая строка — добор борда и руки соперников
+    deals = _sample(deck, missing + 2 * opponents, iterations, rng)
+
+    if np is None:
+        score = 0.0
+        for deal in deals:
+            full = list(board) + deal[:missing]
+            value = evaluate(list(hand) + full)
+            best = min(evaluate(deal[missing + 2 * index:missing + 2 * index + 2] + full)
+                       for index in range(opponents))
+            score += 1.0 if value < best else 0.5 if value == best else 0.0
+        return score / iterations
+
+    deals = np.asarray(deals, dtype=np.int64)
+    boards = np.hstack([np.broadcast_to(np.array(board, dtype=np.int64), (iterations, len(board))),
+                        deals[:, :missing]])
+    # Рука бота и руки соперников оцениваются одним вызовом: строки идут блоками по iterations
+    hands = np.concatenate([np.broadcast_to(np.array(hand, dtype=np.int64), (iterations, 2))]
+                           + [deals[:, missing + 2 * index:missing + 2 * index + 2] for index in range(opponents)])
+    values = evaluate_batch(np.hstack([hands, np.tile(boards, (opponents + 1, 1))])).reshape(opponents + 1, -1)
+    value, best = values[0], values[1:].min(axis=0)
+    return float((value < best).sum() + 0.5 * (value == best).sum()) / iterations
+
+
+def is_exact(hands, board=(), dead=()):
+    missing = 5 - len(board)
+    return comb(len(remaining_deck(hands, board, dead)), missing) <= EXACT_LIMIT
+
+
+def _result(wins, ties, boards):
+    return [
+        {'win': wins[index] / boards, 'tie': ties[index] / boards}
+        for index in range(len(wins))
+    ]
+
+
+def calculate_equity(hands, board=(), dead=(), iterations=None, time_budget=None):
+    """
+    Эквити в текущем процессе. hands — список пар карт (0..51),
+    возвращает [{'win': доля побед, 'tie': доля ничьих}, ...].
+    """
+    if is_exact(hands, board, dead):
+        return _result(*enumerate_equity(hands, board, dead))
+    if iterations is None:
+        iterations = settings.POKER_EQUITY_ITERATIONS
+    return _result(*simulate_equity(hands, board, dead, iterations, time_budget))
+
+
+def get_executor():
+    global _executor, _workers
+    if _executor is None:
+        _workers = getattr(settings, 'POKER_EQUITY_WORKERS', None) or os.cpu_count()
+        # Не fork: в процессе ASGI уже работают потоки, и блокировка, занятая
+        # одним из них в момент fork, в дочернем процессе не освободится никогда
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _executor = ProcessPoolExecutor(max_workers=_workers, mp_context=multiprocessing.get_context(method))
+    return _executor
+
+
+def executor_workers():
+    """Число процессов в пуле эквити."""
+    get_executor()
+    return _workers
+
+
+async def equity_async(hands, board=(), dead=(), iterations=None, time_budget=None):
+    """То же, что calculate_equity, но в пуле процессов."""
+    if iterations is None:
+        iterations = settings.POKER_EQUITY_ITERATIONS
+    if time_budget is None:
+        time_budget = settings.POKER_EQUITY_TIME_BUDGET
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    hands = [tuple(hand) for hand in hands]
+    board, dead = tuple(board), tuple(dead)
+
+    if is_exact(hands, board, dead):
+        wins, ties, boards = await loop.run_in_executor(executor, enumerate_equity, hands, board, dead)
+        return _result(wins, ties, boards)
+
+    workers = _workers
+    share = -(-iterations // workers)
+    seeds = np.random.SeedSequence().spawn(workers) if np is not None else [None] * workers
+    jobs = [
+        loop.run_in_executor(executor, simulate_equity, hands, board, dead, share, time_budget, seed)
+        for seed in seeds
+    ]
+    wins = [0] * len(hands)
+    ties = [0] * len(hands)
+    boards = 0
+    for job_wins, job_ties, job_boards in await asyncio.gather(*jobs):
+        for index in range(len(hands)):
+            wins[index] += job_wins[index]
+            ties[index] += job_ties[index]
+        boards += job_boards
+    return _result(wins, ties, boards)
@@ -0,0 +1,258 @@
+"""
+Оценка покерных комбинаций по таблицам.
+
+Карта — целое 0..51: ранг = card >> 2 (0 — двойка, 12 — туз), масть = card & 3.
+Значение комбинации — число 1..7462, чем меньше, тем сильнее (1 — роял-флеш).
+
+Флеши ищутся по 13-битной маске рангов одной масти (таблица на 8192
+элемента), остальные руки — по произведению простых чисел рангов: для
+5, 6 и 7 карт строится своя таблица «произведение -> лучшая пятёрка».
+evaluate_batch оценивает массив рук NumPy за один вызов.
+"""
+from functools import lru_cache
+from itertools import combinations
+
+try:
+    import numpy as np
+except ImportError:  # пакетная оценка недоступна, одиночная работает
+    np = None
+
+RANKS = '23456789TJQKA'
+SUITS = 'cdhs'
+PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+HAND_CLASSES = (
+    'Straight Flush', 'Four of a Kind', 'Full House', 'Flush', 'Straight',
+    'Three of a Kind', 'Two Pair', 'One Pair', 'High Card',
+)
+# Худшее значение в каждом классе, в порядке HAND_CLASSES
+CLASS_LIMITS = (10, 166, 322, 1599, 1609, 2467, 3325, 6185, 7462)
+
+CARD_BITS = tuple(1 << (card >> 2) for card in range(52))
+CARD_PRIMES = tuple(PRIMES[card >> 2] for card in range(52))
+
+_DESCENDING = tuple(range(12, -1, -1))
+# Маски стритов от старшего к младшему, последний — «колесо» A-2-3-4-5
+STRAIGHTS = tuple(0b11111 << high for high in range(8, -1, -1)) + (0b1000000001111,)
+
+
+def card(text):
+    """'As' -> 51"""
+    return RANKS.index(text[0].upper()) * 4 + SUITS.index(text[1].lower())
+
+
+def card_str(value):
+    return RANKS[value >> 2] + SUITS[value & 3]
+
+
+def parse_cards(text):
+    return [card(part) for part in text.split()]
+
+
+def hand_class(value):
+    for name, limit in zip(HAND_CLASSES, CLASS_LIMITS):
+        if value <= limit:
+            return name
+    raise ValueError(f'Invalid hand value: {value}')
+
+
+def _mask(ranks):
+    mask = 0
+    for rank in ranks:
+        mask |= 1 << rank
+    return mask
+
+
+def _product(ranks):
+    product = 1
+    for rank in ranks:
+        product *= PRIMES[rank]
+    return product
+
+
+def _build_five_card_tables():
+    flushes = {}  # маска -> значение (стрит-флеши и флеши)
+    unique = {}  # маска -> значение (стриты и старшая карта)
+    paired = {}  # произведение простых -> значение
+
+    high_cards = [_mask(ranks) for ranks in combinations(_DESCENDING, 5)]
+    high_cards = [mask for mask in high_cards if mask not in STRAIGHTS]
+
+    value = 1
+    for mask in STRAIGHTS:
+        flushes[mask] = value
+        value += 1
+    for quad in _DESCENDING:
+        for kicker in _DESCENDING:
+            if kicker != quad:
+                paired[PRIMES[quad] ** 4 * PRIMES[kicker]] = value
+                value += 1
+    for trips in _DESCENDING:
+        for pair in _DESCENDING:
+            if pair != trips:
+                paired[PRIMES[trips] ** 3 * PRIMES[pair] ** 2] = value
+                value += 1
+    for mask in high_cards:
+        flushes[mask] = value
+        value += 1
+    for mask in STRAIGHTS:
+        unique[mask] = value
+        value += 1
+    for trips in _DESCENDING:
+        kickers = [rank for rank in _DESCENDING if rank != trips]
+        for first, second in combinations(kickers, 2):
+            paired[PRIMES[trips] ** 3 * PRIMES[first] * PRIMES[second]] = value
+            value += 1
+    for high, low in combinations(_DESCENDING, 2):
+        for kicker in _DESCENDING:
+            if kicker not in (high, low):
+                paired[PRIMES[high] ** 2 * PRIMES[low] ** 2 * PRIMES[kicker]] = value
+                value += 1
+    for pair in _DESCENDING:
+        kickers = [rank for rank in _DESCENDING if rank != pair]
+        for ranks in combinations(kickers, 3):
+            paired[PRIMES[pair] ** 2 * _product(ranks)] = value
+            value += 1
+    for mask in high_cards:
+        unique[mask] = value
+        value += 1
+
+    assert value - 1 == CLASS_LIMITS[-1]
+    return flushes, unique, paired
+
+
+FLUSHES, UNIQUE, PAIRED = _build_five_card_tables()
+
+
+def _build_flush_table():
+    # Лучший флеш для любой маски рангов одной масти (5..7 бит)
+    table = [0] * 8192
+    for mask in range(8192):
+        if bin(mask).count('1') < 5:
+            continue
+        for straight in STRAIGHTS:
+            if mask & straight == straight:
+                table[mask] = FLUSHES[straight]
+                break
+        else:
+            top = [rank for rank in _DESCENDING if mask >> rank & 1][:5]
+            table[mask] = FLUSHES[_mask(top)]
+    return table
+
+
+FLUSH_TABLE = _build_flush_table()
+
+
+def _best_without_flush(counts):
+    """Лучшая пятёрка из набора рангов (counts[rank] — сколько карт ранга)."""
+    present = [rank for rank in _DESCENDING if counts[rank]]
+    quads = [rank for rank in present if counts[rank] == 4]
+    trips = [rank for rank in present if counts[rank] == 3]
+    pairs = [rank for rank in present if counts[rank] == 2]
+
+    if quads:
+        kicker = next(rank for rank in present if rank != quads[0])
+        return PAIRED[PRIMES[quads[0]] ** 4 * PRIMES[kicker]]
+    if trips and (len(trips) > 1 or pairs):
+        pair = max(trips[1:] + pairs)
+        return PAIRED[PRIMES[trips[0]] ** 3 * PRIMES[pair] ** 2]
+
+    mask = _mask(present)
+    for straight in STRAIGHTS:
+        if mask & straight == straight:
+            return UNIQUE[straight]
+
+    if trips:
+        kickers = [rank for rank in present if rank != trips[0]][:2]
+        return PAIRED[PRIMES[trips[0]] ** 3 * _product(kickers)]
+    if len(pairs) >= 2:
+        high, low = pairs[:2]
+        kicker = next(rank for rank in present if rank not in (high, low))
+        return PAIRED[PRIMES[high] ** 2 * PRIMES[low] ** 2 * PRIMES[kicker]]
+    if pairs:
+        kickers = [rank for rank in present if rank != pairs[0]][:3]
+        return PAIRED[PRIMES[pairs[0]] ** 2 * _product(kickers)]
+    return UNIQUE[_mask(present[:5])]
+
+
+def _multisets(size, rank=0, counts=None):
+    if counts is None:
+        counts = [0] * 13
+    if size == 0:
+        yield counts
+        return
+    if rank == 13:
+        return
+    for count in range(min(4, size), -1, -1):
+        counts[rank] = count
+        yield from _multisets(size - count, rank + 1, counts)
+    counts[rank] = 0
+
+
+@lru_cache(maxsize=None)
+def rank_table(size):
+    """
+    Таблица «произведение простых рангов -> значение» для рук из size карт
+    без учёта флешей. Строится при первом обращении.
+    """
+    table = {}
+    for counts in _multisets(size):
+        product = 1
+        for rank, count in enumerate(counts):
+            product *= PRIMES[rank] ** count
+        table[product] = _best_without_flush(counts)
+    return table
+
+
+def evaluate(cards):
+    """Значение лучшей пятёрки из 5, 6 или 7 карт."""
+    suits = [0, 0, 0, 0]
+    product = 1
+    for value in cards:
+        suits[value & 3] += 1
+        product *= CARD_PRIMES[value]
+
+    for suit, count in enumerate(suits):
+        if count >= 5:
+            mask = 0
+            for value in cards:
+                if value & 3 == suit:
+                    mask |= CARD_BITS[value]
+            # Каре и фулл-хаус при флеше из 7 карт невозможны
+            return FLUSH_TABLE[mask]
+    return rank_table(len(cards))[product]
+
+
+@lru_cache(maxsize=None)
+def _batch_tables(size):
+    table = rank_table(size)
+    keys = np.array(sorted(table), dtype=np.int64)
+    values = np.array([table[key] for key in keys.tolist()], dtype=np.int16)
+    return keys, values, np.array(FLUSH_TABLE, dtype=np.int16)
+
+
+def evaluate_batch(hands):
+    """
+    Пакетная оценка: hands — массив формы (N, 5..7) с картами 0..51.
+    Возвращает массив значений длины N.
+    """
+    if np is None:
+        raise ImportError('evaluate_batch requires numpy')
+
+    hands = np.asarray(hands, dtype=np.int64)
+    keys, values, flush_table = _batch_tables(hands.shape[1])
+    ranks = hands >> 2
+    suits = hands & 3
+
+    primes = np.array(PRIMES, dtype=np.int64)
+    result = values[np.searchsorted(keys, primes[ranks].prod(axis=1))]
+
+    bits = np.left_shift(1, ranks)
+    for suit in range(4):
+        in_suit = suits == suit
+        flush = in_suit.sum(axis=1) >= 5
+        if flush.any():
+            # Ранги внутри масти различны, поэтому сумма битов равна их OR
+            masks = np.where(in_suit[flush], bits[flush], 0).sum(axis=1)
+            result[flush] = flush_table[masks]
+    return result
@@ -0,0 +1,85 @@
+"""
+История раздач: запись пачками и воспроизведение.
+
+Движок копит события раздачи в Table.events. В конце раздачи они
+превращаются в одну строку HandHistory и ждут в буфере; буфер пишется
+одним bulk_create, когда наберётся POKER_HISTORY_BATCH_SIZE раздач, и при
+периодическом сбросе столов. Отдельных INSERT на действия нет.
+"""
+import json
+
+from django.apps import apps
+from django.conf import settings
+
+from .engine import Table
+
+pending = []  # несохранённые HandHistory
+
+
+def record(table):
+    """Переносит события законченной раздачи в буфер. Возвращает True, если пора писать."""
+    HandHistory = apps.get_model('rooms', 'HandHistory')
+    if not table.events or table.pk is None:
+        return False
+    pending.append(HandHistory(
+        room_id=table.pk,
+        hand_number=table.hand_number,
+        events='\n'.join(json.dumps(event, separators=(',', ':')) for event in table.events),
+    ))
+    table.events = []
+    return len(pending) >= getattr(settings, 'POKER_HISTORY_BATCH_SIZE', 50)
+
+
+async def flush():
+    HandHistory = apps.get_model('rooms', 'HandHistory')
+    if not pending:
+        return 0
+    # Пачку забираем сразу, чтобы параллельный сброс не записал её второй раз
+    batch = pending[:]
+    del pending[:len(batch)]
+    try:
+        await HandHistory.objects.abulk_create(batch)
+    except Exception:
+        # Не записалось — раздачи возвращаются в начало буфера до следующего сброса
+        pending[:0] = batch
+        raise
+    return len(batch)
+
+
+async def last_hand_number(room_pk):
+    HandHistory = apps.get_model('rooms', 'HandHistory')
+    last = await HandHistory.objects.filter(room_id=room_pk).order_by('-hand_number').values_list(
+        'hand_number', flat=True).afirst()
+    return last or 0
+
+
+def parse_events(text):
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+def replay(events, step=None):
+    """
+    Восстанавливает стол по событиям раздачи. step — сколько действий
+    применить после раздачи карт и блайндов (None — все).
+    """
+    start = events[0]
+    table = Table('replay', big_blind=start['big_blind'], max_players=max(
+        number for number, *_ in start['seats']))
+    for number, user_id, username, stack in start['seats']:
+        table.sit(number, user_id, username, stack)
+    table.hand_number = start['hand'] - 1
+    table.start_hand(button=start['button'], deal=(start['cards'], start['board']))
+
+    actions = [event for event in events if event['type'] == 'action']
+    if step is not None:
+        actions = actions[:step]
+    for event in actions:
+        table.apply(table.seats[event['seat']].user_id, event['action'], event['amount'])
+    return table
+
+
+async def replay_hand(room_id, hand_number, step=None):
+    """Стол комнаты (unique_id) в раздаче hand_number после step действий."""
+    HandHistory = apps.get_model('rooms', 'HandHistory')
+    hand = await HandHistory.objects.aget(room__unique_id=room_id, hand_number=hand_number)
+    return replay(parse_events(hand.events), step)
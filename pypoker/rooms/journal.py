@@ -0,0 +1,142 @@
+"""
+Журнал изменений столов на диске.
+
+Состояние столов пишется в базу пачками (см. rooms.store), а между
+сбросами каждое изменение фишек сначала попадает сюда: строка JSON с
+последними значениями изменённых полей, дописанная и сброшенная fsync до
+того, как актор ответит на команду. Записи разных столов, пришедшие
+одновременно, пишутся одним fsync.
+
+Перед сбросом в базу журнал откладывается в файл .old (rotate), после
+успешной записи отложенный файл удаляется (discard). Сам rotate() лишь
+ставит в очередь писателя отметку: записи до неё уйдут в отложенный файл,
+после — в новый; файлы переименовывает поток писателя, а не цикл событий.
+Если процесс упал, recover_records() возвращает записи обоих файлов по
+порядку — их повторное применение даёт последние значения полей.
+"""
+import asyncio
+import json
+import os
+import threading
+from pathlib import Path
+
+ROTATE = object()  # отметка в очереди писателя: здесь журнал откладывается
+
+
+class Journal:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.rotated = self.path.with_name(self.path.name + '.old')
+        self.file = None
+        self.lock = threading.Lock()
+        self.buffer = []  # строки (и отметки ROTATE), ждущие записи
+        self.waiters = []  # future тех, кто ждёт их записи
+        self.writer = None
+        self.records = 0  # записей с последнего успешного сброса в базу
+
+    async def append(self, record):
+        """Дописывает запись и ждёт, пока она окажется на диске."""
+        await self._enqueue(json.dumps(record, separators=(',', ':')))
+
+    def rotate(self):
+        """
+        Откладывает журнал до конца сброса: записи, добавленные до вызова,
+        останутся в отложенном файле, после — пойдут в чистый. Возвращает
+        future, который завершится, когда файл отложен.
+        """
+        return self._enqueue(ROTATE)
+
+    def _enqueue(self, entry):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.buffer.append(entry)
+        self.waiters.append(future)
+        if self.writer is None or self.writer.done():
+            self.writer = loop.create_task(self._write())
+        return future
+
+    async def _write(self):
+        while self.buffer:
+            entries, waiters = self.buffer, self.waiters
+            self.buffer, self.waiters = [], []
+            try:
+                await asyncio.to_thread(self._write_entries, entries)
+            except Exception as e:
+                for future in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+
+    def _write_entries(self, entries):
+        lines = []
+        for entry in entries:
+            if entry is ROTATE:
+                if lines:
+                    self._write_lines(lines)
+                    lines = []
+                self._rotate()
+            else:
+                lines.append(entry)
+        if lines:
+            self._write_lines(lines)
+
+    def _write_lines(self, lines):
+        with self.lock:
+            if self.file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write('\n'.join(lines) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.records += len(lines)
+
+    def _rotate(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            if not self.path.exists():
+                return
+            if self.rotated.exists():
+                # Прошлый сброс не удался — его записи ещё нужны
+                with open(self.rotated, 'a', encoding='utf-8') as rotated:
+                    rotated.write(self.path.read_text(encoding='utf-8'))
+                    rotated.flush()
+                    os.fsync(rotated.fileno())
+                self.path.unlink()
+            else:
+                os.replace(self.path, self.rotated)
+            self.records = 0
+
+    def discard(self):
+        """Сброс в базу удался: отложенный журнал больше не нужен."""
+        with self.lock:
+            if self.rotated.exists():
+                self.rotated.unlink()
+
+    def recover_records(self):
+        records = []
+        with self.lock:
+            for path in (self.rotated, self.path):
+                if not path.exists():
+                    continue
+                for line in path.read_text(encoding='utf-8').splitlines():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # Недописанная последняя строка: на неё ещё не ответили
+                        break
+        return records
+
+    def clear(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            for path in (self.rotated, self.path):
+                if path.exists():
+                    path.unlink()
+            self.records = 0
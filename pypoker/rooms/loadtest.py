@@ -0,0 +1,218 @@
+"""
+Нагрузочный прогон столов через ASGI-приложение без реальной сети.
+
+N синтетических игроков логинятся, открывают ws/room/<unique_id>/,
+садятся за стол и играют заданное число раздач по простому сценарию.
+Считаются задержка «действие -> рассылка» (p50/p99), сообщения в секунду
+и запросы к базе на одно действие.
+"""
+import json
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+from main.models import Room
+
+
+class QueryCounter:
+    """Обёртка execute_wrapper, считает запросы на всех соединениях процесса."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def _install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        for connection in connections.all(initialized_only=True):
+            self._install(connection)
+        connection_created.connect(self._install)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self._install)
+        for connection in connections.all(initialized_only=True):
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+class WebsocketClient:
+    """Минимальный веб-сокет клиент поверх ApplicationCommunicator."""
+
+    def __init__(self, application, path, cookie):
+        path, _, query = path.partition('?')
+        self.communicator = ApplicationCommunicator(application, {
+            'type': 'websocket',
+            'path': path,
+            'query_string': query.encode(),
+            'headers': [(b'cookie', cookie.encode())],
+            'subprotocols': [],
+        })
+        self.received = 0
+
+    async def connect(self):
+        await self.communicator.send_input({'type': 'websocket.connect'})
+        response = await self.communicator.receive_output(timeout=5)
+        if response['type'] != 'websocket.accept':
+            raise RuntimeError(f'Connection rejected: {response}')
+
+    async def send(self, message):
+        await self.communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def receive(self, timeout=5):
+        frame = await self.communicator.receive_output(timeout=timeout)
+        self.received += 1
+        return json.loads(frame['text'])
+
+    async def close(self):
+        await self.communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.communicator.wait(timeout=5)
+
+
+def _prepare(players, big_blind, stack):
+    User = get_user_model()
+    room = Room.objects.create(name='loadtest', max_players=players, big_blind=big_blind)
+    cookies = []
+    for index in range(players):
+        user = User.objects.create_user(
+            username=f'loadtest{room.pk}_{index}',
+            email=f'loadtest{room.pk}_{index}@example.com',
+            balance=stack,
+        )
+        client = Client()
+        client.force_login(user)
+        cookies.append(f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}")
+    return room, cookies
+
+
+def _choose_action(state, seat, step):
+    """Сценарий: чаще колл/чек, изредка рейз, чтобы улицы доходили до вскрытия."""
+    players = {player['seat']: player for player in state['players']}
+    if state['current_bet'] > players[seat]['current_bet']:
+        return {'action': 'call'}
+    if step % 7 == 3:
+        return {'action': 'raise', 'amount': state['current_bet'] + 2 * state['big_blind']}
+    return {'action': 'check'}
+
+
+def _apply(state, message):
+    """Накладывает diff update_game на общее состояние стола, если это следующая версия."""
+    if message.get('action') != 'update_game' or message.get('version') != state['version'] + 1:
+        return
+    for key in ('pot', 'current_bet', 'current_player', 'betting_round', 'board'):
+        if key in message:
+            state[key] = message[key]
+    players = {player['seat']: player for player in state['players']}
+    for number, seat in message.get('seats', {}).items():
+        if seat is None:
+            players.pop(int(number), None)
+        else:
+            players[int(number)] = seat
+    state['players'] = [players[number] for number in sorted(players)]
+    state['version'] = message['version']
+    if 'betting_round' in message and message['betting_round'] is None:
+        state['hands'] += 1
+
+
+async def _read(client, state, until):
+    """
+    Читает кадры клиента, накладывая изменения на общее состояние.
+    Каждый клиент получает все версии по порядку, поэтому состояние можно
+    продвигать из любого сокета. Возвращает кадр, на котором until истинно.
+    """
+    while True:
+        message = await client.receive()
+        _apply(state, message)
+        if until(message):
+            return message
+
+
+async def _drain(client):
+    # receive_output с таймаутом отменяет приложение, поэтому проверяем очередь так
+    while not await client.communicator.receive_nothing(timeout=0.05):
+        await client.receive()
+
+
+async def run(application, players=6, hands=20, big_blind=50, stack=100000):
+    # Счётчик ставится до первых запросов: соединения потоков sync_to_async
+    # создаются позже и получают обёртку через сигнал connection_created
+    with QueryCounter() as queries:
+        return await _run(application, queries, players, hands, big_blind, stack)
+
+
+async def _run(application, queries, players, hands, big_blind, stack):
+    room, cookies = await sync_to_async(_prepare)(players, big_blind, stack)
+    path = f'/ws/room/{room.unique_id}/'
+
+    clients = []
+    for cookie in cookies:
+        client = WebsocketClient(application, path, cookie)
+        await client.connect()
+        snapshot = await client.receive()
+        clients.append(client)
+    state = dict(snapshot['state'], version=snapshot['version'], hands=0, big_blind=big_blind)
+
+    # Садимся по одному: каждое место должно появиться в состоянии до следующего.
+    # Посадка — транзакция бай-ина в базе, её задержку считаем отдельно
+    sits = []
+    for number, client in enumerate(clients, start=1):
+        sent = time.perf_counter()
+        await client.send({'action': 'sit', 'seat': number, 'stack': stack})
+        await _read(client, state, lambda m: any(player['seat'] == number for player in state['players']))
+        sits.append(time.perf_counter() - sent)
+    last = clients[-1]
+
+    latencies = []
+    received_before = sum(client.received for client in clients)
+    queries_before = queries.count
+    started = time.perf_counter()
+    step = 0
+    while state['hands'] < hands:
+        if state['current_player'] is None:
+            await _read(last, state, lambda m: state['current_player'] is not None)
+            continue
+        client = clients[state['current_player'] - 1]
+        action = _choose_action(state, state['current_player'], step)
+        step += 1
+
+        version = state['version']
+        sent = time.perf_counter()
+        await client.send(action)
+        message = await _read(client, state, lambda m: m.get('action') == 'error' or state['version'] > version)
+        latencies.append(time.perf_counter() - sent)
+        if message.get('action') == 'error':
+            raise RuntimeError(f'Scripted action rejected: {action} -> {message}')
+        last = client
+    elapsed = time.perf_counter() - started
+    query_count = queries.count - queries_before
+
+    for client in clients:
+        await _drain(client)
+    received = sum(client.received for client in clients) - received_before
+    for client in clients:
+        await client.close()
+
+    latencies.sort()
+    return {
+        'players': players,
+        'hands': state['hands'],
+        'actions': len(latencies),
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'sit_p50_ms': statistics.median(sits) * 1000,
+        'messages_per_sec': received / elapsed,
+        'queries_per_action': query_count / len(latencies),
+        'elapsed': elapsed,
+    }
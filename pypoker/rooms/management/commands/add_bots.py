@@ -0,0 +1,60 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rooms import bots, sharding, wallet
+
+
+class Command(BaseCommand):
+    help = ('Сажает ботов на свободные места комнаты. Если стол сейчас открыт в процессе ASGI, '
+            'боты садятся через его актор, иначе места пишутся в базу и боты начнут играть, '
+            'когда стол загрузится')
+
+    def add_arguments(self, parser):
+        parser.add_argument('room', help='unique_id комнаты')
+        parser.add_argument('--count', type=int, default=1)
+        parser.add_argument('--stack', type=int, default=10000, help='бай-ин в копейках')
+        parser.add_argument('--policy', default=None, help='имя политики или путь импорта класса')
+
+    def handle(self, *args, **options):
+        Room = apps.get_model('main', 'Room')
+        RoomPlayer = apps.get_model('rooms', 'RoomPlayer')
+        room = Room.objects.filter(unique_id=options['room']).first()
+        if room is None:
+            raise CommandError(f"Room {options['room']} does not exist")
+        if room.tournament_id is not None:
+            raise CommandError('Tournament seats are assigned by the tournament director')
+        policy = options['policy'] or getattr(settings, 'POKER_BOT_POLICY', 'equity')
+        try:
+            bots.get_policy(policy)
+        except ImportError:
+            raise CommandError(f'Unknown bot policy: {policy}')
+
+        taken = set(RoomPlayer.objects.filter(room=room).values_list('seat_number', flat=True))
+        free = [number for number in range(1, room.max_players + 1) if number not in taken][:options['count']]
+        users = bots.create_bot_users(len(free), options['stack'])
+        seated = asyncio.run(self.seat(room, list(zip(users, free)), options['stack'], policy))
+        self.stdout.write(f'{seated} bots seated in {room.name}')
+
+    async def seat(self, room, places, stack, policy):
+        room_id = str(room.unique_id)
+        worker = await sharding.get_worker()
+        try:
+            if await worker.owner_of(room_id) == worker.worker_id:
+                # Стол никто не держит: хватит строк в базе, актор здесь не нужен
+                for user, number in places:
+                    await sync_to_async(wallet.buy_in)(user.pk, room.pk, number, stack, 'Player')
+                return len(places)
+            seated = 0
+            for user, number in places:
+                try:
+                    await worker.submit(room_id, 'add_bot', user.pk, user.username, number, stack, policy)
+                    seated += 1
+                except Exception as e:
+                    self.stderr.write(f'Seat {number}: {e}')
+            return seated
+        finally:
+            await worker.stop()
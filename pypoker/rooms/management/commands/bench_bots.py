@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rooms import bots
+from rooms.engine import Table
+from rooms.evaluator import rank_table
+
+
+class Command(BaseCommand):
+    help = ('Замер ядра симуляции ботов на одном ядре: раздачи и решения в секунду '
+            'на заданном числе столов. База не нужна — запросов быть не должно')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tables', type=int, default=300)
+        parser.add_argument('--players', type=int, default=6)
+        parser.add_argument('--hands', type=int, default=5)
+        parser.add_argument('--policy', default='equity')
+
+    def handle(self, *args, **options):
+        tables = []
+        for index in range(options['tables']):
+            table = Table(f'bench{index}', big_blind=50, max_players=options['players'])
+            for number in range(1, options['players'] + 1):
+                table.sit(number, number, f'bot{number}', 10000, bot=options['policy'])
+            tables.append(table)
+        rank_table(7)  # таблица строится при первом обращении, её в замер не включаем
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            hands, decisions = bots.simulate(tables, options['hands'])
+            elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"tables: {len(tables)}, players: {options['players']}, policy: {options['policy']}")
+        self.stdout.write(f'hands: {hands:,} ({hands / elapsed:,.0f}/s), decisions: {decisions:,} '
+                          f'({decisions / elapsed:,.0f}/s, {elapsed / max(decisions, 1) * 1e6:.0f} us each)')
+        self.stdout.write(f'DB queries: {len(queries)}')
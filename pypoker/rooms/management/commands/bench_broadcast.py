@@ -0,0 +1,99 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from rooms import protocol
+from rooms.actor import RoomActor
+from rooms.clock import ActionClock
+from rooms.consumers import RoomConsumer
+from rooms.engine import Table
+
+
+class CaptureLayer:
+    """Слой каналов, который только запоминает последнее событие группы."""
+    event = None
+
+    async def group_send(self, group, event):
+        self.event = event
+
+
+class CountingOutbox:
+    """Очередь исходящих без писателя: кадр сразу считается отправленным."""
+    sent = 0
+
+    def put(self, frame, update=False):
+        self.sent += 1
+
+
+class Recipient(RoomConsumer):
+    """Консьюмер без соединения: считает кадры вместо отправки."""
+
+    def __init__(self, seat_number):
+        self.seat_number = seat_number
+        self.codec = protocol.DEFAULT_CODEC
+        self.outbox = CountingOutbox()
+        self.sent = 0
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        self.sent += 1
+
+
+class Command(BaseCommand):
+    help = ('Процессорное время на одну рассылку update_game в зависимости от числа мест '
+            'и зрителей: кадр, закодированный актором один раз, против кодирования в каждом '
+            'консьюмере. Доставка через слой каналов в замер не входит — каждый '
+            'консьюмер получает то же событие')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seats', type=int, nargs='+', default=[2, 6, 9])
+        parser.add_argument('--spectators', type=int, nargs='+', default=[0, 10, 100, 500])
+        parser.add_argument('--broadcasts', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'seats':>5} {'spectators':>10} {'once us':>10} {'per socket us':>14} {'speedup':>8}")
+        for seats in options['seats']:
+            for spectators in options['spectators']:
+                once, per_socket = asyncio.run(self.measure(seats, spectators, options['broadcasts']))
+                self.stdout.write(f'{seats:5} {spectators:10} {once * 1e6:10.0f} {per_socket * 1e6:14.0f} '
+                                  f'{per_socket / once:7.1f}x')
+
+    async def measure(self, seats, spectators, broadcasts):
+        table = Table('bench', big_blind=50, max_players=seats)
+        for number in range(1, seats + 1):
+            table.sit(number, number, f'player{number}', 10000)
+        table.diff()
+        table.start_hand()
+        table.diff()
+        table.apply(table.seats[table.current_player].user_id, 'call')
+        message = dict(table.diff(), action='update_game')
+
+        layer = CaptureLayer()
+        actor = RoomActor(table, channel_layer=layer, action_clock=ActionClock())
+        recipients = [Recipient(number) for number in range(1, seats + 1)]
+        recipients += [Recipient(None) for _ in range(spectators)]
+
+        async def encode_once():
+            await actor.publish({'type': 'game_update', 'message': dict(message)})
+            for recipient in recipients:
+                await recipient.game_update(layer.event)
+
+        async def encode_per_socket():
+            # Как было раньше: в событии словарь, каждый консьюмер кодирует его сам
+            event = {'type': 'game_update', 'message': dict(message)}
+            for recipient in recipients:
+                await recipient.send(text_data=json.dumps(event['message']))
+
+        try:
+            return (await self.cpu_per_call(encode_once, broadcasts),
+                    await self.cpu_per_call(encode_per_socket, broadcasts))
+        finally:
+            actor.stop()
+
+    async def cpu_per_call(self, broadcast, count):
+        await broadcast()  # прогрев
+        started = time.process_time()
+        for _ in range(count):
+            await broadcast()
+        return (time.process_time() - started) / count
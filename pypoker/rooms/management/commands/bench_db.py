@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Переменные окружения, которыми settings.py выбирает базу
+BACKENDS = {
+    'sqlite': {'POKER_SQLITE_WAL': '0'},
+    'sqlite-wal': {'POKER_SQLITE_WAL': '1'},
+    'postgres': {},
+}
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку действия и посадки за стол на разных базах: для каждой '
+            'прогоняет loadtest в отдельном процессе. SQLite берётся файлом (с WAL и без), '
+            'PostgreSQL — тот, что задан POSTGRES_DB и соседними переменными, например '
+            'локальный docker run postgres')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', default='sqlite,sqlite-wal,postgres')
+        parser.add_argument('--players', type=int, default=6)
+        parser.add_argument('--hands', type=int, default=20)
+
+    def handle(self, *args, **options):
+        for name in options['backends'].split(','):
+            env = dict(os.environ, **BACKENDS[name])
+            if name == 'postgres':
+                if not env.get('POSTGRES_DB'):
+                    self.stdout.write(f'{name}: skipped, set POSTGRES_DB (and POSTGRES_HOST/USER/PASSWORD)')
+                    continue
+            else:
+                env.pop('POSTGRES_DB', None)
+            with tempfile.TemporaryDirectory() as directory:
+                # Тестовая база SQLite в файле: в памяти режим журнала не действует
+                env['POKER_SQLITE_TEST_NAME'] = os.path.join(directory, 'bench.sqlite3')
+                result = subprocess.run(
+                    [sys.executable, 'manage.py', 'loadtest',
+                     '--players', str(options['players']), '--hands', str(options['hands'])],
+                    cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+                )
+            if result.returncode:
+                self.stderr.write(f'{name}: failed\n{result.stderr}')
+                continue
+            self.stdout.write(f'--- {name}')
+            self.stdout.write(result.stdout.rstrip())
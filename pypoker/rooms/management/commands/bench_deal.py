@@ -0,0 +1,35 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from rooms.deck import Deck
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости раздачи: раздачи в секунду против random.SystemRandom().sample'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hands', type=int, default=200000)
+        parser.add_argument('--players', type=int, default=10)
+
+    def handle(self, *args, **options):
+        hands = options['hands']
+        count = 2 * options['players'] + 5  # карманные карты и борд
+
+        deck = Deck()
+        started = time.perf_counter()
+        for _ in range(hands):
+            deck.deal(count)
+        elapsed = time.perf_counter() - started
+
+        system = random.SystemRandom()
+        cards = range(52)
+        started = time.perf_counter()
+        for _ in range(hands):
+            system.sample(cards, count)
+        baseline = time.perf_counter() - started
+
+        self.stdout.write(f'hands: {hands}, cards per hand: {count}')
+        self.stdout.write(f'Deck.deal: {hands / elapsed:,.0f} hands/s ({elapsed:.3f}s)')
+        self.stdout.write(f'SystemRandom.sample: {hands / baseline:,.0f} hands/s ({baseline:.3f}s)')
@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from rooms import equity
+from rooms.evaluator import parse_cards, rank_table
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости расчёта эквити: руки в секунду на ядро'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200000)
+        parser.add_argument('--players', type=int, default=2)
+        parser.add_argument('--pool', action='store_true', help='считать в пуле процессов')
+
+    def handle(self, *args, **options):
+        hands = [parse_cards(text) for text in ('As Ah', 'Ks Kh', 'Qc Jc', '9d 8d', '7s 7c', '5h 4h')]
+        hands = hands[:options['players']]
+        iterations = options['iterations']
+        rank_table(7)  # таблицы строятся один раз, в замер не входят
+
+        if options['pool']:
+            workers = equity.executor_workers()
+            # Прогрев: процессы пула стартуют и строят свои таблицы
+            asyncio.run(equity.equity_async(hands, iterations=workers, time_budget=0))
+            started = time.perf_counter()
+            asyncio.run(equity.equity_async(hands, iterations=iterations, time_budget=0))
+        else:
+            workers = 1
+            started = time.perf_counter()
+            equity.simulate_equity(hands, iterations=iterations)
+        elapsed = time.perf_counter() - started
+
+        boards = iterations / elapsed
+        self.stdout.write(f'workers: {workers}, boards: {iterations}, time: {elapsed:.3f}s')
+        self.stdout.write(f'boards/s: {boards:,.0f}, hands/s: {boards * len(hands):,.0f}')
+        self.stdout.write(f'hands/s per core: {boards * len(hands) / workers:,.0f}')
@@ -0,0 +1,45 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rooms.pots import award_pots, build_pots
+
+
+class Command(BaseCommand):
+    help = 'Проверка и замер побочных банков на случайных раздачах: сохранение фишек и раздачи в секунду'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hands', type=int, default=1000000)
+        parser.add_argument('--players', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        max_players = options['players']
+        hands = options['hands']
+
+        # Раздачи генерируются заранее, чтобы в замер попал только расчёт банков
+        samples = []
+        for _ in range(min(hands, 100000)):
+            players = range(rng.randint(2, max_players))
+            contributions = {player: rng.randint(1, 10000) for player in players}
+            folded = {player for player in players if rng.random() < 0.3}
+            if len(folded) == len(contributions):
+                folded.discard(0)
+            ranks = {player: rng.randint(1, 7462) for player in players if player not in folded}
+            samples.append((contributions, folded, ranks, list(players)))
+
+        pots_total = 0
+        started = time.perf_counter()
+        for index in range(hands):
+            contributions, folded, ranks, order = samples[index % len(samples)]
+            pots = build_pots(contributions, folded)
+            payouts = award_pots(pots, ranks, order)
+            if sum(payouts.values()) != sum(contributions.values()):
+                raise CommandError(f'Chips are not conserved: {contributions}, folded {folded}')
+            pots_total += len(pots)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'hands: {hands}, pots: {pots_total}, time: {elapsed:.3f}s')
+        self.stdout.write(f'hands/s: {hands / elapsed:,.0f}, pots per hand: {pots_total / hands:.2f}')
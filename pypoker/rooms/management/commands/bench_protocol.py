@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rooms import protocol
+from rooms.engine import Table
+
+
+class Command(BaseCommand):
+    help = 'Сравнение форматов кадров: время кодирования и байты на рассылку'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seats', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        seats = options['seats']
+        table = Table('bench', big_blind=50, max_players=seats)
+        for number in range(1, seats + 1):
+            table.sit(number, number, f'player{number}', 10000)
+        table.diff()
+        table.start_hand()
+        table.diff()
+
+        # Типичная рассылка — одно действие; худший случай — изменились все места
+        table.apply(table.seats[table.current_player].user_id, 'call')
+        messages = {
+            'action': dict(table.diff(), action='update_game'),
+            'full table': dict(table.diff() or {}, action='update_game', version=table.version,
+                               seats={str(n): s.to_dict() for n, s in table.seats.items()}),
+        }
+
+        for name, codec in protocol.CODECS.items():
+            for label, message in messages.items():
+                frame = codec.frame(message)
+                size = len(next(iter(frame.values())))
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    codec.frame(message)
+                per_frame = (time.perf_counter() - started) / options['repeat'] * 1e6
+                # Кадр уходит каждому из игроков за столом
+                self.stdout.write(f'{name:16} {label:11} {size:5} bytes/frame '
+                                  f'{size * seats:6} bytes/broadcast {per_frame:7.2f} us/encode')
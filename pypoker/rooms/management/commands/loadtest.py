@@ -0,0 +1,41 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from rooms import loadtest
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон стола через веб-сокеты: задержка действие -> рассылка, '
+            'сообщения в секунду и запросы к базе на действие. Работает на временной '
+            'тестовой базе, канальном слое и кэше в памяти, Redis не нужен')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=6)
+        parser.add_argument('--hands', type=int, default=20)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            with override_settings(CHANNEL_LAYERS={
+                'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+            }, CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            }):
+                from pypoker.asgi import application
+                result = asyncio.run(loadtest.run(application, options['players'], options['hands']))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(
+            f"players: {result['players']}, hands: {result['hands']}, actions: {result['actions']}, "
+            f"time: {result['elapsed']:.2f}s"
+        )
+        self.stdout.write(f"action -> broadcast p50: {result['p50_ms']:.2f} ms, p99: {result['p99_ms']:.2f} ms")
+        self.stdout.write(f"sit (buy-in) p50: {result['sit_p50_ms']:.2f} ms")
+        self.stdout.write(f"messages/sec: {result['messages_per_sec']:,.0f}")
+        self.stdout.write(f"DB queries per action: {result['queries_per_action']:.2f}")
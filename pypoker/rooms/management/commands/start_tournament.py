@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from rooms.tournaments import seat_entrants
+
+
+class Command(BaseCommand):
+    help = ('Рассаживает зарегистрированных игроков турнира по столам и запускает часы блайндов. '
+            'Дальше турнир ведёт директор в процессе ASGI, он стартует с первым подключением к столу')
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament_id', type=int)
+
+    def handle(self, *args, **options):
+        Tournament = apps.get_model('main', 'Tournament')
+        try:
+            tournament = Tournament.objects.get(pk=options['tournament_id'])
+        except Tournament.DoesNotExist:
+            raise CommandError(f"Tournament {options['tournament_id']} does not exist")
+        if tournament.status != Tournament.STATUS_REGISTERING:
+            raise CommandError(f'Tournament is already {tournament.status}')
+        try:
+            rooms = seat_entrants(tournament)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'{tournament.entries.count()} players seated at {len(rooms)} tables')
@@ -0,0 +1,266 @@
+"""
+Метрики комнат в текстовом формате Prometheus.
+
+Счётчики, измерители и гистограммы живут в памяти процесса и отдаются
+представлением rooms.views.metrics (GET /metrics) — без внешних сервисов,
+достаточно curl. У каждого процесса ASGI свои значения: при нескольких
+процессах опрашивается каждый.
+
+Запросы к базе считаются обёрткой execute_wrapper на всех соединениях и
+относятся к тем областям (query_scope), что активны в контексте запроса:
+обработчик консьюмера и команда актора, которую он вызвал. Контекст
+переходит в потоки sync_to_async, поэтому запросы из них тоже учитываются.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    text = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in pairs)
+    return '{' + text + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}  # значения меток -> значение
+        if not self.label_names and self.kind != 'histogram':
+            self.values[()] = 0  # метрика без меток видна с нуля
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.label_names)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, key, value in self.samples():
+            lines.append(f'{name}{_format_labels(self.label_names, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        self.function = function  # значение без меток считается при опросе
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        if self.function is not None:
+            return self.function()
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self.function is not None:
+            return [(self.name, (), self.function())]
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        entry = self.values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self.values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                labels = _format_labels(self.label_names, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {total!r}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+def render():
+    return '\n'.join(line for metric in registry for line in metric.render()) + '\n'
+
+
+# --- метрики комнат ---
+
+def _active_rooms():
+    from .actor import actors
+    return len(actors)
+
+
+def _seated_players():
+    from .actor import actors
+    return sum(len(actor.table.seats) for actor in list(actors.values()))
+
+
+def _store_stat(key):
+    def value():
+        from . import store
+        return store.stats[key]
+    return value
+
+
+active_rooms = Gauge('poker_active_rooms', 'Rooms with a running actor in this process', function=_active_rooms)
+seated_players = Gauge('poker_seated_players', 'Players seated at tables of this process', function=_seated_players)
+connected_sockets = Gauge('poker_connected_sockets', 'Open room websocket connections')
+spectator_sockets = Gauge('poker_spectator_sockets', 'Open spectator websocket connections')
+action_seconds = Histogram('poker_action_seconds', 'Room actor command latency, queue wait included',
+                           labels=('command',))
+broadcast_seconds = Histogram('poker_broadcast_seconds', 'Channel layer group_send time per room event',
+                              labels=('event',))
+handler_queries = Counter('poker_handler_queries_total', 'Database queries per RoomConsumer handler',
+                          labels=('handler',))
+command_queries = Counter('poker_command_queries_total', 'Database queries per room actor command',
+                          labels=('command',))
+rate_limited = Counter('poker_rate_limited_frames_total', 'Inbound websocket frames over the rate limit')
+dropped_frames = Counter('poker_dropped_frames_total', 'Outbound frames dropped for slow readers',
+                         labels=('reason',))
+closed_sockets = Counter('poker_closed_sockets_total', 'Websockets closed by the server for misbehaving',
+                         labels=('reason',))
+loop_lag = Histogram('poker_event_loop_lag_seconds', 'How late the event loop wakes up a sleeping task')
+flushes = Counter('poker_flushes_total', 'Write-behind flushes to the database')
+flush_failures = Counter('poker_flush_failures_total', 'Failed write-behind flushes')
+flush_rows = Histogram('poker_flush_rows', 'Rows written by one write-behind flush',
+                       buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+flush_lag = Gauge('poker_flush_lag_seconds', 'Age of the oldest change at the last flush',
+                  function=_store_stat('last_lag'))
+
+
+# --- запросы к базе ---
+
+_scopes = contextvars.ContextVar('poker_query_scopes', default=())
+
+
+def current_scopes():
+    return _scopes.get()
+
+
+@contextmanager
+def query_scope(counter=None, scopes=(), **labels):
+    """Запросы внутри блока добавляются к counter с метками labels (и к scopes)."""
+    if counter is not None:
+        scopes = tuple(scopes) + ((counter, labels),)
+    token = _scopes.set(_scopes.get() + tuple(scopes))
+    try:
+        yield
+    finally:
+        _scopes.reset(token)
+
+
+def _count_query(execute, sql, params, many, context):
+    for counter, labels in _scopes.get():
+        counter.inc(**labels)
+    return execute(sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def install():
+    """Ставит счётчик запросов на текущие и будущие соединения с базой."""
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+    connection_created.connect(_install, dispatch_uid='rooms.metrics')
+
+
+# --- задержка цикла событий ---
+
+_lag_monitor = None
+
+
+def watch_loop(interval=0.5):
+    """Запускает (один раз на цикл событий) замер того, насколько поздно просыпается задача."""
+    global _lag_monitor
+    loop = asyncio.get_running_loop()
+    if _lag_monitor is None or _lag_monitor.done() or _lag_monitor.get_loop() is not loop:
+        _lag_monitor = loop.create_task(_measure_lag(interval))
+
+
+async def _measure_lag(interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, loop.time() - started - interval))
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0011_room_seats_taken"),
+        ("rooms", "0007_rename_active_bets_roomplayer_current_bet"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HandHistory",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("hand_number", models.PositiveIntegerField()),
+                ("played_at", models.DateTimeField(auto_now_add=True)),
+                ("events", models.TextField()),
+                ("room", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="hands", to="main.room")),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("room", "hand_number"), name="unique_hand_in_room")],
+            },
+        ),
+    ]
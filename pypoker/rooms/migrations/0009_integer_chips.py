@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:05
+
+from django.db import migrations, models
+from django.db.models.functions import Round
+
+
+def round_stacks(apps, schema_editor):
+    RoomPlayer = apps.get_model("rooms", "RoomPlayer")
+    RoomPlayer.objects.update(stack=Round("stack"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rooms", "0008_handhistory"),
+    ]
+
+    operations = [
+        migrations.RunPython(round_stacks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="roomplayer",
+            name="stack",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="roomplayer",
+            name="current_bet",
+            field=models.PositiveBigIntegerField(default=0, verbose_name="Активная ставка игрока"),
+        ),
+    ]
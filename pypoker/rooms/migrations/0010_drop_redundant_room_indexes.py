@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rooms", "0009_integer_chips"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="handhistory",
+            name="room",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="hands",
+                to="main.room",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="roomplayer",
+            name="room",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="players",
+                to="main.room",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rooms", "0010_drop_redundant_room_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="roomplayer",
+            name="total_bet",
+            field=models.PositiveBigIntegerField(
+                default=0, verbose_name="Вклад в банк за раздачу"
+            ),
+        ),
+    ]
@@ -20,17 +20,21 @@ class RoomPlayer(models.Model):
     room = models.ForeignKey(
         'main.Room',
         on_delete=models.CASCADE,
-        related_name="players"
+        related_name="players",
+        db_index=False,  # индекс не нужен: room — первое поле обоих уникальных ограничений
     )
-    stack = models.FloatField(default=0.0)
+    stack = models.BigIntegerField(default=0)  # фишки, целое число копеек
     seat_number = models.PositiveIntegerField(null=True, blank=True)
     status = models.CharField(max_length=20, default="active")
     last_action = models.CharField(max_length=20, null=True, blank=True)
     joined_at = models.DateTimeField(auto_now_add=True)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='Player')
     is_active = models.BooleanField(default=True)
-    current_bet = models.PositiveIntegerField(default=0,
-                                              verbose_name="Активная ставка игрока")  # Ставка игрока на текущей улице
+    current_bet = models.PositiveBigIntegerField(default=0,
+                                                 verbose_name="Активная ставка игрока")  # Ставка игрока на текущей улице
+    # Вклад в банк за всю раздачу: если раздача не доиграна (процесс упал
+    # или стол переехал), при загрузке стола он возвращается в стек
+    total_bet = models.PositiveBigIntegerField(default=0, verbose_name="Вклад в банк за раздачу")
     def assign_role(self, role):
         self.role = role
         self.save()
@@ -38,8 +42,35 @@ class RoomPlayer(models.Model):
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['room', 'user'], name='unique_user_in_room'),
+            # Он же индекс карты мест стола (загрузка стола, страница комнаты).
+            # Покрывающим его не делаем: стек и роль переписываются каждым
+            # сбросом стола, и каждое обновление трогало бы индекс
             models.UniqueConstraint(fields=['room', 'seat_number'], name='unique_seat_in_room')
         ]
 
     def __str__(self):
         return f"{self.user.username} in {self.room.name} (Seat {self.seat_number})"
+
+
+class HandHistory(models.Model):
+    """
+    Запись о сыгранной раздаче. Строки только добавляются; события хранятся
+    в формате JSON Lines (одно событие в строке) и пишутся пачками.
+    """
+    room = models.ForeignKey(
+        'main.Room',
+        on_delete=models.CASCADE,
+        related_name="hands",
+        db_index=False,  # покрыт уникальным индексом (room, hand_number)
+    )
+    hand_number = models.PositiveIntegerField()
+    played_at = models.DateTimeField(auto_now_add=True)
+    events = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'hand_number'], name='unique_hand_in_room')
+        ]
+
+    def __str__(self):
+        return f"Hand #{self.hand_number} in {self.room.name}"
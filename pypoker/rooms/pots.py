@@ -0,0 +1,64 @@
+"""
+Основной банк и побочные банки.
+
+build_pots режет вклады игроков за раздачу на банки за один проход по
+игрокам, отсортированным по вкладу: каждый новый уровень вклада открывает
+банк, в который каждый из оставшихся игроков кладёт разницу уровней.
+Претендуют на банк несбросившие игроки, вложившие не меньше уровня.
+award_pots раздаёт банки по силе рук (меньшее значение evaluate — сильнее).
+
+Функции чистые и не знают о столе: игроки — любые hashable, фишки — int.
+"""
+
+
+def build_pots(contributions, folded=()):
+    """
+    contributions: {игрок: фишки за раздачу}, folded — сбросившие карты.
+    Возвращает список (сумма, претенденты) от основного банка к побочным.
+    Банки без претендентов (вклад сбросивших выше всех остальных)
+    добавляются к предыдущему банку, одинаковые по претендентам — сливаются.
+    """
+    ordered = sorted(contributions.items(), key=lambda item: item[1])
+    # Несбросившие в том же порядке: претенденты банка — их хвост
+    live = [player for player, _ in ordered if player not in folded]
+
+    pots = []
+    previous = 0
+    first_live = 0  # первый несбросивший, чей вклад не меньше текущего уровня
+    carry = 0  # фишки, для которых ещё нет претендентов
+    for index, (player, level) in enumerate(ordered):
+        if level > previous:
+            amount = (level - previous) * (len(ordered) - index)
+            previous = level
+            # Претенденты — суффикс live, так что сравнивать достаточно длину
+            eligible = len(live) - first_live
+            if pots and (not eligible or len(pots[-1][1]) == eligible):
+                # Тот же круг претендентов (или никого) — это продолжение банка
+                pots[-1] = (pots[-1][0] + amount, pots[-1][1])
+            elif eligible:
+                pots.append((amount + carry, tuple(live[first_live:])))
+                carry = 0
+            else:
+                carry += amount
+        if player not in folded:
+            first_live += 1
+    return pots
+
+
+def award_pots(pots, ranks, order):
+    """
+    ranks: {игрок: значение evaluate} для вскрывшихся, order — игроки по
+    порядку от баттона: нечётная фишка при делёжке уходит первому из них.
+    Возвращает {игрок: выигрыш}.
+    """
+    position = {player: index for index, player in enumerate(order)}
+    payouts = {}
+    for amount, eligible in pots:
+        best = min(ranks[player] for player in eligible)
+        winners = sorted((player for player in eligible if ranks[player] == best), key=position.__getitem__)
+        share, remainder = divmod(amount, len(winners))
+        for player in winners:
+            payouts[player] = payouts.get(player, 0) + share
+        if remainder:
+            payouts[winners[0]] += remainder
+    return payouts
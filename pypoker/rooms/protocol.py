@@ -0,0 +1,198 @@
+"""
+Кодирование кадров веб-сокета комнаты.
+
+Формат выбирается в connect по подпротоколу, который предложил клиент:
+
+* без подпротокола или 'pypoker.json' — JSON-текст, как раньше;
+* 'pypoker.msgpack' — MessagePack (если установлен пакет msgpack);
+* 'pypoker.bin' — изменения стола (update_game) бинарным кадром
+  фиксированной структуры, остальные сообщения — JSON-текстом.
+
+События комнаты кодируются один раз на рассылку (encode_frames), а не в
+каждом консьюмере: в событии канала едут готовые кадры всех форматов.
+"""
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .engine import STREETS
+from .evaluator import card, card_str
+
+ROLES = ('Player', 'Dealer', 'Small Blind', 'Big Blind')
+
+# Бинарный update_game: тип кадра, версия, флаги присутствующих полей
+FRAME_UPDATE = 1
+HEADER = struct.Struct('<BIB')
+SEAT = struct.Struct('<BBqqB')  # номер места, флаги, стек, ставка, роль
+CHIPS = struct.Struct('<q')  # фишки — целые копейки
+NAME_LENGTH = struct.Struct('<H')  # длина имени в байтах UTF-8, у кириллицы до 300
+
+FIELD_POT = 1
+FIELD_CURRENT_BET = 2
+FIELD_CURRENT_PLAYER = 4
+FIELD_BETTING_ROUND = 8
+FIELD_BOARD = 16
+
+SEAT_PRESENT = 1
+SEAT_ACTIVE = 2
+
+
+class JsonCodec:
+    def frame(self, message):
+        return {'text_data': json.dumps(message)}
+
+    def forward(self, frames):
+        """Готовый кадр рассылки (см. encode_frames) в формате соединения."""
+        return {'text_data': frames['text']}
+
+
+class MsgpackCodec:
+    def frame(self, message):
+        return {'bytes_data': msgpack.packb(message)}
+
+    def forward(self, frames):
+        return {'bytes_data': frames['msgpack']}
+
+
+class BinaryCodec(JsonCodec):
+    def frame(self, message):
+        if not is_binary_update(message):
+            return super().frame(message)
+        return {'bytes_data': encode_update(message)}
+
+    def forward(self, frames):
+        if 'bin' not in frames:
+            return super().forward(frames)
+        return {'bytes_data': frames['bin']}
+
+
+def is_binary_update(message):
+    # Шансы олл-ина в бинарный формат не входят — такие кадры идут JSON-текстом
+    return message.get('action') == 'update_game' and 'equity' not in message
+
+
+def encode_frames(message):
+    """
+    Сообщение рассылки во всех форматах сразу: актор кодирует его один раз,
+    а консьюмеры пересылают готовый кадр своего формата (Codec.forward).
+    """
+    frames = {'text': json.dumps(message)}
+    if is_binary_update(message):
+        frames['bin'] = encode_update(message)
+    if msgpack is not None:
+        frames['msgpack'] = msgpack.packb(message)
+    return frames
+
+
+def encode_update(message):
+    flags = 0
+    body = []
+    if 'pot' in message:
+        flags |= FIELD_POT
+        body.append(CHIPS.pack(message['pot']))
+    if 'current_bet' in message:
+        flags |= FIELD_CURRENT_BET
+        body.append(CHIPS.pack(message['current_bet']))
+    if 'current_player' in message:
+        flags |= FIELD_CURRENT_PLAYER
+        body.append(bytes((message['current_player'] or 0,)))
+    if 'betting_round' in message:
+        flags |= FIELD_BETTING_ROUND
+        betting_round = message['betting_round']
+        body.append(bytes((STREETS.index(betting_round) + 1 if betting_round else 0,)))
+    if 'board' in message:
+        flags |= FIELD_BOARD
+        board = [card(text) for text in message['board']]
+        body.append(bytes([len(board)] + board))
+
+    seats = message.get('seats', {})
+    body.append(bytes((len(seats),)))
+    for number, seat in seats.items():
+        if seat is None:
+            body.append(SEAT.pack(int(number), 0, 0, 0, 0))
+            continue
+        seat_flags = SEAT_PRESENT | (SEAT_ACTIVE if seat['active_in_round'] else 0)
+        role = ROLES.index(seat['role']) if seat['role'] in ROLES else 0
+        body.append(SEAT.pack(int(number), seat_flags, seat['cash'], seat['current_bet'], role))
+        username = seat['username'].encode()
+        body.append(NAME_LENGTH.pack(len(username)) + username)
+
+    return HEADER.pack(FRAME_UPDATE, message['version'], flags) + b''.join(body)
+
+
+def decode_update(data):
+    """Обратное преобразование encode_update — для тестов и клиентов на Python."""
+    kind, version, flags = HEADER.unpack_from(data)
+    if kind != FRAME_UPDATE:
+        raise ValueError(f'Unknown frame type: {kind}')
+    offset = HEADER.size
+    message = {'action': 'update_game', 'version': version}
+
+    if flags & FIELD_POT:
+        message['pot'], = CHIPS.unpack_from(data, offset)
+        offset += CHIPS.size
+    if flags & FIELD_CURRENT_BET:
+        message['current_bet'], = CHIPS.unpack_from(data, offset)
+        offset += CHIPS.size
+    if flags & FIELD_CURRENT_PLAYER:
+        message['current_player'] = data[offset] or None
+        offset += 1
+    if flags & FIELD_BETTING_ROUND:
+        message['betting_round'] = STREETS[data[offset] - 1] if data[offset] else None
+        offset += 1
+    if flags & FIELD_BOARD:
+        count = data[offset]
+        message['board'] = [card_str(value) for value in data[offset + 1:offset + 1 + count]]
+        offset += 1 + count
+
+    seats = {}
+    count = data[offset]
+    offset += 1
+    for _ in range(count):
+        number, seat_flags, cash, current_bet, role = SEAT.unpack_from(data, offset)
+        offset += SEAT.size
+        if not seat_flags & SEAT_PRESENT:
+            seats[str(number)] = None
+            continue
+        length, = NAME_LENGTH.unpack_from(data, offset)
+        offset += NAME_LENGTH.size
+        username = data[offset:offset + length].decode()
+        offset += length
+        seats[str(number)] = {
+            'username': username,
+            'seat': number,
+            'cash': cash,
+            'current_bet': current_bet,
+            'active_in_round': bool(seat_flags & SEAT_ACTIVE),
+            'role': ROLES[role],
+        }
+    message['seats'] = seats
+    return message
+
+
+CODECS = {'pypoker.json': JsonCodec(), 'pypoker.bin': BinaryCodec()}
+if msgpack is not None:
+    CODECS['pypoker.msgpack'] = MsgpackCodec()
+
+DEFAULT_CODEC = CODECS['pypoker.json']
+
+
+def negotiate(subprotocols):
+    """Первый из предложенных клиентом подпротоколов, который мы поддерживаем."""
+    for name in subprotocols:
+        if name in CODECS:
+            return name, CODECS[name]
+    return None, DEFAULT_CODEC
+
+
+def decode(text_data=None, bytes_data=None):
+    """Входящий кадр: JSON-текст или MessagePack в бинарном кадре."""
+    if bytes_data is not None:
+        if msgpack is None:
+            raise ValueError('Binary frames require msgpack')
+        return msgpack.unpackb(bytes_data)
+    return json.loads(text_data)
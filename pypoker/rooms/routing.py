@@ -1,6 +1,12 @@
 from django.urls import re_path
-from .consumers import RoomConsumer
+from .consumers import RoomConsumer, SpectatorConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/room/(?P<unique_id>[a-f0-9\-]+)/$', RoomConsumer.as_asgi()),
 ]
+
+# Зрителям не нужны сессия и пользователь: эти маршруты подключаются в
+# pypoker.asgi раньше AuthMiddlewareStack
+spectator_urlpatterns = [
+    re_path(r'ws/room/(?P<unique_id>[a-f0-9\-]+)/watch/$', SpectatorConsumer.as_asgi()),
+]
@@ -0,0 +1,274 @@
+"""
+Распределение столов между процессами ASGI.
+
+Каждый стол живёт ровно в одном процессе — владельце. Владелец выбирается
+консистентным хешированием unique_id комнаты по кольцу живых процессов и
+закрепляется арендой в общем кэше (add с TTL, продлевается пульсом).
+Консьюмер любого процесса отправляет команды через Worker.submit: свои
+столы обслуживаются напрямую актором, чужие — пересылкой по слою каналов
+в канал процесса-владельца, ответ приходит обратно в канал отправителя.
+
+Новый процесс получает новые столы по кольцу, уже занятые столы остаются
+у владельца, пока тот жив. Для нескольких процессов нужны общие CACHES и
+CHANNEL_LAYERS (Redis): со слоем каналов между процессами и локальным
+кэшем Worker не запускается. В тестах несколько Worker живут в одном
+процессе с InMemoryChannelLayer и локальным кэшем.
+"""
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
+import time
+import uuid
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist, ValidationError
+
+from . import store
+from .actor import RoomMoved, actors, get_actor
+from .engine import ActionError
+
+logger = logging.getLogger(__name__)
+
+WORKERS_KEY = 'poker:workers'
+REPLICAS = 64  # точек на кольце у каждого процесса
+
+
+def lease_key(room_id):
+    return f'poker:lease:{room_id}'
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    def __init__(self, nodes, replicas=REPLICAS):
+        self.points = sorted((_hash(f'{node}:{index}'), node) for node in nodes for index in range(replicas))
+        self.keys = [point for point, _ in self.points]
+
+    def owner(self, key):
+        if not self.points:
+            return None
+        index = bisect.bisect(self.keys, _hash(str(key))) % len(self.points)
+        return self.points[index][1]
+
+
+class Worker:
+    def __init__(self, channel_layer=None, worker_id=None):
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.channel_layer = channel_layer or get_channel_layer()
+        self.channel_name = None
+        self.loop = None
+        self.rooms = set()  # столы, которыми владеет этот процесс
+        self.releasing = set()  # столы, которые сейчас отдаются: заново их не берём
+        self.owners = {}  # unique_id -> worker_id, запомненные владельцы чужих столов
+        self.workers = {}  # worker_id -> канал, живые процессы
+        self.ring = HashRing([])
+        self.pending = {}  # номер запроса -> future ответа
+        self.requests = itertools.count()
+        self.tasks = []
+
+    # --- жизненный цикл ---
+
+    async def start(self):
+        if not isinstance(self.channel_layer, InMemoryChannelLayer) and isinstance(caches['default'], LocMemCache):
+            # Каждый процесс видел бы в кольце только себя, и у стола было бы несколько владельцев
+            raise ImproperlyConfigured('Sharding across processes needs a shared cache: set CACHES to Redis')
+        self.loop = asyncio.get_running_loop()
+        self.channel_name = await self.channel_layer.new_channel('poker.worker.')
+        await self.heartbeat()
+        self.tasks = [self.loop.create_task(self._listen()), self.loop.create_task(self._beat())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        for room_id in list(self.rooms):
+            await self.release(room_id)
+        await self.unregister()
+
+    async def unregister(self):
+        workers = await cache.aget(WORKERS_KEY) or {}
+        if workers.pop(self.worker_id, None) is not None:
+            await cache.aset(WORKERS_KEY, workers, None)
+
+    async def heartbeat(self):
+        """Отмечает процесс живым, обновляет кольцо и продлевает аренду своих столов."""
+        ttl = getattr(settings, 'POKER_LEASE_TTL', 15.0)
+        now = time.time()
+        workers = await cache.aget(WORKERS_KEY) or {}
+        workers = {worker_id: entry for worker_id, entry in workers.items() if entry[1] > now}
+        workers[self.worker_id] = (self.channel_name, now + ttl)
+        await cache.aset(WORKERS_KEY, workers, None)
+        self.workers = {worker_id: channel for worker_id, (channel, _) in workers.items()}
+        self.ring = HashRing(sorted(self.workers))
+
+        for room_id in list(self.rooms):
+            holder = await cache.aget(lease_key(room_id))
+            if holder not in (None, self.worker_id):
+                # Аренду перехватили, пока процесс стоял: состояние уже не наше
+                logger.warning('Lost lease on room %s to %s', room_id, holder)
+                await self.release(room_id, flush=False)
+            else:
+                await cache.aset(lease_key(room_id), self.worker_id, ttl)
+
+    async def _beat(self):
+        interval = getattr(settings, 'POKER_HEARTBEAT_INTERVAL', 5.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.heartbeat()
+            except Exception:
+                logger.exception('Worker heartbeat failed')
+
+    # --- владение столами ---
+
+    async def owner_of(self, room_id):
+        if room_id in self.rooms:
+            return self.worker_id
+        owner = self.owners.get(room_id)
+        if owner in self.workers:
+            return owner
+        owner = await cache.aget(lease_key(room_id))
+        if owner not in self.workers:
+            owner = self.ring.owner(room_id) or self.worker_id
+        self.owners[room_id] = owner
+        return owner
+
+    async def claim(self, room_id):
+        if room_id in self.rooms:
+            return True
+        if room_id in self.releasing:
+            return False
+        key = lease_key(room_id)
+        ttl = getattr(settings, 'POKER_LEASE_TTL', 15.0)
+        if await cache.aadd(key, self.worker_id, ttl) or await cache.aget(key) == self.worker_id:
+            self.rooms.add(room_id)
+            self.owners.pop(room_id, None)
+            return True
+        return False
+
+    async def release(self, room_id, flush=True):
+        """Отдаёт стол: останавливает актор, сохраняет стол и снимает аренду."""
+        self.rooms.discard(room_id)
+        self.releasing.add(room_id)
+        try:
+            actor = actors.pop(room_id, None)
+            if actor is not None:
+                actor.stop()
+            if flush and room_id in store.tables:
+                await store.flush_all()
+            store.tables.pop(room_id, None)
+            if flush and await cache.aget(lease_key(room_id)) == self.worker_id:
+                await cache.adelete(lease_key(room_id))
+        finally:
+            self.releasing.discard(room_id)
+
+    # --- команды ---
+
+    async def submit(self, room_id, command, *args):
+        """Выполняет команду актора стола, где бы он ни жил."""
+        for _ in range(3):
+            owner = await self.owner_of(room_id)
+            try:
+                if owner == self.worker_id:
+                    return await self._run_local(room_id, command, args)
+                return await self._forward(owner, room_id, command, args)
+            except RoomMoved:
+                self.owners.pop(room_id, None)
+        raise ActionError('The table is moving to another server, try again')
+
+    async def _run_local(self, room_id, command, args):
+        if not await self.claim(room_id):
+            raise RoomMoved
+        try:
+            actor = await get_actor(room_id)
+        except (ObjectDoesNotExist, ValidationError):
+            await self.release(room_id)
+            raise
+        return await actor.submit(command, *args)
+
+    async def _forward(self, owner, room_id, command, args):
+        request = next(self.requests)
+        future = self.loop.create_future()
+        self.pending[request] = future
+        try:
+            await self.channel_layer.send(self.workers[owner], {
+                'type': 'room.command',
+                'room': room_id,
+                'command': command,
+                'args': list(args),
+                'reply_to': self.channel_name,
+                'request': request,
+            })
+            reply = await asyncio.wait_for(future, getattr(settings, 'POKER_FORWARD_TIMEOUT', 10.0))
+        except (KeyError, asyncio.TimeoutError):
+            # Владелец пропал: в следующий раз выберем заново
+            self.owners.pop(room_id, None)
+            raise ActionError('The table server is not responding, try again')
+        finally:
+            self.pending.pop(request, None)
+
+        if reply.get('moved'):
+            raise RoomMoved
+        if reply.get('missing'):
+            raise ObjectDoesNotExist(f'Room {room_id} does not exist')
+        if 'error' in reply:
+            raise ActionError(reply['error'])
+        return reply.get('result')
+
+    async def _listen(self):
+        while True:
+            message = await self.channel_layer.receive(self.channel_name)
+            if message['type'] == 'room.command':
+                self.loop.create_task(self._serve(message))
+            elif message['type'] == 'room.reply':
+                future = self.pending.get(message['request'])
+                if future is not None and not future.done():
+                    future.set_result(message)
+
+    async def _serve(self, message):
+        reply = {'type': 'room.reply', 'request': message['request']}
+        try:
+            reply['result'] = await self._run_local(message['room'], message['command'], message['args'])
+        except RoomMoved:
+            reply['moved'] = True
+        except ActionError as e:
+            reply['error'] = str(e)
+        except (ObjectDoesNotExist, ValidationError):
+            reply['missing'] = True
+        except Exception:
+            logger.exception('Forwarded command %s failed', message['command'])
+            reply['error'] = 'Internal error'
+        await self.channel_layer.send(message['reply_to'], reply)
+
+
+_worker = None
+_starting = None
+
+
+async def get_worker():
+    """Worker этого процесса; создаётся при первом обращении в текущем цикле событий."""
+    global _starting
+    loop = asyncio.get_running_loop()
+    if _worker is not None and _worker.loop is loop and _worker.channel_layer is get_channel_layer():
+        return _worker
+    # Параллельные подключения ждут один и тот же запуск
+    if _starting is None or _starting.done() or _starting.get_loop() is not loop:
+        _starting = loop.create_task(_start_worker())
+    return await _starting
+
+
+async def _start_worker():
+    global _worker
+    if _worker is not None:
+        # Цикл событий прежнего Worker закрыт — только убираем его из кольца
+        await _worker.unregister()
+    worker = Worker()
+    await worker.start()
+    _worker = worker
+    return worker
@@ -0,0 +1,289 @@
+"""
+Реестр столов в памяти процесса и их синхронизация с базой.
+
+Стол загружается из Room/RoomPlayer один раз, дальше все действия идут
+в памяти. Изменённые поля копятся на столе (Table.dirty, dirty_seats) и
+пишутся отложенно: раз в settings.POKER_FLUSH_INTERVAL секунд и сразу
+после конца раздачи — одним bulk_update на Room и одним на RoomPlayer
+для всех столов процесса. Чтобы падение процесса между сбросами не
+стоило фишек, актор после каждой команды дописывает изменения в журнал
+(rooms.journal). У каждого процесса свой файл журнала и аренда на него в
+общем кэше; журналы процессов, чья аренда истекла, применяются к базе
+перед загрузкой стола.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+from . import evaluator, history, metrics
+from .engine import Table
+from .journal import Journal
+
+logger = logging.getLogger(__name__)
+
+tables = {}  # unique_id комнаты -> Table
+_flusher = None
+_flush_requested = None
+_journal = None
+_journaled = {}  # unique_id -> последняя запись стола в журнале
+_dirty_since = None  # когда появилось самое старое несброшенное изменение
+_lease_renewed = None  # когда аренда журнала продлевалась в последний раз
+
+PROCESS_ID = uuid.uuid4().hex  # суффикс файла журнала этого процесса
+
+# Размер и задержка сбросов: строк в последнем сбросе, всего строк,
+# сколько секунд изменения ждали записи в базу
+stats = {
+    'flushes': 0,
+    'rows': 0,
+    'last_rows': 0,
+    'last_lag': 0.0,
+    'max_lag': 0.0,
+    'failures': 0,
+}
+
+
+async def get_table(room_id):
+    table = tables.get(room_id)
+    if table is None:
+        await recover()
+        loaded = await load_table(room_id)
+        # Пока шла загрузка, стол мог загрузить другой запрос
+        table = tables.setdefault(room_id, loaded)
+        _ensure_flusher()
+    return table
+
+
+async def load_table(room_id):
+    Room = apps.get_model('main', 'Room')
+    RoomPlayer = apps.get_model('rooms', 'RoomPlayer')
+
+    room = await Room.objects.only('big_blind', 'max_players', 'tournament_id', 'flag_is_started').aget(
+        unique_id=room_id)
+    # Таблица 7-карточных рук строится лениво; строим её вне цикла событий
+    await asyncio.to_thread(evaluator.rank_table, 7)
+    table = Table(room_id, pk=room.pk, big_blind=room.big_blind, max_players=room.max_players,
+                  time_bank=getattr(settings, 'POKER_TIME_BANK', 60.0), tournament_id=room.tournament_id)
+    players = RoomPlayer.objects.filter(room=room).select_related('user').only(
+        'seat_number', 'stack', 'total_bet', 'role', 'user', 'user__username', 'user__is_bot'
+    )
+    # Политика ботов не хранится: после загрузки они играют политикой по умолчанию
+    bot = getattr(settings, 'POKER_BOT_POLICY', 'equity')
+    async for player in players:
+        # Раздача не доиграна (процесс упал или стол переехал): вклад в банк возвращается
+        stack = player.stack + player.total_bet if room.flag_is_started else player.stack
+        seat = table.sit(player.seat_number, player.user_id, player.user.username, stack,
+                         player_id=player.pk, role=player.role, bot=bot if player.user.is_bot else None)
+        if room.flag_is_started:
+            table.dirty_seats.add(seat.number)
+    # Возврат и пустой банк попадут в базу со следующим сбросом
+    table.dirty = room.flag_is_started
+    # Нумерация раздач продолжается после перезапуска — иначе история столкнётся
+    table.hand_number = await history.last_hand_number(room.pk)
+    return table
+
+
+# --- журнал ---
+
+def journal_lease_key(process_id):
+    return f'poker:journal:{process_id}'
+
+
+def get_journal():
+    global _journal
+    path = getattr(settings, 'POKER_JOURNAL_PATH', None)
+    if path is None:
+        return None
+    path = f'{path}.{PROCESS_ID}'
+    if _journal is None or str(_journal.path) != path:
+        _journal = Journal(path)
+    return _journal
+
+
+async def keep_lease():
+    """Продлевает аренду журнала: пока она жива, другие процессы его не трогают."""
+    global _lease_renewed
+    ttl = getattr(settings, 'POKER_LEASE_TTL', 15.0)
+    now = time.monotonic()
+    if _lease_renewed is None or now - _lease_renewed > ttl / 3:
+        _lease_renewed = now
+        await cache.aset(journal_lease_key(PROCESS_ID), True, ttl)
+
+
+async def journal_table(table):
+    """Дописывает в журнал несброшенные изменения стола, если они поменялись."""
+    global _dirty_since
+    room_fields, players = table.peek_dirty()
+    if room_fields is None and not players:
+        return
+    record = {'room': table.pk, 'fields': room_fields, 'players': players}
+    if _journaled.get(table.room_id) == record:
+        return
+    _journaled[table.room_id] = record
+    if _dirty_since is None:
+        _dirty_since = time.monotonic()
+    journal = get_journal()
+    if journal is not None:
+        await keep_lease()
+        await journal.append(record)
+
+
+def _orphan_journals(path):
+    """Id других процессов, чьи журналы лежат рядом с журналом этого процесса."""
+    path = Path(path)
+    if not path.parent.exists():
+        return set()
+    process_ids = set()
+    for journal in path.parent.glob(f'{path.name}.*'):
+        process_id = journal.name[len(path.name) + 1:].removesuffix('.old')
+        if process_id != PROCESS_ID:
+            process_ids.add(process_id)
+    return process_ids
+
+
+async def recover():
+    """Применяет к базе журналы упавших процессов — тех, чья аренда истекла."""
+    path = getattr(settings, 'POKER_JOURNAL_PATH', None)
+    if path is None:
+        return
+    ttl = getattr(settings, 'POKER_LEASE_TTL', 15.0)
+    for process_id in await asyncio.to_thread(_orphan_journals, path):
+        if await cache.aget(journal_lease_key(process_id)) is not None:
+            continue  # процесс жив
+        # Применяет только один процесс: повтор позже затёр бы новые значения
+        if not await cache.aadd(f'{journal_lease_key(process_id)}:recovery', PROCESS_ID, ttl):
+            continue
+        await _recover_journal(Journal(f'{path}.{process_id}'))
+
+
+async def _recover_journal(journal):
+    records = await asyncio.to_thread(journal.recover_records)
+    if records:
+        rooms, players = {}, {}
+        for record in records:
+            if record['fields'] is not None:
+                rooms.setdefault(record['room'], {}).update(record['fields'])
+            for player_id, fields in record['players']:
+                players.setdefault(player_id, {}).update(fields)
+        await _write(rooms, players)
+        logger.warning('Recovered %d journal records from %s (%d rooms, %d players)',
+                       len(records), journal.path.name, len(rooms), len(players))
+    await asyncio.to_thread(journal.clear)
+
+
+# --- сброс в базу ---
+
+async def _write(rooms, players):
+    Room = apps.get_model('main', 'Room')
+    RoomPlayer = apps.get_model('rooms', 'RoomPlayer')
+
+    # У всех строк один набор полей, поэтому хватает одного UPDATE ... CASE на модель
+    if rooms:
+        fields = list(next(iter(rooms.values())))
+        await Room.objects.abulk_update([Room(pk=pk, **values) for pk, values in rooms.items()], fields)
+    if players:
+        fields = list(next(iter(players.values())))
+        await RoomPlayer.objects.abulk_update(
+            [RoomPlayer(pk=pk, **values) for pk, values in players.items()], fields)
+
+
+async def flush_all():
+    global _dirty_since
+    # Забираем изменения и откладываем журнал без await между ними:
+    # всё, что случится дальше, попадёт уже в новый журнал
+    rooms, players, taken = {}, {}, []
+    for table in list(tables.values()):
+        room_fields, seats = table.take_dirty()
+        if room_fields is None and not seats:
+            continue
+        taken.append((table, room_fields is not None, seats))
+        if room_fields is not None:
+            rooms[table.pk] = room_fields
+        for player_id, fields in seats:
+            players[player_id] = fields
+        _journaled.pop(table.room_id, None)
+    dirty_since, _dirty_since = _dirty_since, None
+    journal = get_journal()
+    # Отметка ставится сразу, а файлы переименовываются в потоке, пока идёт запись
+    rotated = journal.rotate() if journal is not None else None
+
+    written = False
+    if rooms or players:
+        try:
+            await _write(rooms, players)
+        except Exception:
+            logger.exception('Failed to flush %d tables', len(taken))
+            stats['failures'] += 1
+            metrics.flush_failures.inc()
+            # Возвращаем изменения на столы; отложенный журнал остаётся до успеха
+            for table, room_dirty, seats in taken:
+                table.dirty = table.dirty or room_dirty
+                player_ids = {player_id for player_id, _ in seats}
+                table.dirty_seats.update(
+                    seat.number for seat in table.seats.values() if seat.player_id in player_ids)
+            if dirty_since is not None and (_dirty_since is None or dirty_since < _dirty_since):
+                _dirty_since = dirty_since
+        else:
+            rows = len(rooms) + len(players)
+            lag = time.monotonic() - dirty_since if dirty_since is not None else 0.0
+            stats['flushes'] += 1
+            stats['rows'] += rows
+            stats['last_rows'] = rows
+            stats['last_lag'] = lag
+            stats['max_lag'] = max(stats['max_lag'], lag)
+            metrics.flushes.inc()
+            metrics.flush_rows.observe(rows)
+            written = True
+    if rotated is not None and await _rotated(rotated) and written:
+        await asyncio.to_thread(journal.discard)
+
+    try:
+        await history.flush()
+    except Exception:
+        logger.exception('Failed to write hand history')
+
+
+async def _rotated(future):
+    """Дожидается, пока журнал отложен; False — отложить не удалось."""
+    try:
+        await future
+    except Exception:
+        logger.exception('Failed to rotate the journal')
+        return False
+    return True
+
+
+def flush_soon():
+    """Просит сбросить столы, не дожидаясь интервала (например, в конце раздачи)."""
+    if _flush_requested is not None:
+        _flush_requested.set()
+
+
+def _ensure_flusher():
+    global _flusher, _flush_requested
+    loop = asyncio.get_running_loop()
+    if _flusher is None or _flusher.done() or _flusher.get_loop() is not loop:
+        _flush_requested = asyncio.Event()
+        _flusher = loop.create_task(_flush_periodically(_flush_requested))
+
+
+async def _flush_periodically(requested):
+    interval = getattr(settings, 'POKER_FLUSH_INTERVAL', 1.0)
+    while True:
+        try:
+            await asyncio.wait_for(requested.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        requested.clear()
+        await flush_all()
+        if _journal is not None:
+            try:
+                await keep_lease()
+            except Exception:
+                logger.exception('Failed to renew the journal lease')
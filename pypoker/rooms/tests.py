@@ -1,3 +1,1504 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import random
+import tempfile
+from datetime import timedelta
+from functools import partial
+from itertools import combinations
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import InMemoryChannelLayer
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from main.models import Room, Tournament, TournamentEntry
+from . import bots, equity, history, loadtest, metrics, sharding, store, tournaments
+from .actor import RoomActor, RoomMoved, actors, spectator_group
+from .backpressure import Outbox, TokenBucket
+from .clock import ActionClock
+from .consumers import CLOSE_FLOOD, CLOSE_UNAVAILABLE
+from .deck import Deck
+from .engine import ActionError, Table, ROLE_BIG_BLIND, ROLE_DEALER, ROLE_SMALL_BLIND
+from .equity import calculate_equity, hand_strength, is_exact, random_source, simulate_equity
+from .evaluator import card_str, evaluate, evaluate_batch, hand_class, np, parse_cards
+from .models import HandHistory, RoomPlayer
+from .journal import Journal
+from .pots import award_pots, build_pots
+from .protocol import CODECS, BinaryCodec, JsonCodec, decode_update, encode_frames, negotiate
+
+# Журнал столов в тестах пишется во временный каталог, а не в var/;
+# кэш локальный — все Worker тестов живут в одном процессе
+_journal_dir = tempfile.TemporaryDirectory()
+_journal_settings = override_settings(
+    POKER_JOURNAL_PATH=f'{_journal_dir.name}/tables.journal',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+
+
+def setUpModule():
+    _journal_settings.enable()
+
+
+def tearDownModule():
+    _journal_settings.disable()
+    _journal_dir.cleanup()
+
+
+def make_table(*stacks, big_blind=50, max_players=10):
+    table = Table('room', big_blind=big_blind, max_players=max_players)
+    for number, stack in enumerate(stacks, start=1):
+        table.sit(number, number, f'player{number}', stack)
+    return table
+
+
+class TableTests(SimpleTestCase):
+    def test_sit_rejects_taken_seat_and_second_seat(self):
+        table = make_table(1000)
+        with self.assertRaises(ActionError):
+            table.sit(1, 2, 'other', 1000)
+        with self.assertRaises(ActionError):
+            table.sit(2, 1, 'player1', 1000)
+
+    def test_start_hand_posts_blinds(self):
+        table = make_table(1000, 1000, 1000)
+        table.start_hand()
+        self.assertEqual(table.seats[1].role, ROLE_DEALER)
+        self.assertEqual(table.seats[2].role, ROLE_SMALL_BLIND)
+        self.assertEqual(table.seats[3].role, ROLE_BIG_BLIND)
+        self.assertEqual(table.pot, 75)
+        self.assertEqual(table.current_bet, 50)
+        self.assertEqual(table.current_player, 1)
+
+    def test_out_of_turn_action_is_rejected(self):
+        table = make_table(1000, 1000, 1000)
+        table.start_hand()
+        with self.assertRaises(ActionError):
+            table.apply(2, 'call')
+
+    def test_folds_award_pot_to_last_player(self):
+        table = make_table(1000, 1000, 1000)
+        table.start_hand()
+        self.assertIsNone(table.apply(1, 'fold'))
+        payouts = table.apply(2, 'fold')
+        self.assertEqual(payouts, {3: 75})
+        self.assertEqual(table.seats[3].stack, 1025)
+        self.assertFalse(table.hand_in_progress)
+
+    def test_streets_advance_after_calls_and_checks(self):
+        table = make_table(1000, 1000)
+        table.start_hand()
+        table.apply(1, 'call')
+        table.apply(2, 'check')
+        self.assertEqual(table.betting_round, 'flop')
+        self.assertEqual(table.current_bet, 0)
+        self.assertEqual(table.pot, 100)
+
+    def test_raise_reopens_action(self):
+        table = make_table(1000, 1000, 1000)
+        table.start_hand()
+        table.apply(1, 'raise', 150)
+        table.apply(2, 'call')
+        table.apply(3, 'raise', 400)
+        self.assertEqual(table.current_player, 1)
+        with self.assertRaises(ActionError):
+            table.apply(1, 'raise', 500)
+        table.apply(1, 'call')
+        table.apply(2, 'call')
+        self.assertEqual(table.betting_round, 'flop')
+        self.assertEqual(table.pot, 1200)
+
+    def test_chips_are_conserved_through_all_in(self):
+        table = make_table(300, 1000, 1000)
+        table.start_hand()
+        table.apply(1, 'raise', 300)
+        table.apply(2, 'call')
+        payouts = table.apply(3, 'call')
+        for _ in range(6):
+            if payouts is not None:
+                break
+            payouts = table.apply(table.seats[table.current_player].user_id, 'check')
+        self.assertIsNotNone(payouts)
+        self.assertEqual(sum(seat.stack for seat in table.seats.values()), 2300)
+
+    def test_take_dirty_clears_changes(self):
+        table = make_table(1000, 1000)
+        table.seats[1].player_id = 11
+        table.seats[2].player_id = 12
+        table.start_hand()
+        room_fields, players = table.take_dirty()
+        self.assertEqual(room_fields['pot'], 75)
+        self.assertEqual(len(players), 2)
+        self.assertEqual(table.take_dirty(), (None, []))
+
+    def test_diff_contains_only_changes(self):
+        table = make_table(1000, 1000, 1000)
+        first = table.diff()
+        self.assertEqual(first['version'], 1)
+        self.assertEqual(set(first['seats']), {'1', '2', '3'})
+        self.assertIsNone(table.diff())
+
+        table.start_hand()
+        table.diff()
+        table.apply(1, 'call')
+        changes = table.diff()
+        self.assertEqual(changes['version'], 3)
+        self.assertEqual(set(changes['seats']), {'1'})
+        self.assertEqual(changes['pot'], 125)
+        self.assertNotIn('current_bet', changes)
+        self.assertEqual(table.snapshot()['version'], 3)
+
+    def test_diff_reports_freed_seat(self):
+        table = make_table(1000, 1000)
+        table.diff()
+        table.leave(2)
+        self.assertEqual(table.diff()['seats'], {'2': None})
+
+
+class EvaluatorTests(SimpleTestCase):
+    def value(self, text):
+        return evaluate(parse_cards(text))
+
+    def test_hand_classes(self):
+        cases = [
+            ('As Ks Qs Js Ts 2d 3c', 'Straight Flush'),
+            ('9c 9d 9h 9s 2d 3c 4h', 'Four of a Kind'),
+            ('Kc Kd Kh 2s 2d 3c 4h', 'Full House'),
+            ('2h 7h 9h Jh Kh 3c 4d', 'Flush'),
+            ('Ah 2s 3d 4c 5h 9d 9c', 'Straight'),
+            ('7c 7d 7h As 2d 3c 9h', 'Three of a Kind'),
+            ('7c 7d 3h 3s 2d Ac 9h', 'Two Pair'),
+            ('7c 7d 3h Ks 2d Ac 9h', 'One Pair'),
+            ('7c 8d 3h Ks 2d Ac 9h', 'High Card'),
+        ]
+        for text, name in cases:
+            self.assertEqual(hand_class(self.value(text)), name, text)
+
+    def test_royal_flush_is_best(self):
+        self.assertEqual(self.value('As Ks Qs Js Ts'), 1)
+
+    def test_wheel_is_lowest_straight(self):
+        self.assertGreater(self.value('Ah 2s 3d 4c 5h'), self.value('2h 3s 4d 5c 6h'))
+
+    def test_kickers_decide(self):
+        self.assertLess(self.value('Ac Ad Kh 7s 2d'), self.value('Ac Ad Qh Js Td'))
+
+    def test_seven_cards_match_best_five(self):
+        rng = random.Random(7)
+        for _ in range(500):
+            cards = rng.sample(range(52), 7)
+            best = min(evaluate(list(five)) for five in combinations(cards, 5))
+            self.assertEqual(evaluate(cards), best)
+
+    @skipUnless(np, 'numpy is not installed')
+    def test_batch_matches_single(self):
+        rng = random.Random(11)
+        hands = [rng.sample(range(52), 7) for _ in range(2000)]
+        self.assertEqual(evaluate_batch(hands).tolist(), [evaluate(hand) for hand in hands])
+
+
+class ShowdownTests(SimpleTestCase):
+    def test_best_hand_wins_pot(self):
+        table = make_table(1000, 1000)
+        table.start_hand()
+        table.seats[1].cards = tuple(parse_cards('As Ah'))
+        table.seats[2].cards = tuple(parse_cards('7c 2d'))
+        table.board_cards = parse_cards('Ad Kc 9s 4h 3s')
+        table.apply(1, 'raise', 1000)
+        payouts = table.apply(2, 'call')
+        self.assertEqual(payouts, {1: 2000})
+        self.assertEqual(table.shown[1]['hand'], 'Three of a Kind')
+
+    def test_tie_splits_pot(self):
+        table = make_table(1000, 1000)
+        table.start_hand()
+        table.seats[1].cards = tuple(parse_cards('2c 3d'))
+        table.seats[2].cards = tuple(parse_cards('2h 3s'))
+        table.board_cards = parse_cards('As Ks Qd Jc Th')
+        table.apply(1, 'raise', 1000)
+        self.assertEqual(table.apply(2, 'call'), {1: 1000, 2: 1000})
+
+    def test_short_all_in_wins_only_main_pot(self):
+        table = make_table(200, 500, 1000)
+        table.start_hand()
+        table.seats[1].cards = tuple(parse_cards('As Ah'))
+        table.seats[2].cards = tuple(parse_cards('Ks Kh'))
+        table.seats[3].cards = tuple(parse_cards('7c 2d'))
+        table.board_cards = parse_cards('Ad Kc 9s 4h 3s')
+        table.apply(1, 'raise', 200)
+        table.apply(2, 'raise', 500)
+        payouts = table.apply(3, 'call')
+        # Основной банк 3 x 200 у тузов, побочный 2 x 300 у королей
+        self.assertEqual(payouts, {1: 600, 2: 600})
+        self.assertEqual(table.seats[3].stack, 500)
+
+
+class PotsTests(SimpleTestCase):
+    def test_all_ins_build_side_pots(self):
+        pots = build_pots({'a': 100, 'b': 300, 'c': 300, 'd': 700})
+        self.assertEqual(pots, [(400, ('a', 'b', 'c', 'd')), (600, ('b', 'c', 'd')), (400, ('d',))])
+
+    def test_folded_chips_stay_in_pots_they_reached(self):
+        pots = build_pots({'a': 100, 'b': 50, 'c': 200}, folded={'a'})
+        self.assertEqual(pots, [(150, ('b', 'c')), (200, ('c',))])
+
+    def test_odd_chip_goes_first_after_button(self):
+        payouts = award_pots([(101, ('a', 'b', 'c'))], {'a': 5, 'b': 5, 'c': 9}, order=['c', 'b', 'a'])
+        self.assertEqual(payouts, {'a': 50, 'b': 51})
+
+    def test_random_betting_conserves_chips(self):
+        rng = random.Random(15)
+        for _ in range(20000):
+            players = range(rng.randint(2, 10))
+            contributions = {player: rng.choice((0, rng.randint(1, 50), rng.randint(1, 5000))) for player in players}
+            folded = {player for player in players if rng.random() < 0.3}
+            live = [player for player in players if player not in folded]
+            if not live:
+                continue
+            for player in live:
+                contributions[player] = contributions[player] or 1
+            pots = build_pots(contributions, folded)
+            self.assertEqual(sum(amount for amount, _ in pots), sum(contributions.values()))
+            for amount, eligible in pots:
+                self.assertTrue(amount > 0 and eligible)
+                self.assertFalse(folded.intersection(eligible))
+            # Претенденты каждого следующего банка — часть претендентов предыдущего
+            for (_, outer), (_, inner) in zip(pots, pots[1:]):
+                self.assertLess(set(inner), set(outer))
+
+            ranks = {player: rng.randint(1, 20) for player in live}
+            payouts = award_pots(pots, ranks, order=list(players))
+            self.assertEqual(sum(payouts.values()), sum(contributions.values()))
+            self.assertFalse(folded.intersection(payouts))
+
+
+def chi_square(counts, expected):
+    return sum((count - expected) ** 2 / expected for count in counts)
+
+
+class DeckTests(SimpleTestCase):
+    # Энтропия из сидированного генератора: тесты воспроизводимы и не зависят от ОС.
+    # Пороги хи-квадрат — уровень значимости 0.001
+    def make_deck(self, size=52, seed=16):
+        return Deck(size, entropy=random.Random(seed).randbytes, buffer_size=256)
+
+    def test_deal_returns_distinct_cards(self):
+        deck = self.make_deck()
+        for _ in range(1000):
+            cards = deck.deal(25)
+            self.assertEqual(len(set(cards)), 25)
+            self.assertEqual(sorted(deck.cards), list(range(52)))
+
+    def test_all_permutations_are_equally_likely(self):
+        deck = self.make_deck(size=4)
+        counts = {}
+        for _ in range(24000):
+            key = bytes(deck.shuffle())
+            counts[key] = counts.get(key, 0) + 1
+        self.assertEqual(len(counts), 24)
+        self.assertLess(chi_square(counts.values(), 1000), 49.73)  # 23 степени свободы
+
+    def test_every_card_is_equally_likely_in_every_dealt_position(self):
+        deck = self.make_deck()
+        counts = [[0] * 52 for _ in range(9)]
+        for _ in range(52 * 100):
+            for position, card in enumerate(deck.deal(9)):
+                counts[position][card] += 1
+        for position in counts:
+            self.assertLess(chi_square(position, 100), 87.97)  # 51 степень свободы
+
+    def test_rejects_biased_bytes(self):
+        # Для 52 карт байты от 208 дают перекос и отбрасываются
+        entropy = iter([bytes([255, 208, 53])] + [bytes(range(256))] * 10)
+        deck = Deck(entropy=lambda size: next(entropy))
+        deck.shuffle(1)
+        self.assertEqual(deck.cards[0], 1)
+
+
+class EquityTests(SimpleTestCase):
+    def test_exact_enumeration_on_the_turn(self):
+        hands = [parse_cards('As Ah'), parse_cards('Ks Kh')]
+        board = parse_cards('2c 7d 9h Kd')
+        self.assertTrue(is_exact(hands, board))
+        odds = calculate_equity(hands, board)
+        # Тузы выигрывают только с одним из двух оставшихся тузов на ривере
+        self.assertAlmostEqual(odds[0]['win'], 2 / 44)
+        self.assertAlmostEqual(odds[1]['win'], 42 / 44)
+
+    @override_settings(POKER_EQUITY_WORKERS=2)
+    def test_pool_starts_workers_without_fork(self):
+        self.addCleanup(setattr, equity, '_executor', equity._executor)
+        self.addCleanup(setattr, equity, '_workers', equity._workers)
+        equity._executor = None
+        executor = equity.get_executor()
+        self.addCleanup(executor.shutdown)
+        self.assertEqual(equity.executor_workers(), 2)
+        self.assertNotEqual(executor._mp_context.get_start_method(), 'fork')
+
+        hands = [parse_cards('As Ah'), parse_cards('Ks Kh')]
+        odds = async_to_sync(equity.equity_async)(hands, iterations=2000, time_budget=0)
+        self.assertAlmostEqual(odds[0]['win'], 0.82, delta=0.05)
+
+    def test_sampling_respects_iterations(self):
+        hands = [parse_cards('As Ah'), parse_cards('Ks Kh')]
+        wins, ties, boards = simulate_equity(hands, iterations=20000, seed=1)
+        self.assertEqual(boards, 20000)
+        self.assertAlmostEqual(wins[0] / boards, 0.82, delta=0.02)
+
+    def test_split_pot_is_a_tie(self):
+        hands = [parse_cards('2c 3d'), parse_cards('2h 3s')]
+        odds = calculate_equity(hands, parse_cards('As Ks Qd Jc Th'))
+        self.assertEqual(odds, [{'win': 0.0, 'tie': 1.0}, {'win': 0.0, 'tie': 1.0}])
+
+    def test_all_in_records_runout_board(self):
+        table = make_table(1000, 1000)
+        table.start_hand()
+        table.apply(1, 'call')
+        table.apply(2, 'check')
+        table.apply(2, 'raise', 950)
+        table.apply(1, 'call')
+        self.assertEqual(table.runout_from, 3)
+
+
+class BotTests(SimpleTestCase):
+    def test_strength_against_random_hands(self):
+        rng = random_source(20)
+        self.assertAlmostEqual(hand_strength(parse_cards('As Ad'), (), 1, 5000, rng), 0.85, delta=0.02)
+        self.assertLess(hand_strength(parse_cards('7c 2d'), (), 1, 5000, rng), 0.4)
+        # Сет на флопе против трёх соперников остаётся фаворитом
+        self.assertGreater(hand_strength(parse_cards('8c 8d'), parse_cards('8h Kd 3s'), 3, 2000, rng), 0.8)
+
+    def test_bots_play_legal_hands_without_the_database(self):
+        # SimpleTestCase падает на любом запросе к базе
+        tables = []
+        for index, policy in enumerate(['equity', 'random', 'passive'] * 4):
+            table = Table(f'bots{index}', big_blind=50, max_players=6)
+            for number in range(1, 7):
+                table.sit(number, number, f'bot{number}', 2000, bot=policy)
+            tables.append(table)
+        hands, decisions = bots.simulate(tables, 10)
+        # Колода и политики не засеяны: equity и random могут выбить игроков,
+        # и стол без соперников пропускает раздачи. Пассивные не рискуют
+        # больше блайнда и играют все десять
+        self.assertLessEqual(hands, 120)
+        self.assertEqual([table.hand_number for table in tables[2::3]], [10] * 4)
+        self.assertEqual(hands, sum(table.hand_number for table in tables))
+        self.assertGreater(decisions, hands)
+        for table in tables:
+            self.assertFalse(table.hand_in_progress)
+            self.assertEqual(sum(seat.stack for seat in table.seats.values()), 12000)
+
+    def test_policy_is_loaded_by_import_path(self):
+        self.assertIsInstance(bots.get_policy('rooms.bots.PassivePolicy'), bots.PassivePolicy)
+        with self.assertRaises(ImportError):
+            bots.get_policy('rooms.bots.MissingPolicy')
+
+
+class RoomActorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = User.objects.bulk_create(
+            User(username=f'user{index}', email=f'user{index}@example.com', balance=10000)
+            for index in range(300)
+        )
+        cls.room = Room.objects.create(max_players=10, big_blind=50)
+
+    async def make_actor(self, time_bank=0.0):
+        table = Table(str(self.room.unique_id), pk=self.room.pk, big_blind=50, max_players=10,
+                      time_bank=time_bank)
+        actor = RoomActor(table, channel_layer=InMemoryChannelLayer(), action_clock=ActionClock())
+        self.addCleanup(actor.stop)
+        return actor
+
+    async def test_concurrent_sits_take_each_seat_once(self):
+        actor = await self.make_actor()
+        results = await asyncio.gather(*(
+            actor.submit('sit', user.pk, user.username, index % 10 + 1, 1000)
+            for index, user in enumerate(self.users)
+        ), return_exceptions=True)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(len(errors), 290)
+        self.assertTrue(all(isinstance(error, ActionError) for error in errors))
+        self.assertEqual(sorted(actor.table.seats), list(range(1, 11)))
+        self.assertEqual(await RoomPlayer.objects.filter(room=self.room).acount(), 10)
+
+    async def test_concurrent_bets_keep_chips_consistent(self):
+        actor = await self.make_actor()
+        for index, user in enumerate(self.users[:3]):
+            await actor.submit('sit', user.pk, user.username, index + 1, 1000)
+        self.assertTrue(actor.table.hand_in_progress)
+
+        actions = []
+        rng = random.Random(3)
+        for _ in range(500):
+            user = rng.choice(self.users[:3])
+            action = rng.choice(['fold', 'call', 'check', 'raise'])
+            actions.append(actor.submit('action', user.pk, action, rng.choice([100, 200, 400])))
+        results = await asyncio.gather(*actions, return_exceptions=True)
+
+        self.assertTrue(any(result is None for result in results))
+        self.assertTrue(all(result is None or isinstance(result, ActionError) for result in results))
+        table = actor.table
+        self.assertEqual(sum(seat.stack for seat in table.seats.values()) + table.pot, 3000)
+
+    async def test_buy_in_and_cash_out_move_balance(self):
+        actor = await self.make_actor()
+        first, second = self.users[:2]
+        await actor.submit('sit', first.pk, first.username, 1, 6000)
+        with self.assertRaises(ActionError):
+            await actor.submit('sit', second.pk, second.username, 2, 10001)
+        # Денег не хватило — место в памяти освободилось, баланс не тронут
+        self.assertNotIn(2, actor.table.seats)
+        await second.arefresh_from_db()
+        self.assertEqual(second.balance, 10000)
+
+        # Выигрыш есть только в памяти: на баланс уходит стек стола
+        actor.table.seats[1].stack = 7500
+        await actor.submit('leave', first.pk)
+        await first.arefresh_from_db()
+        self.assertEqual(first.balance, 11500)
+        self.assertEqual(await RoomPlayer.objects.filter(room=self.room).acount(), 0)
+
+    @override_settings(POKER_ACTION_TIMEOUT=0.02)
+    async def test_stalled_player_is_folded_after_time_bank(self):
+        actor = await self.make_actor(time_bank=0.03)
+        for index, user in enumerate(self.users[:2]):
+            await actor.submit('sit', user.pk, user.username, index + 1, 1000)
+        table = actor.table
+        first = table.seats[table.current_player]
+
+        await asyncio.sleep(0.02)
+        self.assertEqual(table.hand_number, 1)  # банк времени ещё не истрачен
+        while table.hand_number == 1:
+            await asyncio.sleep(0.01)
+        # На префлопе перед игроком ставка большого блайнда — автоматический фолд
+        self.assertEqual(first.time_bank, 0)
+        # Следующая раздача уже началась, её блайнд лежит в current_bet
+        self.assertEqual(first.stack + first.current_bet, 975)
+        self.assertEqual(sum(seat.stack for seat in table.seats.values()) + table.pot, 2000)
+
+    async def test_broadcasts_carry_frames_and_hole_cards_per_seat(self):
+        actor = await self.make_actor()
+        layer = actor.channel_layer
+        watcher = await layer.new_channel()
+        await layer.group_add(actor.group_name, watcher)
+        first, second = self.users[:2]
+        await actor.submit('sit', first.pk, first.username, 1, 1000)
+        await actor.submit('sit', second.pk, second.username, 2, 1000)
+
+        event = await layer.receive(watcher)
+        while event['type'] != 'game_start':
+            self.assertNotIn('message', event)  # в событии только готовые кадры
+            event = await layer.receive(watcher)
+        # Общий кадр без карт — его получают зрители; у каждого места свой
+        self.assertNotIn('cards', json.loads(event['frames']['text']))
+        self.assertEqual(sorted(event['private']), ['1', '2'])
+        for number, frames in event['private'].items():
+            cards = json.loads(frames['text'])['cards']
+            self.assertEqual(cards, [card_str(value) for value in actor.table.seats[int(number)].cards])
+
+    @override_settings(POKER_SPECTATOR_RATE=20)
+    async def test_spectators_get_coalesced_public_state(self):
+        actor = await self.make_actor()
+        layer = actor.channel_layer
+        watcher = await layer.new_channel()
+        await layer.group_add(spectator_group(actor.room_id), watcher)
+        first, second = self.users[:2]
+        await actor.submit('sit', first.pk, first.username, 1, 1000)
+        await actor.submit('sit', second.pk, second.username, 2, 1000)
+        table = actor.table
+        for _ in range(3):
+            seat = table.seats[table.current_player]
+            await actor.submit('action', seat.user_id, *bots.decide(table, seat, bots.PassivePolicy()))
+
+        # Шесть версий стола — зрителю не больше двух рассылок, последняя актуальна
+        updates = []
+        while not updates or updates[-1]['version'] != table.version:
+            event = await asyncio.wait_for(layer.receive(watcher), 1)
+            self.assertNotIn('cards', event['frames']['text'])
+            updates.append(json.loads(event['frames']['text']))
+        self.assertEqual(table.version, 6)
+        self.assertLessEqual(len(updates), 2)
+        self.assertEqual(updates[-1]['state'], table.state())
+
+    @override_settings(POKER_RESUME_BUFFER=4)
+    async def test_resume_replays_only_missed_events(self):
+        actor = await self.make_actor()
+        first, second = self.users[:2]
+        await actor.submit('sit', first.pk, first.username, 1, 1000)
+        seen = await actor.submit('snapshot', first.pk)
+
+        await actor.submit('sit', second.pk, second.username, 2, 1000)
+        resumed = await actor.submit('resume', first.pk, seen['session'], seen['version'])
+        types = [event['type'] for event in resumed['events']]
+        self.assertEqual(types, ['player_join', 'game_update', 'game_start', 'game_update'])
+        self.assertEqual(json.loads(resumed['events'][1]['frames']['text'])['version'], seen['version'] + 1)
+        self.assertEqual(resumed['seq'], resumed['events'][-1]['seq'])
+
+        # Пропуск длиннее буфера или чужая сессия — только снимок
+        await actor.submit('action', actor.table.seats[actor.table.current_player].user_id, 'call', 0)
+        resumed = await actor.submit('resume', first.pk, seen['session'], seen['version'])
+        self.assertNotIn('events', resumed)
+        self.assertEqual(resumed['version'], actor.table.version)
+        resumed = await actor.submit('resume', first.pk, 'other', actor.table.version)
+        self.assertNotIn('events', resumed)
+
+    @override_settings(POKER_BOT_DELAY=0)
+    async def test_bot_seat_answers_without_a_connection(self):
+        actor = await self.make_actor()
+        human = self.users[0]
+        bot = await sync_to_async(bots.create_bot_users)(1, 5000)
+        await actor.submit('sit', human.pk, human.username, 1, 1000)
+        with self.assertRaises(ActionError):
+            await actor.submit('add_bot', bot[0].pk, bot[0].username, 2, 1000, 'no.such.Policy')
+        await actor.submit('add_bot', bot[0].pk, bot[0].username, 2, 1000, 'passive')
+        table = actor.table
+        self.assertEqual(table.seats[2].bot, 'passive')
+
+        # Хедз-ап: человек на баттоне ходит первым, бот отвечает сам
+        queries = metrics.command_queries.get(command='bot')
+        await actor.submit('action', human.pk, 'call', 0)
+        while table.current_player != 1:
+            await asyncio.sleep(0.001)
+        self.assertEqual(table.betting_round, 'flop')
+        self.assertEqual(table.seats[2].last_action, 'check')
+        self.assertEqual(metrics.command_queries.get(command='bot'), queries)
+        self.assertEqual((await RoomPlayer.objects.aget(user=bot[0])).seat_number, 2)
+
+    @override_settings(POKER_HISTORY_BATCH_SIZE=1)
+    async def test_failed_history_write_does_not_stall_the_table(self):
+        async def broken_flush():
+            raise DatabaseError('database is down')
+
+        history.pending.clear()
+        self.addCleanup(history.pending.clear)
+        self.addCleanup(setattr, history, 'flush', history.flush)
+        history.flush = broken_flush
+        actor = await self.make_actor()
+        for index, user in enumerate(self.users[:2]):
+            await actor.submit('sit', user.pk, user.username, index + 1, 1000)
+        table = actor.table
+        with self.assertLogs('rooms.actor', 'ERROR'):
+            await actor.submit('action', table.seats[table.current_player].user_id, 'fold', 0)
+        # Раздача записана в буфер, а следующая уже началась
+        self.assertEqual(len(history.pending), 1)
+        self.assertEqual(table.hand_number, 2)
+        self.assertTrue(table.hand_in_progress)
+
+    async def test_stopped_actor_fails_waiting_commands(self):
+        actor = await self.make_actor()
+        pending = [asyncio.ensure_future(actor.submit('snapshot', self.users[0].pk)) for _ in range(2)]
+        await asyncio.sleep(0)  # команды в очереди, актор их ещё не взял
+        actor.stop()
+        for task in pending:
+            with self.assertRaises(RoomMoved):
+                await asyncio.wait_for(task, 1)
+
+    @override_settings(POKER_BOT_DELAY=0)
+    async def test_failed_bot_move_falls_back_to_timeout(self):
+        class BrokenPolicy(bots.Policy):
+            def decide(self, view):
+                raise RuntimeError('broken policy')
+
+        bots._policies['broken'] = BrokenPolicy()
+        self.addCleanup(bots._policies.pop, 'broken')
+        actor = await self.make_actor()
+        human = self.users[0]
+        bot = await sync_to_async(bots.create_bot_users)(1, 5000)
+        await actor.submit('sit', human.pk, human.username, 1, 1000)
+        await actor.submit('add_bot', bot[0].pk, bot[0].username, 2, 1000, 'broken')
+        table = actor.table
+
+        with self.assertLogs('rooms.actor', 'ERROR') as logs:
+            await actor.submit('action', human.pk, 'call', 0)
+            while table.current_player != 1:
+                await asyncio.sleep(0.001)
+        self.assertIn('bot failed', logs.output[0])
+        # Ход не завис: за бота сходил таймаут
+        self.assertEqual(table.betting_round, 'flop')
+        self.assertEqual(table.seats[2].last_action, 'check')
+
+
+class ActionClockTests(SimpleTestCase):
+    async def test_one_scheduler_serves_many_tables(self):
+        clock = ActionClock()
+        fired = []
+        for key in range(20000):
+            clock.schedule(key, (key % 50) / 1000, partial(fired.append, key))
+        # Перезаводим и отменяем половину: старые записи не копятся в куче
+        for key in range(0, 20000, 2):
+            clock.schedule(key, 0.06, partial(fired.append, -key))
+            self.assertLessEqual(len(clock.heap), 2 * len(clock.timers) + 64)
+        for key in range(0, 20000, 4):
+            clock.cancel(key)
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(clock), 0)
+        self.assertEqual(sorted(fired), sorted(
+            [key for key in range(1, 20000, 2)] + [-key for key in range(2, 20000, 4)]))
+        self.assertEqual(clock.heap, [])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ShardingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = User.objects.bulk_create(
+            User(username=f'user{index}', email=f'user{index}@example.com', balance=10000)
+            for index in range(30)
+        )
+        cls.rooms = [Room.objects.create(max_players=10, big_blind=50) for _ in range(6)]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(history.pending.clear)
+
+    async def start_workers(self, count):
+        layer = InMemoryChannelLayer()
+        workers = [sharding.Worker(layer, worker_id=f'worker{index}') for index in range(count)]
+        for worker in workers:
+            await worker.start()
+        # Первые процессы узнают о следующих на ближайшем пульсе
+        for worker in workers:
+            await worker.heartbeat()
+        return workers
+
+    def test_ring_moves_few_rooms_when_a_worker_joins(self):
+        keys = [f'room{index}' for index in range(3000)]
+        before = sharding.HashRing(['a', 'b', 'c'])
+        after = sharding.HashRing(['a', 'b', 'c', 'd'])
+        owners = [before.owner(key) for key in keys]
+        for node in 'abc':
+            self.assertGreater(owners.count(node), 600)
+        moved = [key for key, owner in zip(keys, owners) if after.owner(key) != owner]
+        # Переезжают только столы, доставшиеся новому процессу
+        self.assertTrue(all(after.owner(key) == 'd' for key in moved))
+        self.assertLess(len(moved), 1200)
+
+    async def test_commands_from_any_worker_reach_one_owner(self):
+        workers = await self.start_workers(3)
+        try:
+            for room in self.rooms:
+                room_id = str(room.unique_id)
+                results = await asyncio.gather(*(
+                    workers[index % 3].submit(room_id, 'sit', user.pk, user.username, index % 10 + 1, 1000)
+                    for index, user in enumerate(self.users)
+                ), return_exceptions=True)
+                self.assertEqual(sum(result is None for result in results), 10)
+                self.assertTrue(all(result is None or isinstance(result, ActionError) for result in results))
+
+                owners = [worker for worker in workers if room_id in worker.rooms]
+                self.assertEqual(len(owners), 1)
+                seated = self.users[results.index(None)]
+                snapshot = await workers[0].submit(room_id, 'snapshot', seated.pk)
+                self.assertEqual(len(snapshot['state']['players']), 10)
+                self.assertIsNotNone(snapshot['seat'])
+            # Столы разошлись по процессам
+            self.assertGreater(sum(1 for worker in workers if worker.rooms), 1)
+        finally:
+            for worker in workers:
+                await worker.stop()
+
+    async def test_table_moves_when_owner_stops(self):
+        workers = await self.start_workers(2)
+        room_id = str(self.rooms[0].unique_id)
+        try:
+            user = self.users[0]
+            await workers[0].submit(room_id, 'sit', user.pk, user.username, 4, 1000)
+            owner, other = workers if room_id in workers[0].rooms else workers[::-1]
+
+            await owner.stop()
+            await other.heartbeat()
+            snapshot = await other.submit(room_id, 'snapshot', user.pk)
+            self.assertIn(room_id, other.rooms)
+            self.assertEqual(snapshot['seat'], 4)
+        finally:
+            for worker in workers:
+                await worker.stop()
+
+    async def test_commands_waiting_on_a_released_table_go_to_the_new_owner(self):
+        workers = await self.start_workers(2)
+        room_id = str(self.rooms[0].unique_id)
+        try:
+            user = self.users[0]
+            await workers[0].submit(room_id, 'sit', user.pk, user.username, 4, 1000)
+            owner, other = workers if room_id in workers[0].rooms else workers[::-1]
+
+            # Аренду перехватили, пока команды стояли в очереди актора
+            await cache.aset(sharding.lease_key(room_id), other.worker_id, 60)
+            pending = [asyncio.ensure_future(owner.submit(room_id, 'snapshot', user.pk)) for _ in range(2)]
+            await asyncio.sleep(0)
+            await owner.release(room_id, flush=False)
+            for snapshot in await asyncio.wait_for(asyncio.gather(*pending), 5):
+                self.assertEqual(snapshot['seat'], 4)
+            self.assertIn(room_id, other.rooms)
+        finally:
+            for worker in workers:
+                await worker.stop()
+
+    async def test_worker_refuses_a_local_cache_across_processes(self):
+        class SharedLayer:
+            """Слой каналов между процессами (как Redis)."""
+
+        with self.assertRaises(ImproperlyConfigured):
+            await sharding.Worker(SharedLayer()).start()
+
+    async def test_unknown_room_is_reported_through_the_owner(self):
+        workers = await self.start_workers(2)
+        try:
+            for worker in workers:
+                with self.assertRaises(ObjectDoesNotExist):
+                    await worker.submit('00000000-0000-0000-0000-000000000000', 'snapshot', None)
+            self.assertFalse(any(worker.rooms for worker in workers))
+        finally:
+            for worker in workers:
+                await worker.stop()
+
+
+class TournamentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = User.objects.bulk_create(
+            User(username=f'entrant{index}', email=f'entrant{index}@example.com') for index in range(60)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(history.pending.clear)
+
+    def make_tournament(self, entrants, table_size):
+        tournament = Tournament.objects.create(name='cup', table_size=table_size, starting_stack=1000,
+                                               level_duration=60, blind_schedule=[50, 100, 200])
+        TournamentEntry.objects.bulk_create(
+            TournamentEntry(tournament=tournament, user=user) for user in self.users[:entrants])
+        return tournament
+
+    def test_plan_breaks_emptiest_tables_and_evens_the_rest(self):
+        self.assertEqual(tournaments.plan_balance({1: 9, 2: 9, 3: 3}, 9), ([(1, 3, 2), (2, 3, 2)], []))
+        self.assertEqual(tournaments.plan_balance({1: 5, 2: 4, 3: 2}, 9), ([(3, 1, 1), (3, 2, 1)], [3]))
+
+    def test_plan_scales_to_thousands_of_entrants(self):
+        rng = random.Random(19)
+        counts = {room: rng.randint(0, 9) for room in range(1000)}
+        total = sum(counts.values())
+        moves, broken = tournaments.plan_balance(counts, 9)
+        for source, target, count in moves:
+            counts[source] -= count
+            counts[target] += count
+        active = [count for room, count in counts.items() if room not in broken]
+        self.assertEqual(len(active), -(-total // 9))
+        self.assertLessEqual(max(active) - min(active), 1)
+        self.assertEqual(sum(counts[room] for room in broken), 0)
+
+    def test_blind_level_follows_the_clock(self):
+        tournament = self.make_tournament(2, 9)
+        tournament.started_at = timezone.now()
+        self.assertEqual(tournaments.big_blind_at(tournament, tournament.started_at), 50)
+        self.assertEqual(tournaments.big_blind_at(tournament, tournament.started_at + timedelta(seconds=90)), 100)
+        self.assertEqual(tournaments.big_blind_at(tournament, tournament.started_at + timedelta(hours=5)), 200)
+
+    def test_moves_are_written_in_one_batch(self):
+        tournament = self.make_tournament(60, 10)
+        rooms = tournaments.seat_entrants(tournament)
+        self.assertEqual([room.players.count() for room in rooms], [10] * 6)
+
+        def move(count, first_seat):
+            players = RoomPlayer.objects.filter(room=rooms[0]).order_by('pk')[:count]
+            return [(player.pk, rooms[1].pk, first_seat + index, 900) for index, player in enumerate(players)]
+
+        # Число запросов не зависит от числа пересаживаемых
+        few = move(2, 11)
+        with self.assertNumQueries(3):
+            tournaments.apply_changes(tournament, few, [], 60, [])
+        many = move(8, 13)
+        with self.assertNumQueries(3):
+            tournaments.apply_changes(tournament, many, [], 60, [])
+        self.assertEqual(RoomPlayer.objects.filter(room=rooms[1]).count(), 20)
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    async def test_director_eliminates_and_breaks_a_table(self):
+        tournament = await sync_to_async(self.make_tournament)(10, 4)
+        rooms = await sync_to_async(tournaments.seat_entrants)(tournament)
+        worker = sharding.Worker(InMemoryChannelLayer(), worker_id='director')
+        await worker.start()
+        try:
+            director = tournaments.Director(tournament.pk, worker)
+
+            # Столы 4, 3, 3 уже ровные — шаг ничего не меняет
+            self.assertFalse(await director.tick())
+            tables = {room.pk: store.tables[str(room.unique_id)] for room in rooms}
+            self.assertEqual(sorted(len(table.seats) for table in tables.values()), [3, 3, 4])
+
+            # На одном из малых столов двое проиграли всё: стол закрывается,
+            # оставшегося пересаживают за другой малый
+            small, other = [pk for pk, table in tables.items() if len(table.seats) == 3]
+            seats = sorted(tables[small].seats.values(), key=lambda seat: seat.number)
+            for seat in seats[:2]:
+                seat.stack = 0
+            survivor = seats[2]
+            self.assertFalse(await director.tick())
+
+            self.assertEqual(len(tables[small].seats), 0)
+            self.assertEqual(len(tables[other].seats), 4)
+            self.assertIsNotNone(tables[other].seat_for(survivor.user_id))
+            player = await RoomPlayer.objects.aget(pk=survivor.player_id)
+            self.assertEqual(player.room_id, other)
+            self.assertFalse((await Room.objects.aget(pk=small)).is_active)
+            places = [entry.place async for entry in TournamentEntry.objects.filter(
+                tournament=tournament, place__isnull=False).order_by('place')]
+            self.assertEqual(places, [9, 10])
+
+            # Сесть или уйти самому за турнирный стол нельзя
+            with self.assertRaises(ActionError):
+                await worker.submit(str(rooms[0].unique_id), 'leave', survivor.user_id)
+        finally:
+            await worker.stop()
+
+    async def start_full_tables(self):
+        """27 игроков за тремя полными столами; трое за первым проиграли всё."""
+        tournament = await sync_to_async(self.make_tournament)(27, 9)
+        rooms = await sync_to_async(tournaments.seat_entrants)(tournament)
+        director = tournaments.Director(tournament.pk, sharding.Worker(InMemoryChannelLayer(), worker_id='director'))
+        await director.worker.start()
+        self.assertFalse(await director.tick())
+        tables = [store.tables[str(room.unique_id)] for room in rooms]
+        self.assertEqual([len(table.seats) for table in tables], [9, 9, 9])
+        for seat in sorted(tables[0].seats.values(), key=lambda seat: seat.number)[:3]:
+            seat.stack = 0
+        return tournament, director, tables
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    async def test_players_move_into_seats_of_the_busted(self):
+        tournament, director, tables = await self.start_full_tables()
+        try:
+            # Пересаживают за тот же стол, с которого снимают вылетевших
+            self.assertFalse(await director.tick())
+            self.assertEqual([len(table.seats) for table in tables], [8, 8, 8])
+            self.assertEqual(await RoomPlayer.objects.filter(room__tournament=tournament).acount(), 24)
+            for seat in tables[0].seats.values():
+                player = await RoomPlayer.objects.aget(pk=seat.player_id)
+                self.assertEqual((player.room_id, player.seat_number), (tables[0].pk, seat.number))
+            places = [entry.place async for entry in TournamentEntry.objects.filter(
+                tournament=tournament, place__isnull=False).order_by('place')]
+            self.assertEqual(places, [25, 26, 27])
+        finally:
+            await director.worker.stop()
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    async def test_failed_step_puts_players_back(self):
+        tournament, director, tables = await self.start_full_tables()
+        before = [{seat.number: seat.user_id for seat in table.seats.values()} for table in tables]
+
+        def broken_apply_changes(*args):
+            raise RuntimeError('database is down')
+
+        self.addCleanup(setattr, tournaments, 'apply_changes', tournaments.apply_changes)
+        tournaments.apply_changes = broken_apply_changes
+        try:
+            with self.assertRaises(RuntimeError):
+                await director.tick()
+            self.assertEqual([{seat.number: seat.user_id for seat in table.seats.values()} for table in tables],
+                             before)
+            self.assertEqual(await RoomPlayer.objects.filter(room__tournament=tournament).acount(), 27)
+        finally:
+            await director.worker.stop()
+
+
+class HotQueryTests(TestCase):
+    """Число запросов и планы горячих путей комнаты не должны незаметно расти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        users = User.objects.bulk_create(
+            User(username=f'hot{index}', email=f'hot{index}@example.com') for index in range(3)
+        )
+        cls.room = Room.objects.create(max_players=3, big_blind=50)
+        RoomPlayer.objects.bulk_create(
+            RoomPlayer(room=cls.room, user=user, seat_number=index + 1, stack=1000)
+            for index, user in enumerate(users)
+        )
+
+    def setUp(self):
+        self.addCleanup(store.tables.clear)
+
+    def test_room_page_reads_seat_map_in_one_join(self):
+        # Комната и места с именами игроков — сколько бы игроков ни сидело
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/rooms/{self.room.unique_id}/')
+        self.assertContains(response, 'hot0')
+
+    def test_table_load_is_three_queries(self):
+        with self.assertNumQueries(3):  # комната, места с игроками, номер последней раздачи
+            table = async_to_sync(store.load_table)(str(self.room.unique_id))
+        self.assertEqual(len(table.seats), 3)
+
+    def test_actions_do_not_touch_the_database(self):
+        # Ход меняет только стол в памяти; рассылка изменений тоже
+        async def play():
+            actor = RoomActor(await store.get_table(str(self.room.unique_id)),
+                              channel_layer=InMemoryChannelLayer(), action_clock=ActionClock())
+            try:
+                await actor.submit('hold', False)
+                table = actor.table
+                for _ in range(3):
+                    seat = table.seats[table.current_player]
+                    action, amount = bots.decide(table, seat, bots.PassivePolicy())
+                    await actor.submit('action', seat.user_id, action, amount)
+            finally:
+                actor.stop()
+
+        before = metrics.command_queries.get(command='action')
+        async_to_sync(play)()
+        self.assertEqual(metrics.command_queries.get(command='action'), before)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output is checked in the SQLite format')
+    def test_seat_map_is_an_index_search(self):
+        seat_map = RoomPlayer.objects.filter(room=self.room).select_related('user').only(
+            'seat_number', 'stack', 'role', 'user', 'user__username')
+        plan = seat_map.explain()
+        self.assertRegex(plan, r'SEARCH rooms_roomplayer USING INDEX \S+ \(room_id=\?\)')
+        self.assertIn('SEARCH users_customuser USING INTEGER PRIMARY KEY', plan)
+        # Номер последней раздачи — по уникальному индексу (room, hand_number), без сортировки
+        plan = HandHistory.objects.filter(room=self.room).order_by('-hand_number').explain()
+        self.assertRegex(plan, r'SEARCH rooms_handhistory USING (COVERING )?INDEX')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class WriteBehindTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        users = User.objects.bulk_create(
+            User(username=f'user{index}', email=f'user{index}@example.com') for index in range(6)
+        )
+        cls.rooms = [Room.objects.create(max_players=10, big_blind=50) for _ in range(3)]
+        cls.players = [
+            RoomPlayer.objects.create(user=user, room=cls.rooms[index // 2], seat_number=index % 2 + 1, stack=1000)
+            for index, user in enumerate(users)
+        ]
+
+    def setUp(self):
+        self.addCleanup(store._journaled.clear)
+        store._lease_renewed = None
+        self.journal_path = f'{self.enterContext(tempfile.TemporaryDirectory())}/tables.journal'
+        self.enterContext(override_settings(POKER_JOURNAL_PATH=self.journal_path))
+
+    def load_tables(self):
+        tables = []
+        for room in self.rooms:
+            table = Table(str(room.unique_id), pk=room.pk, big_blind=50)
+            for player in self.players:
+                if player.room_id == room.pk:
+                    table.sit(player.seat_number, player.user_id, f'user{player.user_id}', 1000,
+                              player_id=player.pk)
+            table.start_hand()
+            store.tables[table.room_id] = table
+            self.addCleanup(store.tables.pop, table.room_id, None)
+            tables.append(table)
+        return tables
+
+    def test_dirty_tables_flush_in_one_update_per_model(self):
+        tables = self.load_tables()
+        for table in tables:
+            async_to_sync(store.journal_table)(table)
+        flushes, sized = metrics.flushes.get(), metrics.flush_rows.count()
+        with self.assertNumQueries(2):
+            async_to_sync(store.flush_all)()
+        self.assertEqual(store.stats['last_rows'], 9)
+        self.assertEqual(metrics.flushes.get(), flushes + 1)
+        self.assertEqual(metrics.flush_rows.count(), sized + 1)
+
+        stacks = dict(RoomPlayer.objects.values_list('pk', 'stack'))
+        for table in tables:
+            room = Room.objects.get(pk=table.pk)
+            self.assertEqual(room.current_player, table.current_player)
+            self.assertTrue(room.flag_is_started)
+            for seat in table.seats.values():
+                self.assertEqual(stacks[seat.player_id], seat.stack)
+        # Записанное в базу из журнала уже не нужно
+        self.assertEqual(store.get_journal().recover_records(), [])
+
+        with self.assertNumQueries(0):
+            async_to_sync(store.flush_all)()
+
+    def test_journal_restores_chips_after_a_crash(self):
+        table = self.load_tables()[0]
+        seat = table.seats[table.current_player]
+        table.apply(seat.user_id, 'raise', 300)
+        async_to_sync(store.journal_table)(table)
+
+        # Процесс упал до сброса: база ещё со старыми стеками
+        self.assertEqual(RoomPlayer.objects.get(pk=seat.player_id).stack, 1000)
+        crashed, crashed_id = store.get_journal(), store.PROCESS_ID
+        store.tables.clear()
+        self.addCleanup(setattr, store, 'PROCESS_ID', crashed_id)
+        store.PROCESS_ID = 'restarted'
+        # Пока аренда журнала жива, его не трогает никто
+        async_to_sync(store.recover)()
+        self.assertEqual(RoomPlayer.objects.get(pk=seat.player_id).stack, 1000)
+
+        cache.delete(store.journal_lease_key(crashed_id))
+        with self.assertLogs('rooms.store', 'WARNING'):
+            async_to_sync(store.recover)()
+        self.assertEqual(RoomPlayer.objects.get(pk=seat.player_id).stack, seat.stack)
+        self.assertEqual(Room.objects.get(pk=table.pk).pot, table.pot)
+        self.assertEqual(crashed.recover_records(), [])
+
+        # Раздача не доиграна: при загрузке вклады в банк вернулись в стеки
+        loaded = async_to_sync(store.load_table)(table.room_id)
+        self.assertEqual(loaded.pot, 0)
+        self.assertEqual(sum(seat.stack for seat in loaded.seats.values()), 2000)
+        self.assertEqual(loaded.seats[seat.number].stack, 1000)
+        with self.assertNumQueries(2):
+            store.tables[table.room_id] = loaded
+            async_to_sync(store.flush_all)()
+        self.assertEqual(sorted(RoomPlayer.objects.filter(room_id=table.pk).values_list('stack', 'total_bet')),
+                         [(1000, 0), (1000, 0)])
+        self.assertFalse(Room.objects.get(pk=table.pk).flag_is_started)
+
+    def test_journal_path_is_per_process(self):
+        self.assertEqual(str(store.get_journal().path), f'{self.journal_path}.{store.PROCESS_ID}')
+
+    def test_failed_flush_keeps_rotated_journal(self):
+        journal = Journal(self.journal_path)
+
+        async def append_and_rotate(room):
+            await journal.append({'room': room, 'fields': None, 'players': []})
+            await journal.rotate()
+
+        async_to_sync(append_and_rotate)(1)
+        # Второй сброс без discard: отложенные записи дописываются к старым
+        async_to_sync(append_and_rotate)(2)
+        self.assertEqual([record['room'] for record in journal.recover_records()], [1, 2])
+        journal.discard()
+        self.assertEqual(journal.recover_records(), [])
+
+    def test_rotate_splits_records_at_the_call(self):
+        journal = Journal(self.journal_path)
+
+        async def rotate_between_appends():
+            # Записи ещё в очереди писателя, а отметка уже разделила их
+            first = asyncio.ensure_future(journal.append({'room': 1, 'fields': None, 'players': []}))
+            await asyncio.sleep(0)
+            rotated = journal.rotate()
+            second = asyncio.ensure_future(journal.append({'room': 2, 'fields': None, 'players': []}))
+            await asyncio.gather(first, rotated, second)
+
+        async_to_sync(rotate_between_appends)()
+        journal.discard()
+        self.assertEqual([record['room'] for record in journal.recover_records()], [2])
+
+
+class HandHistoryTests(TestCase):
+    def setUp(self):
+        history.pending.clear()
+        self.addCleanup(history.pending.clear)
+
+    def play_hand(self, table, seed):
+        """Случайная раздача; возвращает состояние стола после каждого действия."""
+        rng = random.Random(seed)
+        table.start_hand()
+        states = [table.state()]
+        while table.hand_in_progress:
+            seat = table.seats[table.current_player]
+            action = rng.choice(['fold', 'call', 'check', 'raise', 'raise'])
+            try:
+                table.apply(seat.user_id, action, table.current_bet + rng.choice([50, 100, 300]))
+            except ActionError:
+                continue
+            states.append(table.state())
+        return states
+
+    def test_replay_matches_live_table_at_every_step(self):
+        for seed in range(10):
+            table = make_table(1000, 1500, 800, 2000)
+            states = self.play_hand(table, seed)
+            events = history.parse_events(
+                '\n'.join(json.dumps(event) for event in table.events))
+            self.assertEqual(events[-1]['type'], 'end')
+            for step, state in enumerate(states):
+                self.assertEqual(history.replay(events, step).state(), state)
+
+    async def test_finished_hands_are_written_in_one_batch(self):
+        room = await Room.objects.acreate(max_players=10, big_blind=50)
+        table = make_table(1000, 1000, 1000)
+        table.pk = room.pk
+        for seed in range(3):
+            await asyncio.to_thread(self.play_hand, table, seed)
+            history.record(table)
+        self.assertEqual(len(history.pending), 3)
+
+        self.assertEqual(await history.flush(), 3)
+        self.assertEqual(history.pending, [])
+        self.assertEqual(await HandHistory.objects.filter(room=room).acount(), 3)
+        self.assertEqual(await history.last_hand_number(room.pk), 3)
+
+        replayed = await history.replay_hand(room.unique_id, 2)
+        self.assertEqual(replayed.hand_number, 2)
+        self.assertIsNone(replayed.betting_round)
+
+    async def test_failed_flush_keeps_hands_for_the_next_one(self):
+        room = await Room.objects.acreate(max_players=10, big_blind=50)
+        table = make_table(1000, 1000, 1000)
+        table.pk = room.pk
+        await asyncio.to_thread(self.play_hand, table, 0)
+        history.record(table)
+
+        async def broken_bulk_create(*args, **kwargs):
+            raise DatabaseError('database is down')
+
+        HandHistory.objects.abulk_create = broken_bulk_create
+        try:
+            with self.assertRaises(DatabaseError):
+                await history.flush()
+        finally:
+            del HandHistory.objects.abulk_create
+        self.assertEqual(len(history.pending), 1)
+        self.assertEqual(await history.flush(), 1)
+        self.assertEqual(await HandHistory.objects.filter(room=room).acount(), 1)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_text_exposition_format(self):
+        registry = list(metrics.registry)
+        self.addCleanup(setattr, metrics, 'registry', registry)
+        counter = metrics.Counter('test_events_total', 'Events', labels=('kind',))
+        histogram = metrics.Histogram('test_seconds', 'Latency', buckets=(0.1, 1.0))
+        counter.inc(kind='a "quoted"')
+        counter.inc(2, kind='b')
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+
+        lines = metrics.render().splitlines()
+        self.assertIn('# TYPE test_events_total counter', lines)
+        self.assertIn('test_events_total{kind="a \\"quoted\\""} 1', lines)
+        self.assertIn('test_events_total{kind="b"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count 3', lines)
+
+
+class ProtocolTests(SimpleTestCase):
+    def test_negotiate_prefers_client_order(self):
+        self.assertEqual(negotiate(['chat', 'pypoker.bin', 'pypoker.json'])[0], 'pypoker.bin')
+        name, codec = negotiate([])
+        self.assertIsNone(name)
+        self.assertIsInstance(codec, JsonCodec)
+
+    def test_binary_update_round_trip(self):
+        table = make_table(1000, 1000, 1000)
+        table.diff()
+        table.start_hand()
+        message = dict(table.diff(), action='update_game')
+        frame = BinaryCodec().frame(message)
+        self.assertEqual(decode_update(frame['bytes_data']), message)
+
+    def test_binary_update_keeps_long_cyrillic_names(self):
+        table = Table('room', big_blind=50)
+        name = 'Ё' * 150  # предел длины имени пользователя — 300 байт в UTF-8
+        table.sit(1, 1, name, 1000)
+        table.sit(2, 2, 'player2', 1000)
+        table.start_hand()
+        message = dict(table.diff(), action='update_game')
+        decoded = decode_update(BinaryCodec().frame(message)['bytes_data'])
+        self.assertEqual(decoded['seats']['1']['username'], name)
+        self.assertEqual(decoded, message)
+
+    def test_binary_codec_falls_back_to_json(self):
+        frame = BinaryCodec().frame({'action': 'snapshot', 'version': 1, 'state': {}})
+        self.assertIn('text_data', frame)
+
+    def test_broadcast_benchmark_runs(self):
+        out = io.StringIO()
+        call_command('bench_broadcast', '--seats', '2', '--spectators', '0', '3', '--broadcasts', '5', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)  # заголовок и две строки замера
+
+    def test_broadcast_frames_match_per_connection_encoding(self):
+        table = make_table(1000, 1000, 1000)
+        table.diff()
+        table.start_hand()
+        update = dict(table.diff(), action='update_game')
+        for message in (update, dict(update, equity={}), {'action': 'hand_end', 'board': []}):
+            frames = encode_frames(message)
+            for codec in CODECS.values():
+                self.assertEqual(codec.forward(frames), codec.frame(message))
+
+
+class BackpressureTests(SimpleTestCase):
+    def test_token_bucket_allows_burst_then_rate(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2, burst=3, clock=lambda: now[0])
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+        now[0] = 0.5  # за полсекунды — один токен
+        self.assertEqual([bucket.take() for _ in range(2)], [True, False])
+        now[0] = 100
+        self.assertEqual(sum(bucket.take() for _ in range(10)), 3)
+
+    async def make_outbox(self, resync=None, size=4, timeout=1):
+        # Писатель застревает на первом кадре, пока тест его не отпустит
+        self.sent, self.slow, self.release = [], [], asyncio.Event()
+
+        async def send(text_data=None, bytes_data=None):
+            await self.release.wait()
+            self.sent.append(text_data)
+
+        async def on_slow():
+            self.slow.append(True)
+
+        outbox = Outbox(send, on_slow, size, timeout, resync)
+        self.addCleanup(outbox.stop)
+        outbox.put({'text_data': 'first'})
+        await asyncio.sleep(0)
+        return outbox
+
+    async def drain(self, outbox):
+        self.release.set()
+        while outbox.frames:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    async def test_stale_updates_are_replaced_by_one_snapshot(self):
+        async def resync():
+            self.sent.append('snapshot')
+
+        outbox = await self.make_outbox(resync)
+        coalesced = metrics.dropped_frames.get(reason='coalesced')
+        outbox.put({'text_data': 'join'})
+        for version in range(10):
+            outbox.put({'text_data': f'update {version}'}, update=True)
+        outbox.put({'text_data': 'hand_end'})
+        self.assertLessEqual(len(outbox.frames), 4)
+        await self.drain(outbox)
+        # Три изменения выброшены при переполнении, остальные — пока снимок в очереди
+        self.assertEqual(self.sent, ['first', 'join', 'snapshot', 'hand_end'])
+        self.assertEqual(metrics.dropped_frames.get(reason='coalesced'), coalesced + 10)
+        self.assertEqual(self.slow, [])
+
+    async def test_spectator_keeps_only_the_newest_state(self):
+        outbox = await self.make_outbox()
+        for version in range(10):
+            outbox.put({'text_data': f'state {version}'}, update=True)
+        await self.drain(outbox)
+        self.assertEqual(self.sent[0], 'first')
+        self.assertEqual(self.sent[-1], 'state 9')
+        self.assertLessEqual(len(self.sent), 5)
+
+    async def test_reader_that_stops_reading_is_given_up(self):
+        outbox = await self.make_outbox()
+        for index in range(5):
+            outbox.put({'text_data': f'join {index}'})  # выбросить нечего
+        await asyncio.sleep(0)
+        self.assertEqual(self.slow, [True])
+
+        # Отправка первого кадра зависла дольше timeout — это замечает следующий кадр
+        outbox = await self.make_outbox(timeout=0.01)
+        outbox.put({'text_data': 'join'})
+        await asyncio.sleep(0.02)
+        outbox.put({'text_data': 'leave'})
+        await asyncio.sleep(0)
+        self.assertEqual(self.slow, [True])
+        self.assertTrue(outbox.slow)
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class RoomConsumerTests(TestCase):
+    async def receive_until(self, client, action):
+        while True:
+            message = await client.receive()
+            if message.get('action') == action:
+                return message
+
+    async def test_seat_is_cached_and_actions_skip_the_database(self):
+        from pypoker.asgi import application
+
+        self.addCleanup(history.pending.clear)
+        with loadtest.QueryCounter() as queries:
+            room, cookies = await sync_to_async(loadtest._prepare)(3, 50, 1000)
+            path = f'/ws/room/{room.unique_id}/'
+            clients = [loadtest.WebsocketClient(application, path, cookie) for cookie in cookies]
+            for client in clients:
+                await client.connect()
+                await self.receive_until(client, 'snapshot')
+            for number, client in enumerate(clients, start=1):
+                await client.send({'action': 'sit', 'seat': number, 'stack': 1000})
+                # Ждём свою посадку: в очереди может лежать player_join соседа
+                while (await self.receive_until(client, 'player_join'))['seat'] != number:
+                    pass
+
+            # Раздача началась со вторым игроком; его место консьюмер узнал
+            # из player_join, а не запросом — карты пришли владельцу
+            started = await self.receive_until(clients[1], 'game_start')
+            table = actors[str(room.unique_id)].table
+            self.assertEqual(started['cards'], [card_str(card) for card in table.seats[2].cards])
+
+            before = queries.count
+            for _ in range(2):
+                seat = table.seats[table.current_player]
+                version = table.version
+                client = clients[seat.number - 1]
+                await client.send({'action': 'call' if table.current_bet > seat.current_bet else 'check'})
+                while (await self.receive_until(client, 'update_game'))['version'] <= version:
+                    pass
+            self.assertEqual(queries.count, before)
+
+            # Третий игрок сел посреди раздачи и может уйти сразу
+            await clients[2].send({'action': 'leave'})
+            left = await self.receive_until(clients[2], 'player_leave')
+            self.assertEqual(left['seat'], 3)
+        for client in clients:
+            await client.close()
+
+    async def test_reconnect_receives_missed_events_instead_of_snapshot(self):
+        from pypoker.asgi import application
+
+        self.addCleanup(history.pending.clear)
+        room, cookies = await sync_to_async(loadtest._prepare)(2, 50, 1000)
+        path = f'/ws/room/{room.unique_id}/'
+        first, second = (loadtest.WebsocketClient(application, path, cookie) for cookie in cookies)
+        await first.connect()
+        snapshot = await self.receive_until(first, 'snapshot')
+        await second.connect()
+        await self.receive_until(second, 'snapshot')
+        await first.send({'action': 'sit', 'seat': 1, 'stack': 1000})
+        version = (await self.receive_until(first, 'update_game'))['version']
+        await first.close()
+
+        # Пока первого нет, садится второй и начинается раздача
+        await second.send({'action': 'sit', 'seat': 2, 'stack': 1000})
+        await self.receive_until(second, 'game_start')
+
+        again = loadtest.WebsocketClient(application, f"{path}?session={snapshot['session']}&version={version}",
+                                         cookies[0])
+        await again.connect()
+        self.assertEqual((await again.receive())['action'], 'resumed')
+        self.assertEqual((await again.receive())['seat'], 2)  # player_join второго
+        self.assertEqual((await again.receive())['version'], version + 1)
+        started = await again.receive()
+        self.assertEqual(started['action'], 'game_start')
+        self.assertEqual(len(started['cards']), 2)  # карты своего места
+        await second.close()
+        await again.close()
+
+    @override_settings(POKER_SPECTATOR_RATE=50)
+    async def test_spectator_watches_without_a_session(self):
+        from pypoker.asgi import application
+
+        self.addCleanup(history.pending.clear)
+        room, cookies = await sync_to_async(loadtest._prepare)(2, 50, 1000)
+        spectator = loadtest.WebsocketClient(application, f'/ws/room/{room.unique_id}/watch/', '')
+        await spectator.connect()
+        snapshot = await spectator.receive()
+        self.assertEqual((snapshot['action'], snapshot['state']['players']), ('snapshot', []))
+        # Зритель только смотрит: попытка сесть ничего не меняет
+        await spectator.send({'action': 'sit', 'seat': 1, 'stack': 1000})
+
+        path = f'/ws/room/{room.unique_id}/'
+        clients = [loadtest.WebsocketClient(application, path, cookie) for cookie in cookies]
+        for number, client in enumerate(clients, start=1):
+            await client.connect()
+            await client.send({'action': 'sit', 'seat': number, 'stack': 1000})
+        await self.receive_until(clients[1], 'game_start')
+        table = actors[str(room.unique_id)].table
+        update = await self.receive_until(spectator, 'update_state')
+        while update['version'] != table.version:
+            update = await self.receive_until(spectator, 'update_state')
+        self.assertEqual([player['username'] for player in update['state']['players']],
+                         [f'loadtest{room.pk}_0', f'loadtest{room.pk}_1'])
+        for client in (spectator, *clients):
+            await client.close()
+
+    @override_settings(POKER_WS_RATE=1, POKER_WS_BURST=3, POKER_WS_FLOOD=5)
+    async def test_flooding_client_is_limited_then_closed(self):
+        from pypoker.asgi import application
+
+        self.addCleanup(history.pending.clear)
+        limited = metrics.rate_limited.get()
+        closed = metrics.closed_sockets.get(reason='flood')
+        room, cookies = await sync_to_async(loadtest._prepare)(1, 50, 1000)
+        client = loadtest.WebsocketClient(application, f'/ws/room/{room.unique_id}/', cookies[0])
+        await client.connect()
+        await self.receive_until(client, 'snapshot')
+        for _ in range(3 + 5):
+            await client.send({'action': 'raise', 'amount': 100})
+
+        # Три кадра в пределах лимита дошли до актора (ход не его — ошибки),
+        # на первый лишний — одно предупреждение, на пятый подряд — закрытие
+        errors = [(await client.receive())['message'] for _ in range(4)]
+        self.assertEqual(errors.count('Too many messages!'), 1)
+        self.assertEqual(await client.communicator.receive_output(timeout=5),
+                         {'type': 'websocket.close', 'code': CLOSE_FLOOD})
+        self.assertEqual(metrics.rate_limited.get(), limited + 5)
+        self.assertEqual(metrics.closed_sockets.get(reason='flood'), closed + 1)
+        await client.close()
+
+    async def test_unavailable_table_closes_with_app_code(self):
+        from pypoker.asgi import application
+
+        room, cookies = await sync_to_async(loadtest._prepare)(1, 50, 1000)
+        # Аренду держит процесс, которого нет в кольце: стол не взять и некуда переслать
+        key = sharding.lease_key(str(room.unique_id))
+        await cache.aset(key, 'gone', 60)
+        self.addCleanup(cache.delete, key)
+        for path in (f'/ws/room/{room.unique_id}/', f'/ws/room/{room.unique_id}/watch/'):
+            client = loadtest.WebsocketClient(application, path, cookies[0])
+            await client.connect()
+            self.assertEqual(await client.communicator.receive_output(timeout=5),
+                             {'type': 'websocket.close', 'code': CLOSE_UNAVAILABLE})
+            await client.close()
+
+    async def test_metrics_endpoint_reports_rooms_and_handlers(self):
+        from pypoker.asgi import application
+
+        self.addCleanup(history.pending.clear)
+        sockets = metrics.connected_sockets.get()
+        receive_queries = metrics.handler_queries.get(handler='websocket_receive')
+        sits = metrics.action_seconds.count(command='sit')
+        room, cookies = await sync_to_async(loadtest._prepare)(2, 50, 1000)
+        path = f'/ws/room/{room.unique_id}/'
+        clients = [loadtest.WebsocketClient(application, path, cookie) for cookie in cookies]
+        for number, client in enumerate(clients, start=1):
+            await client.connect()
+            await client.send({'action': 'sit', 'seat': number, 'stack': 1000})
+            await self.receive_until(client, 'update_game')
+
+        response = await self.async_client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn(f'poker_connected_sockets {sockets + 2}', text)
+        self.assertIn('# TYPE poker_action_seconds histogram', text)
+        self.assertIn('poker_broadcast_seconds_count{event="game_start"}', text)
+        self.assertEqual(metrics.action_seconds.count(command='sit'), sits + 2)
+        # Покупка фишек пишет в базу из команды актора — запросы засчитаны обработчику
+        self.assertGreater(metrics.handler_queries.get(handler='websocket_receive'), receive_queries)
+        self.assertGreater(metrics.command_queries.get(command='sit'), 0)
+
+        for client in clients:
+            await client.close()
+        self.assertEqual(metrics.connected_sockets.get(), sockets)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class LoadTestHarnessTests(TestCase):
+    async def test_scripted_hands_report_metrics(self):
+        from pypoker.asgi import application
+
+        self.addCleanup(history.pending.clear)
+        result = await loadtest.run(application, players=3, hands=3)
+        self.assertEqual(result['hands'], 3)
+        self.assertGreater(result['actions'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        # Действия не ходят в базу, запросы бывают только на границах раздач
+        self.assertLess(result['queries_per_action'], 1)
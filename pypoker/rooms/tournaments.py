@@ -0,0 +1,273 @@
+"""
+Турниры на нескольких столах: уровни блайндов, вылеты и балансировка.
+
+Рассадку при старте делает seat_entrants (management-команда
+start_tournament), дальше турнир ведёт Director — задача asyncio в одном
+из процессов ASGI (аренда в кэше, как у столов в rooms.sharding). Раз в
+settings.POKER_TOURNAMENT_TICK секунд директор:
+
+* поднимает блайнды по расписанию (уровень считается от started_at);
+* снимает со столов игроков без фишек и записывает их места;
+* выравнивает столы по plan_balance: лишние столы закрываются, игроки
+  пересаживаются так, чтобы столы различались не больше чем на одного.
+
+Пересадка идёт пачкой: директор снимает игроков со столов-источников
+командами актора, переносит все строки RoomPlayer одним bulk_update в
+одной транзакции и сажает игроков за столы назначения. Игроков текущей
+раздачи не трогаем: стол-источник ставится на паузу (Table.on_hold) и
+отдаёт их на следующем шаге.
+"""
+import asyncio
+import logging
+import random
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import sharding
+
+logger = logging.getLogger(__name__)
+
+
+def lease_key(tournament_id):
+    return f'poker:tournament:{tournament_id}'
+
+
+def big_blind_at(tournament, now):
+    """Большой блайнд уровня, который идёт в момент now."""
+    schedule = tournament.blind_schedule
+    if tournament.started_at is None:
+        return schedule[0]
+    level = int((now - tournament.started_at).total_seconds() // tournament.level_duration)
+    return schedule[min(max(level, 0), len(schedule) - 1)]
+
+
+def plan_balance(counts, table_size):
+    """
+    counts: {стол: игроков}. Возвращает (пересадки [(откуда, куда, сколько)],
+    закрываемые столы). Остаются самые полные столы — ровно столько, сколько
+    нужно на всех игроков; игроков между ними делим поровну, лишнего игрока
+    получают самые полные. Пересадок ровно столько, сколько игроков сверх
+    цели, а время — сортировка столов, а не перебор игроков.
+    """
+    total = sum(counts.values())
+    # При равенстве — по ключу стола, чтобы план не прыгал от шага к шагу
+    ordered = sorted(counts, key=lambda room: (-counts[room], room))
+    needed = -(-total // table_size)
+    kept, broken = ordered[:needed], ordered[needed:]
+    targets = dict.fromkeys(broken, 0)
+    if needed:
+        base, extra = divmod(total, needed)
+        targets.update((room, base + (index < extra)) for index, room in enumerate(kept))
+
+    sources = [[room, counts[room] - targets[room]] for room in ordered if counts[room] > targets[room]]
+    sinks = [[room, targets[room] - counts[room]] for room in ordered if counts[room] < targets[room]]
+    moves = []
+    sink = 0
+    for room, surplus in sources:
+        while surplus:
+            count = min(surplus, sinks[sink][1])
+            moves.append((room, sinks[sink][0], count))
+            surplus -= count
+            sinks[sink][1] -= count
+            if not sinks[sink][1]:
+                sink += 1
+    return moves, broken
+
+
+def seat_entrants(tournament):
+    """Рассаживает зарегистрированных игроков по новым столам и запускает турнир."""
+    Room = apps.get_model('main', 'Room')
+    RoomPlayer = apps.get_model('rooms', 'RoomPlayer')
+
+    with transaction.atomic():
+        user_ids = list(tournament.entries.values_list('user_id', flat=True))
+        if len(user_ids) < 2:
+            raise ValueError('A tournament needs at least two entrants')
+        random.SystemRandom().shuffle(user_ids)
+        count = -(-len(user_ids) // tournament.table_size)
+        rooms = Room.objects.bulk_create(
+            Room(name=f'{tournament.name} #{index + 1}', max_players=tournament.table_size,
+                 big_blind=tournament.blind_schedule[0], is_active=True, tournament=tournament)
+            for index in range(count)
+        )
+        # По кругу: столы получаются одного размера с точностью до игрока
+        RoomPlayer.objects.bulk_create(
+            RoomPlayer(room=rooms[index % count], user_id=user_id, seat_number=index // count + 1,
+                       stack=tournament.starting_stack)
+            for index, user_id in enumerate(user_ids)
+        )
+        tournament.status = tournament.STATUS_RUNNING
+        tournament.started_at = timezone.now()
+        tournament.save(update_fields=['status', 'started_at'])
+    return rooms
+
+
+def apply_changes(tournament, moved, busted, remaining, broken):
+    """
+    Одна транзакция на шаг директора, сколько бы игроков ни пересаживалось:
+    moved — [(player_id, pk стола, место, стек)], busted — [(player_id,
+    user_id)] в порядке вылета, remaining — игроков в игре до вылета.
+    """
+    Room = apps.get_model('main', 'Room')
+    RoomPlayer = apps.get_model('rooms', 'RoomPlayer')
+    TournamentEntry = apps.get_model('main', 'TournamentEntry')
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Сначала вылетевшие: пересаженные могут занять их места
+        if busted:
+            RoomPlayer.objects.filter(pk__in=[player_id for player_id, _ in busted]).delete()
+            entries = {entry.user_id: entry for entry in TournamentEntry.objects.filter(
+                tournament=tournament, user_id__in=[user_id for _, user_id in busted])}
+            for place, (_, user_id) in zip(range(remaining, 0, -1), busted):
+                entries[user_id].place = place
+                entries[user_id].eliminated_at = now
+            TournamentEntry.objects.bulk_update(entries.values(), ['place', 'eliminated_at'])
+        if moved:
+            RoomPlayer.objects.bulk_update(
+                [RoomPlayer(pk=player_id, room_id=room_pk, seat_number=seat_number, stack=stack)
+                 for player_id, room_pk, seat_number, stack in moved],
+                ['room', 'seat_number', 'stack'],
+            )
+        if broken:
+            Room.objects.filter(pk__in=broken).update(is_active=False)
+        if remaining - len(busted) <= 1:
+            winner = RoomPlayer.objects.filter(room__tournament=tournament).values_list('user_id', flat=True).first()
+            TournamentEntry.objects.filter(tournament=tournament, user_id=winner).update(place=1)
+            tournament.status = tournament.STATUS_FINISHED
+            tournament.save(update_fields=['status'])
+
+
+class Director:
+    def __init__(self, tournament_id, worker):
+        self.tournament_id = tournament_id
+        self.worker = worker
+        self.held = set()  # столы на паузе: ждём конца раздачи, чтобы забрать игроков
+
+    async def run(self):
+        interval = getattr(settings, 'POKER_TOURNAMENT_TICK', 5.0)
+        while await self.renew_lease():
+            try:
+                if await self.tick():
+                    # Турнир окончен: аренда больше не нужна
+                    await cache.adelete(lease_key(self.tournament_id))
+                    return
+            except Exception:
+                logger.exception('Tournament %s tick failed', self.tournament_id)
+            await asyncio.sleep(interval)
+
+    async def renew_lease(self):
+        key = lease_key(self.tournament_id)
+        ttl = getattr(settings, 'POKER_LEASE_TTL', 15.0)
+        if await cache.aadd(key, self.worker.worker_id, ttl) or await cache.aget(key) == self.worker.worker_id:
+            await cache.aset(key, self.worker.worker_id, ttl)
+            return True
+        return False
+
+    async def submit_all(self, calls):
+        return await asyncio.gather(*(self.worker.submit(room_id, *args) for room_id, *args in calls))
+
+    async def restore(self, room_ids, removed):
+        seating = {}
+        for user_id, (pk, player_id, stack, seat_number, username) in removed.items():
+            seating.setdefault(pk, []).append([player_id, user_id, username, seat_number, stack])
+        await self.submit_all((room_ids[pk], 'seat_players', players) for pk, players in seating.items())
+
+    async def tick(self):
+        """Один шаг директора. Возвращает True, когда турнир окончен."""
+        Tournament = apps.get_model('main', 'Tournament')
+        Room = apps.get_model('main', 'Room')
+
+        tournament = await Tournament.objects.aget(pk=self.tournament_id)
+        if tournament.status != Tournament.STATUS_RUNNING:
+            return True
+        rooms = {room.pk: room async for room in Room.objects.filter(tournament=tournament, is_active=True)
+                 .only('pk', 'unique_id', 'big_blind')}
+        room_ids = {pk: str(room.unique_id) for pk, room in rooms.items()}
+
+        # Блайнды: одним UPDATE на все столы и командой каждому актору
+        big_blind = big_blind_at(tournament, timezone.now())
+        stale = [pk for pk, room in rooms.items() if room.big_blind != big_blind]
+        if stale:
+            await Room.objects.filter(pk__in=stale).aupdate(big_blind=big_blind)
+            await self.submit_all((room_ids[pk], 'set_blinds', big_blind) for pk in stale)
+
+        states = dict(zip(rooms, await self.submit_all((room_ids[pk], 'seats') for pk in rooms)))
+        remaining = sum(len(state['players']) for state in states.values())
+        # Вылетевшие: фишек нет и в раздаче не участвуют
+        busted = {pk: [player[0] for player in state['players'] if player[2] == 0 and not player[3]]
+                  for pk, state in states.items()}
+        counts = {pk: len(state['players']) - len(busted[pk]) for pk, state in states.items()}
+        moves, broken = plan_balance(counts, tournament.table_size)
+
+        # Кого пересаживать: игроков вне раздачи; не хватает — стол на паузу
+        leaving = {pk: [[user_id, None] for user_id in users] for pk, users in busted.items() if users}
+        arrivals = {}  # pk стола назначения -> user_id по порядку
+        hold = set()
+        movable = {pk: [player[0] for player in states[pk]['players'] if player[2] > 0 and not player[3]]
+                   for pk, _, _ in moves}
+        for source, target, count in moves:
+            chosen = movable[source][:count]
+            del movable[source][:count]
+            if len(chosen) < count:
+                hold.add(source)
+            leaving.setdefault(source, []).extend([user_id, room_ids[target]] for user_id in chosen)
+            arrivals.setdefault(target, []).extend(chosen)
+
+        removed = {}  # user_id -> (pk стола, player_id, стек, место, имя)
+        if leaving:
+            results = await self.submit_all((room_ids[pk], 'unseat', users) for pk, users in leaving.items())
+            for pk, result in zip(leaving, results):
+                for user_id, *player in result:
+                    removed[user_id] = (pk, *player)
+
+        try:
+            # Места назначения: свободные номера по порядку; места снятых
+            # на этом шаге (и вылетевших) уже свободны
+            moved, seating = [], {}
+            for pk, users in arrivals.items():
+                taken = {player[1] for player in states[pk]['players'] if player[0] not in removed}
+                free = (number for number in range(1, tournament.table_size + 1) if number not in taken)
+                for user_id in users:
+                    if user_id in removed:
+                        _, player_id, stack, _, username = removed[user_id]
+                        seat_number = next(free)
+                        moved.append((player_id, pk, seat_number, stack))
+                        seating.setdefault(pk, []).append([player_id, user_id, username, seat_number, stack])
+            gone = [(removed[user_id][1], user_id)
+                    for users in busted.values() for user_id in users if user_id in removed]
+            closed = [pk for pk in broken if all(player[0] in removed for player in states[pk]['players'])]
+
+            await sync_to_async(apply_changes)(tournament, moved, gone, remaining, closed)
+        except Exception:
+            # База не изменилась: снятые игроки возвращаются на свои места
+            await self.restore(room_ids, removed)
+            raise
+        if seating:
+            await self.submit_all((room_ids[pk], 'seat_players', players) for pk, players in seating.items())
+
+        # Пауза нужна только тем столам, откуда ещё не всех забрали
+        changed = [(room_ids[pk], 'hold', pk in hold) for pk in hold ^ self.held]
+        if changed:
+            await self.submit_all(changed)
+        self.held = hold
+        return remaining - len(gone) <= 1
+
+
+_directors = {}  # id турнира -> задача директора в этом процессе
+
+
+async def ensure_director(tournament_id):
+    """Запускает директора турнира, если в этом цикле событий его ещё нет."""
+    task = _directors.get(tournament_id)
+    loop = asyncio.get_running_loop()
+    if task is not None and not task.done() and task.get_loop() is loop:
+        return task
+    worker = await sharding.get_worker()
+    task = _directors[tournament_id] = loop.create_task(Director(tournament_id, worker).run())
+    return task
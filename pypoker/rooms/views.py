@@ -1,5 +1,8 @@
 from django.shortcuts import render, get_object_or_404
 from django.apps import apps
+from django.http import HttpResponse
+
+from . import metrics as room_metrics
 
 Room = apps.get_model('main', 'Room')
 RoomPlayer = apps.get_model('rooms', 'RoomPlayer')
@@ -8,7 +11,10 @@ RoomPlayer = apps.get_model('rooms', 'RoomPlayer')
 
 def room_detail(request, unique_id):
     room = get_object_or_404(Room, unique_id=unique_id)
-    players = RoomPlayer.objects.filter(room=room)
+    # Карта мест одним запросом: имя игрока из JOIN, а не отдельным запросом на место
+    players = RoomPlayer.objects.filter(room=room).select_related('user').only(
+        'seat_number', 'stack', 'role', 'user', 'user__username'
+    )
     seats = range(1, room.max_players + 1)  # Список мест от 1 до max_players
 
     # Формируем имя шаблона на основе количества игроков
@@ -19,3 +25,8 @@ def room_detail(request, unique_id):
         'players': players,
         'seats': seats,
     })
+
+
+def metrics(request):
+    # Текстовый формат Prometheus: curl http://host/metrics
+    return HttpResponse(room_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
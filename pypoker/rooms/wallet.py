@@ -0,0 +1,42 @@
+"""
+Перевод денег между балансом пользователя и местом за столом.
+
+Баланс и фишки — целые копейки (одна фишка — одна копейка), поэтому
+суммы не накапливают ошибку округления. Баланс меняется одним условным
+UPDATE с F()-выражением: списание проходит, только если денег хватает,
+и не зависит от прочитанного раньше значения.
+"""
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F
+
+from .engine import ActionError
+
+
+def buy_in(user_id, room_pk, seat_number, stack, role):
+    """Списывает stack с баланса и создаёт место. Возвращает RoomPlayer."""
+    User = apps.get_model('users', 'CustomUser')
+    RoomPlayer = apps.get_model('rooms', 'RoomPlayer')
+
+    with transaction.atomic():
+        # UPDATE ... SET balance = balance - stack WHERE id = ... AND balance >= stack
+        if not User.objects.filter(pk=user_id, balance__gte=stack).update(balance=F('balance') - stack):
+            raise ActionError('Not enough money on your balance!')
+        # IntegrityError (место заняли) откатывает и списание
+        return RoomPlayer.objects.create(
+            user_id=user_id,
+            room_id=room_pk,
+            seat_number=seat_number,
+            stack=stack,
+            role=role
+        )
+
+
+def cash_out(player_id, user_id, stack):
+    """Возвращает фишки места на баланс и освобождает место."""
+    User = apps.get_model('users', 'CustomUser')
+    RoomPlayer = apps.get_model('rooms', 'RoomPlayer')
+
+    with transaction.atomic():
+        RoomPlayer.objects.filter(pk=player_id).delete()
+        User.objects.filter(pk=user_id).update(balance=F('balance') + stack)
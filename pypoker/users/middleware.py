@@ -0,0 +1,25 @@
+"""
+Аутентификация веб-сокетов без отдельного потока на каждое подключение.
+
+AuthMiddleware из channels читает сессию и пользователя в
+database_sync_to_async; здесь то же делается асинхронным API сессий и
+django.contrib.auth.aget_user.
+"""
+from channels.auth import AuthMiddleware
+from channels.sessions import CookieMiddleware, SessionMiddleware
+from django.contrib.auth import aget_user
+
+
+class _SessionRequest:
+    # aget_user ждёт объект запроса, ему нужна только сессия
+    def __init__(self, session):
+        self.session = session
+
+
+class AsyncAuthMiddleware(AuthMiddleware):
+    async def resolve_scope(self, scope):
+        scope['user']._wrapped = await aget_user(_SessionRequest(scope['session']))
+
+
+def AsyncAuthMiddlewareStack(inner):
+    return CookieMiddleware(SessionMiddleware(AsyncAuthMiddleware(inner)))
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+def to_minor_units(apps, schema_editor):
+    CustomUser = apps.get_model("users", "CustomUser")
+    for user in CustomUser.objects.exclude(balance=0).only("balance"):
+        CustomUser.objects.filter(pk=user.pk).update(balance_minor=int(user.balance * 100))
+
+
+def from_minor_units(apps, schema_editor):
+    CustomUser = apps.get_model("users", "CustomUser")
+    for user in CustomUser.objects.exclude(balance_minor=0).only("balance_minor"):
+        CustomUser.objects.filter(pk=user.pk).update(balance=user.balance_minor / 100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_alter_customuser_groups_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="balance_minor",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(to_minor_units, from_minor_units),
+        migrations.RemoveField(
+            model_name="customuser",
+            name="balance",
+        ),
+        migrations.RenameField(
+            model_name="customuser",
+            old_name="balance_minor",
+            new_name="balance",
+        ),
+    ]
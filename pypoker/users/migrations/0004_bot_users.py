@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_balance_in_minor_units"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="is_bot",
+            field=models.BooleanField(default=False),
+        ),
+    ]
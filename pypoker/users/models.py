@@ -4,7 +4,10 @@ from django.contrib.auth.models import AbstractUser
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # Баланс в копейках; одна фишка за столом — одна копейка баланса
+    balance = models.BigIntegerField(default=0)
+    # Место такого пользователя играет само (rooms.bots)
+    is_bot = models.BooleanField(default=False)
 
     def __str__(self):
         return self.username
@@ -1,3 +1,42 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import path
 
-# Create your tests here.
+from rooms.loadtest import WebsocketClient
+from .middleware import AsyncAuthMiddlewareStack
+
+
+class WhoAmIConsumer(AsyncJsonWebsocketConsumer):
+    async def connect(self):
+        await self.accept()
+        await self.send_json({'user': self.scope['user'].username or None})
+
+
+application = AsyncAuthMiddlewareStack(URLRouter([path('ws/whoami/', WhoAmIConsumer.as_asgi())]))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AsyncAuthMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('alice', 'alice@example.com', 'secret')
+
+    async def who_am_i(self, cookie=''):
+        client = WebsocketClient(application, '/ws/whoami/', cookie)
+        await client.connect()
+        message = await client.receive()
+        await client.close()
+        return message['user']
+
+    async def test_session_cookie_resolves_user(self):
+        client = Client()
+        await sync_to_async(client.force_login)(self.user)
+        cookie = f"sessionid={client.cookies['sessionid'].value}"
+        self.assertEqual(await self.who_am_i(cookie), 'alice')
+
+    async def test_missing_or_stale_session_is_anonymous(self):
+        self.assertIsNone(await self.who_am_i())
+        self.assertIsNone(await self.who_am_i('sessionid=expired'))